@@ -3,8 +3,10 @@ Aplicação principal do Sistema de Gestão CLINED
 Desenvolvido com Flask, SQLAlchemy e SQLite para máxima simplicidade
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
 from datetime import datetime, date
+import click
+import logging
 import os
 
 # Importações dos módulos internos
@@ -24,6 +26,15 @@ from routes.auth import auth_bp
 from routes.medico import medico_bp
 from routes.admin import admin_bp
 from utils.auth_helpers import get_usuario_atual, login_required, admin_required, hash_senha, gerar_token_tv
+from utils.cid_helpers import carregar_catalogo_cid
+from utils.db_helpers import (criar_colunas_faltantes, criar_indices_faltantes, criar_busca_textual,
+                              verificar_banco_pronto)
+from utils.financeiro_helpers import marcar_contas_vencidas, garantir_versao_financeiro
+from utils.compressao_helpers import configurar_compressao
+from utils.assets_helpers import configurar_assets, aquecer_templates, construir_assets, PASTA_VERSIONADA
+from utils.relatorios_helpers import garantir_fato_receitas, reconstruir_fato_receitas
+from utils.pacientes_helpers import (encontrar_duplicados, LIMIAR_PADRAO, garantir_identificadores_normalizados,
+                                     normalizar_identificadores_em_lote, formatar_cpf, formatar_telefone)
 
 def create_app():
     """
@@ -34,6 +45,8 @@ def create_app():
     
     # Aplicar configurações
     app.config.from_object(Config)
+    logging.basicConfig(level=app.config['LOG_LEVEL'],
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     
     # Inicializar extensões
     db.init_app(app)
@@ -51,12 +64,85 @@ def create_app():
     app.register_blueprint(chamados_bp, url_prefix='/chamados')
     app.register_blueprint(metas_bp, url_prefix='/metas')
     
-    # Criar tabelas do banco de dados se não existirem
-    with app.app_context():
-        db.create_all()
+    # Compressão (brotli/gzip) e ETag das APIs JSON; registrado antes dos
+    # demais after_request para ser o último a rodar
+    configurar_compressao(app)
+    
+    # Arquivos estáticos versionados pelo build e templates pré-compilados
+    configurar_assets(app)
+    try:
+        aquecer_templates(app, app.config['JINJA_CACHE_DIR'])
+    except OSError as e:
+        print(f"⚠️  Cache de templates indisponível: {e}")
+    
+    # Esquema e dados iniciais ficam nos comandos init-db e seed, executados uma
+    # vez antes do gunicorn: o worker sobe sem acessar o banco (prontidão em /saude)
+
+    # Índice do catálogo CID-10 em memória (autocompletar e validação dos atestados)
+    try:
+        carregar_catalogo_cid()
+    except OSError as e:
+        print(f"⚠️  Catálogo CID-10 não carregado: {e}")
+    
+    # Rotina diária: flask --app app marcar-vencidas
+    @app.cli.command('marcar-vencidas')
+    def marcar_vencidas_command():
+        """Marca como vencidas as contas pendentes com vencimento passado"""
+        try:
+            resultado = marcar_contas_vencidas()
+        except Exception as e:
+            # Código de saída diferente de zero: o cron registra a execução como falha
+            raise click.ClickException(f'Erro ao marcar contas vencidas: {e}')
+        for tabela, atualizadas in resultado.items():
+            print(f"✅ {tabela}: {atualizadas} conta(s) marcada(s) como vencida(s)")
+    
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Cria as tabelas que faltam e atualiza colunas, índices e a busca textual"""
+        try:
+            inicializar_banco()
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        print("✅ Banco de dados pronto")
+    
+    @app.cli.command('seed')
+    def seed_command():
+        """Cadastra o profissional, o paciente exemplo e os usuários iniciais, se ainda não existirem"""
         criar_dados_iniciais()
         criar_usuarios_iniciais()
     
+    @app.cli.command('construir-assets')
+    def construir_assets_command():
+        """Minifica e versiona os arquivos de static/ (static/dist) e pré-compila os templates"""
+        tamanhos = construir_assets(app.static_folder)
+        for arquivo, (original, final) in sorted(tamanhos.items()):
+            print(f"   {arquivo}: {original} -> {final} bytes")
+        print(f"✅ {len(tamanhos)} arquivo(s) versionado(s) em static/{PASTA_VERSIONADA}")
+        print(f"✅ {aquecer_templates(app, app.config['JINJA_CACHE_DIR'])} template(s) compilado(s)")
+    
+    @app.cli.command('reconstruir-fato-receitas')
+    def reconstruir_fato_receitas_command():
+        """Recria a tabela de relatórios FatoReceita a partir das contas a receber"""
+        total = reconstruir_fato_receitas()
+        print(f"✅ Fato de receitas reconstruído: {total} conta(s)")
+    
+    @app.cli.command('normalizar-identificadores')
+    @click.option('--lote', default=500, show_default=True, help='Pacientes por UPDATE')
+    def normalizar_identificadores_command(lote):
+        """Preenche CPF/telefone só com dígitos e formata os cadastros antigos"""
+        total = normalizar_identificadores_em_lote(lote)
+        print(f"✅ Identificadores normalizados: {total} paciente(s)")
+    
+    @app.cli.command('deduplicar-pacientes')
+    @click.option('--limiar', default=LIMIAR_PADRAO, show_default=True, help='Pontuação mínima (0 a 1)')
+    def deduplicar_pacientes_command(limiar):
+        """Lista cadastros de pacientes provavelmente duplicados (a mesclagem é feita em /admin)"""
+        candidatos = encontrar_duplicados(limiar)
+        for candidato in candidatos:
+            a, b = candidato['paciente_a'], candidato['paciente_b']
+            print(f"{candidato['pontuacao']:.2f}  #{a['id']} {a['nome']}  <->  #{b['id']} {b['nome']}")
+        print(f"✅ {len(candidatos)} par(es) candidato(s)")
+    
     # Tornar configuração e usuário disponíveis nos templates
     @app.context_processor
     def inject_config():
@@ -64,6 +150,20 @@ def create_app():
     
     return app
 
+def inicializar_banco():
+    """
+    Cria as tabelas que faltam e mantém o esquema em dia (colunas, índices,
+    busca textual e tabelas derivadas). Roda no comando init-db, antes dos
+    workers subirem, e não a cada importação da aplicação.
+    """
+    db.create_all()
+    criar_colunas_faltantes()
+    criar_indices_faltantes()
+    criar_busca_textual()
+    garantir_fato_receitas()
+    garantir_versao_financeiro()
+    garantir_identificadores_normalizados()
+
 def criar_dados_iniciais():
     """
     Cria dados iniciais para facilitar o uso do sistema
@@ -227,6 +327,17 @@ def index():
                              atendimentos=0,
                              finalizados=0)
 
+@app.route('/saude')
+def saude():
+    """
+    Verificação de prontidão para o Render (sem login)
+    Responde 503 enquanto o banco não estiver acessível ou sem o init-db
+    """
+    pronto, motivo = verificar_banco_pronto()
+    if not pronto:
+        return jsonify({'status': 'indisponivel', 'motivo': motivo}), 503
+    return jsonify({'status': 'ok'})
+
 @app.errorhandler(404)
 def not_found_error(error):
     """
@@ -268,31 +379,23 @@ def date_filter(date_obj, format='%d/%m/%Y'):
 def cpf_filter(cpf_string):
     """
     Filtro para formatação de CPF nos templates
-    Uso: {{ paciente.cpf|cpf }}
+    Pacientes já gravam o CPF formatado; o filtro serve a valores avulsos
+    Uso: {{ valor|cpf }}
     """
     if not cpf_string:
         return ""
-    # Remove caracteres não numéricos
-    numbers = ''.join(filter(str.isdigit, cpf_string))
-    if len(numbers) == 11:
-        return f"{numbers[:3]}.{numbers[3:6]}.{numbers[6:9]}-{numbers[9:]}"
-    return cpf_string
+    return formatar_cpf(cpf_string)
 
 @app.template_filter('telefone')
 def telefone_filter(telefone_string):
     """
     Filtro para formatação de telefone nos templates
-    Uso: {{ paciente.telefone|telefone }}
+    Pacientes já gravam o telefone formatado; o filtro serve a valores avulsos
+    Uso: {{ valor|telefone }}
     """
     if not telefone_string:
         return ""
-    # Remove caracteres não numéricos
-    numbers = ''.join(filter(str.isdigit, telefone_string))
-    if len(numbers) == 11:
-        return f"({numbers[:2]}) {numbers[2:7]}-{numbers[7:]}"
-    elif len(numbers) == 10:
-        return f"({numbers[:2]}) {numbers[2:6]}-{numbers[6:]}"
-    return telefone_string
+    return formatar_telefone(telefone_string)
 
 if __name__ == '__main__':
     """
@@ -305,6 +408,12 @@ if __name__ == '__main__':
     print("📚 Documentação: README.md")
     print("-" * 60)
     
+    # Em desenvolvimento o banco é preparado aqui (em produção: init-db e seed)
+    with app.app_context():
+        inicializar_banco()
+        criar_dados_iniciais()
+        criar_usuarios_iniciais()
+    
     # Executar aplicação Flask
     app.run(
         debug=Config.DEBUG,
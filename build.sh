@@ -4,4 +4,7 @@ set -o errexit
 pip install --upgrade pip
 pip install -r requirements.txt
 
+# CSS/JS minificados e versionados em static/dist
+flask --app app construir-assets
+
 echo "Build completed successfully!"
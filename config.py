@@ -24,6 +24,9 @@ class Config:
     # Configurações da aplicação
     DEBUG = os.environ.get('DEBUG', 'True').lower() == 'true'
 
+    # Nível de log dos módulos (DEBUG, INFO, WARNING...)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING').upper()
+
     # Nome da clínica
     CLINIC_NAME = "CLINED - Um novo conceito em saúde"
 
@@ -39,6 +42,32 @@ class Config:
     HORARIO_ABERTURA = "08:00"
     HORARIO_FECHAMENTO = "20:00"
 
+    # Grade de agendamento (minutos por horário) e dias de funcionamento (0 = segunda ... 6 = domingo)
+    INTERVALO_AGENDA_MINUTOS = 30
+    DIAS_FUNCIONAMENTO = [0, 1, 2, 3, 4, 5]
+
+    # PDFs dos documentos: pasta do cache (um arquivo por versão do documento) e processos de renderização
+    PDF_CACHE_DIR = os.environ.get(
+        'PDF_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'documentos_pdf')
+    )
+    PDF_PROCESSOS = int(os.environ.get('PDF_PROCESSOS', 2))
+
+    # Respostas HTML/JSON menores que isso (bytes) não são comprimidas
+    COMPRESSAO_TAMANHO_MINIMO = int(os.environ.get('COMPRESSAO_TAMANHO_MINIMO', 1024))
+
+    # Bytecode dos templates Jinja compilados (preenchido no build e na inicialização)
+    JINJA_CACHE_DIR = os.environ.get(
+        'JINJA_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'jinja_cache')
+    )
+
+    # Numeração dos recibos: quantidade de números reservada por processo a cada ida ao banco
+    NUMERACAO_TAMANHO_BLOCO = int(os.environ.get('NUMERACAO_TAMANHO_BLOCO', 20))
+
+    # Catálogo CID-10 (codigo;descricao). Aceita também o CSV de subcategorias do DATASUS
+    CID10_ARQUIVO = os.environ.get(
+        'CID10_ARQUIVO', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'cid10.csv')
+    )
+
     # Serviços disponíveis
     SERVICOS_DISPONIVEIS = [
         'Consulta Médica',
@@ -19,6 +19,9 @@ class Paciente(db.Model):
     nome = db.Column(db.String(100), nullable=False)
     cpf = db.Column(db.String(14), unique=True, nullable=True)
     telefone = db.Column(db.String(20), nullable=False)
+    # Apenas dígitos, preenchidos na gravação; usados nas buscas
+    cpf_digitos = db.Column(db.String(11), index=True)
+    telefone_digitos = db.Column(db.String(15), index=True)
     email = db.Column(db.String(100))
     data_nascimento = db.Column(db.Date)
     idade = db.Column(db.Integer)
@@ -72,6 +75,50 @@ class Agendamento(db.Model):
     # Status possíveis: agendado, em_espera, em_atendimento, finalizado, faltou
     data_checkin = db.Column(db.DateTime)
     data_criacao = db.Column(db.DateTime, default=datetime.now)
+    serie_id = db.Column(db.Integer, db.ForeignKey('series_agendamento.id'), index=True)
+
+    # Um horário por serviço; faltas liberam o horário para encaixe. Não existe status
+    # 'cancelado': o cancelamento exclui o agendamento, o que também libera o horário
+    __table_args__ = (
+        db.Index('ux_agendamentos_horario_servico', 'data_agendamento', 'servico', unique=True,
+                 sqlite_where=db.text("status <> 'faltou'"),
+                 postgresql_where=db.text("status <> 'faltou'")),
+    )
+
+class SerieAgendamento(db.Model):
+    """
+    Série de agendamentos recorrentes (ex.: Holter, acompanhamentos)
+    """
+    __tablename__ = 'series_agendamento'
+
+    id = db.Column(db.Integer, primary_key=True)
+    paciente_id = db.Column(db.Integer, db.ForeignKey('pacientes.id'), nullable=False)
+    servico = db.Column(db.String(100), nullable=False)
+    frequencia = db.Column(db.String(20), nullable=False)  # semanal, quinzenal, mensal
+    ocorrencias = db.Column(db.Integer, nullable=False)
+    data_inicio = db.Column(db.DateTime, nullable=False)
+    data_criacao = db.Column(db.DateTime, default=datetime.now)
+
+    # Relacionamentos
+    agendamentos = db.relationship('Agendamento', backref='serie_ref', lazy=True)
+
+class TransicaoStatusAgendamento(db.Model):
+    """
+    Histórico (somente inclusão) das mudanças de status de um agendamento
+    """
+    __tablename__ = 'transicoes_status_agendamento'
+
+    id = db.Column(db.Integer, primary_key=True)
+    agendamento_id = db.Column(db.Integer, db.ForeignKey('agendamentos.id', ondelete='CASCADE'), nullable=False)
+    status_anterior = db.Column(db.String(20))
+    status_novo = db.Column(db.String(20), nullable=False)
+    data_transicao = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+
+    __table_args__ = (
+        db.Index('ix_transicoes_agendamento_status', 'agendamento_id', 'status_novo', 'data_transicao'),
+        db.Index('ix_transicoes_status_data', 'status_novo', 'data_transicao', 'agendamento_id'),
+    )
 
 class Prontuario(db.Model):
     """
@@ -99,6 +146,9 @@ class Prontuario(db.Model):
     # Relacionamentos
     historico = db.relationship('AtendimentoHistorico', backref='prontuario_ref', lazy=True)
 
+    # Índice dos atendimentos do paciente, do mais recente para o mais antigo
+    __table_args__ = (db.Index('ix_prontuarios_paciente_data', 'paciente_id', 'data_atendimento'),)
+
 class AtendimentoHistorico(db.Model):
     """
     Modelo para histórico de atendimentos
@@ -197,9 +247,46 @@ class Recibo(db.Model):
     forma_pagamento = db.Column(db.String(50))
     data_emissao = db.Column(db.DateTime, default=datetime.now)
     numero_recibo = db.Column(db.String(20), unique=True)
+    # Reemissão: o recibo anterior é mantido (com o número) e marcado como substituído
+    substitui_id = db.Column(db.Integer, db.ForeignKey('recibos.id'))
+    substituido_em = db.Column(db.DateTime)
 
     paciente_recibo = db.relationship('Paciente', backref='recibos')
     agendamento_recibo = db.relationship('Agendamento', backref='recibo', uselist=False)
+    recibo_substituido = db.relationship('Recibo', remote_side=[id])
+
+    # Um recibo vigente por agendamento (substituídos e avulsos não entram na restrição)
+    __table_args__ = (
+        db.Index('ux_recibos_agendamento_vigente', 'agendamento_id', unique=True,
+                 sqlite_where=db.text('substituido_em IS NULL'),
+                 postgresql_where=db.text('substituido_em IS NULL')),
+    )
+
+class SequenciaDocumento(db.Model):
+    """
+    Próximo número livre de cada numeração de documentos (ex.: recibos)
+    Os processos reservam blocos de números (ver utils/numeracao_helpers.py)
+    """
+    __tablename__ = 'sequencias_documento'
+
+    nome = db.Column(db.String(30), primary_key=True)
+    proximo = db.Column(db.Integer, nullable=False, default=1)
+
+class BlocoNumeracao(db.Model):
+    """
+    Registro (somente inclusão) dos blocos de números reservados por processo
+    Permite auditar as lacunas da numeração
+    """
+    __tablename__ = 'blocos_numeracao'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sequencia = db.Column(db.String(30), nullable=False)
+    inicio = db.Column(db.Integer, nullable=False)
+    fim = db.Column(db.Integer, nullable=False)  # inclusive
+    processo = db.Column(db.String(100))  # host:pid
+    data_alocacao = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    __table_args__ = (db.Index('ix_blocos_numeracao_sequencia_inicio', 'sequencia', 'inicio'),)
 
 # ========== MÓDULO 3 - FINANCEIRO ==========
 
@@ -225,6 +312,13 @@ class ContaReceber(db.Model):
     paciente_conta = db.relationship('Paciente', backref='contas_receber')
     agendamento_conta = db.relationship('Agendamento', backref='conta_receber')
 
+    # Índice parcial sobre as contas em aberto (pendentes e vencidas)
+    __table_args__ = (
+        db.Index('ix_contas_receber_abertas', 'status', 'data_vencimento',
+                 sqlite_where=db.text("status IN ('pendente', 'vencido')"),
+                 postgresql_where=db.text("status IN ('pendente', 'vencido')")),
+    )
+
 class ContaPagar(db.Model):
     """
     Modelo para contas a pagar
@@ -244,6 +338,13 @@ class ContaPagar(db.Model):
     observacoes = db.Column(db.Text)
     data_criacao = db.Column(db.DateTime, default=datetime.now)
 
+    # Índice parcial sobre as contas em aberto (pendentes e vencidas)
+    __table_args__ = (
+        db.Index('ix_contas_pagar_abertas', 'status', 'data_vencimento',
+                 sqlite_where=db.text("status IN ('pendente', 'vencido')"),
+                 postgresql_where=db.text("status IN ('pendente', 'vencido')")),
+    )
+
 class FluxoCaixa(db.Model):
     """
     Modelo para controle de fluxo de caixa
@@ -262,6 +363,17 @@ class FluxoCaixa(db.Model):
     recepcionista = db.Column(db.String(100))
     data_criacao = db.Column(db.DateTime, default=datetime.now)
 
+class VersaoDados(db.Model):
+    """
+    Contador de versão de um conjunto de dados (ex.: 'financeiro'), incrementado
+    na mesma transação de cada gravação. Os caches em memória de cada worker
+    comparam a versão para saber se ainda valem (ver utils/financeiro_helpers.py)
+    """
+    __tablename__ = 'versoes_dados'
+
+    nome = db.Column(db.String(30), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
 class MetaEmpresa(db.Model):
     """
     Modelo para metas da empresa (faturamento, atendimentos, novos clientes)
@@ -301,6 +413,50 @@ class AvaliacaoSatisfacao(db.Model):
     agendamento_avaliacao = db.relationship('Agendamento', backref='avaliacao')
     profissional_avaliacao = db.relationship('Profissional', backref='avaliacoes')
 
+class FatoReceita(db.Model):
+    """
+    Tabela desnormalizada para relatórios de faturamento
+    Uma linha por conta a receber, mantida em sincronia na gravação
+    (ver utils/relatorios_helpers.py)
+    """
+    __tablename__ = 'fato_receitas'
+
+    id = db.Column(db.Integer, primary_key=True)
+    conta_receber_id = db.Column(db.Integer, db.ForeignKey('contas_receber.id', ondelete='CASCADE'),
+                                 unique=True, nullable=False)
+    paciente_id = db.Column(db.Integer, db.ForeignKey('pacientes.id'), nullable=False)
+    agendamento_id = db.Column(db.Integer, db.ForeignKey('agendamentos.id'))
+    profissional_id = db.Column(db.Integer, db.ForeignKey('profissionais.id'))
+    especialidade = db.Column(db.String(50))
+    servico = db.Column(db.String(100))
+    dia = db.Column(db.Date, nullable=False)  # data de criação da conta
+    valor = db.Column(db.Numeric(10, 2), nullable=False)
+
+    # Índices de cobertura para os agrupamentos dos relatórios
+    __table_args__ = (
+        db.Index('ix_fato_receitas_dia_profissional', 'dia', 'profissional_id', 'valor'),
+        db.Index('ix_fato_receitas_dia_especialidade', 'dia', 'especialidade', 'valor'),
+    )
+
+class ResumoSemanalServico(db.Model):
+    """
+    Consolidado semanal por serviço (agendamentos, ocupação da grade e receita)
+    Gravado apenas para semanas já encerradas, que não são mais recalculadas
+    """
+    __tablename__ = 'resumo_semanal_servicos'
+
+    id = db.Column(db.Integer, primary_key=True)
+    semana = db.Column(db.Date, nullable=False)  # segunda-feira da semana
+    servico = db.Column(db.String(100), nullable=False)
+    agendamentos = db.Column(db.Integer, default=0)
+    finalizados = db.Column(db.Integer, default=0)
+    faltas = db.Column(db.Integer, default=0)
+    horarios_disponiveis = db.Column(db.Integer, default=0)
+    receita = db.Column(db.Numeric(12, 2), default=0)
+    data_calculo = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (db.UniqueConstraint('semana', 'servico', name='unique_semana_servico'),)
+
 class LogAuditoria(db.Model):
     """
     Modelo para log de auditoria interna
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from models.models import db, Usuario, LogAcesso, Profissional
 from utils.auth_helpers import admin_required, get_usuario_atual, hash_senha, gerar_token_tv
+from utils.pacientes_helpers import encontrar_duplicados, mesclar_pacientes, LIMIAR_PADRAO
 from datetime import datetime
 import json
 
@@ -193,6 +194,45 @@ def logs_acesso():
         flash(f'Erro ao carregar logs: {str(e)}', 'error')
         return render_template('admin/logs.html', usuario=usuario, logs=[])
 
+@admin_bp.route('/pacientes-duplicados')
+@admin_required
+def pacientes_duplicados():
+    usuario = get_usuario_atual()
+
+    try:
+        limiar = float(request.args.get('limiar', LIMIAR_PADRAO))
+    except ValueError:
+        limiar = LIMIAR_PADRAO
+
+    try:
+        candidatos = encontrar_duplicados(limiar)[:200]
+    except Exception as e:
+        flash(f'Erro ao buscar duplicados: {str(e)}', 'error')
+        candidatos = []
+
+    return render_template('admin/pacientes_duplicados.html',
+                         usuario=usuario,
+                         candidatos=candidatos,
+                         limiar=limiar)
+
+@admin_bp.route('/pacientes-duplicados/mesclar', methods=['POST'])
+@admin_required
+def mesclar_pacientes_duplicados():
+    usuario = get_usuario_atual()
+
+    try:
+        manter_id = int(request.form.get('manter_id', 0))
+        remover_id = int(request.form.get('remover_id', 0))
+
+        movidos = mesclar_pacientes(manter_id, [remover_id], usuario.email)
+        flash(f'Cadastros mesclados. {sum(movidos.values())} registro(s) transferido(s).', 'success')
+    except ValueError as e:
+        flash(str(e), 'error')
+    except Exception as e:
+        flash(f'Erro ao mesclar cadastros: {str(e)}', 'error')
+
+    return redirect(url_for('admin.pacientes_duplicados', limiar=request.form.get('limiar', LIMIAR_PADRAO)))
+
 @admin_bp.route('/token-tv')
 @admin_required
 def token_tv():
@@ -3,11 +3,15 @@ Rotas do Módulo 1 - Agendamento e Atendimento
 Gerencia todas as funcionalidades relacionadas a agendamentos
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from models.models import db, Agendamento, Paciente, Profissional, SolicitacaoExame
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
+from models.models import (db, Agendamento, Paciente, Profissional, SolicitacaoExame, SerieAgendamento,
+                           TransicaoStatusAgendamento)
 from config import Config
 from datetime import datetime
 from utils.auth_helpers import login_required, agendamento_required
+from utils.agendamento_helpers import (alterar_status, operar_agenda_em_lote, criar_serie_agendamentos,
+                                      agendar_paciente)
+from utils.pacientes_helpers import somente_digitos
 
 # Criação do Blueprint para agendamentos
 agendamento_bp = Blueprint('agendamento', __name__)
@@ -40,9 +44,11 @@ def horarios_disponiveis():
             horarios_possiveis.append(f"{hora:02d}:{minuto:02d}")
 
     # Buscar agendamentos existentes para a data E serviço específico
+    # (faltas liberam o horário, como no índice único da agenda)
     agendamentos_dia = Agendamento.query.filter(
         db.func.date(Agendamento.data_agendamento) == data_selecionada,
-        Agendamento.servico == servico
+        Agendamento.servico == servico,
+        Agendamento.status != 'faltou'
     ).all()
 
     # Marcar horários ocupados (apenas para o serviço específico)
@@ -72,13 +78,13 @@ def buscar_paciente():
     if len(termo) < 3:
         return jsonify({'pacientes': []})
 
-    # Buscar por nome ou CPF
-    pacientes = Paciente.query.filter(
-        db.or_(
-            Paciente.nome.ilike(f'%{termo}%'),
-            Paciente.cpf.ilike(f'%{termo}%')
-        )
-    ).limit(10).all()
+    # Buscar por nome ou CPF (CPF pelos dígitos, em qualquer formatação)
+    filtros = [Paciente.nome.ilike(f'%{termo}%')]
+    digitos = somente_digitos(termo)
+    if len(digitos) >= 3:
+        filtros.append(Paciente.cpf_digitos.startswith(digitos))
+
+    pacientes = Paciente.query.filter(db.or_(*filtros)).limit(10).all()
 
     resultado = []
     for p in pacientes:
@@ -103,158 +109,38 @@ def agendar():
     if request.method == 'POST':
         try:
             # Coleta dados do formulário com TRIM
-            nome_paciente = request.form['nome_paciente'].strip()
-            cpf_paciente = request.form.get('cpf_paciente', '').strip()
-            telefone = request.form['telefone'].strip()
-            email = request.form.get('email', '').strip()
             data_agendamento = datetime.strptime(request.form['data_agendamento'], '%Y-%m-%dT%H:%M')
             servico = request.form['servico'].strip()
             observacoes = request.form.get('observacoes', '').strip()
 
-            print("\n" + "="*60)
-            print("📋 NOVO CADASTRO/AGENDAMENTO")
-            print("="*60)
-            print(f"Nome: {nome_paciente}")
-            print(f"CPF: {cpf_paciente if cpf_paciente else '(não informado)'}")
-            print(f"Telefone: {telefone}")
-            print(f"Email: {email if email else '(não informado)'}")
-
-            # Validação: verificar se já existe agendamento para o mesmo serviço no mesmo horário
-            agendamento_existente = Agendamento.query.filter(
-                Agendamento.data_agendamento == data_agendamento,
-                Agendamento.servico == servico
-            ).first()
-
-            if agendamento_existente:
-                flash(f'Já existe um agendamento de {servico} para este horário!', 'error')
-                return redirect(url_for('agendamento.agendar'))
-
-            # Buscar o Dr. Darlan Medeiros (único profissional)
-            dr_darlan = Profissional.query.filter_by(ativo=True).first()
-            if not dr_darlan:
-                flash('Erro: Profissional não encontrado no sistema!', 'error')
-                return redirect(url_for('agendamento.agendar'))
-
-            # Coletar dados adicionais do paciente
             data_nascimento_str = request.form.get('data_nascimento', '').strip()
-            data_nascimento = datetime.strptime(data_nascimento_str, '%Y-%m-%d').date() if data_nascimento_str else None
-            idade = int(request.form.get('idade', 0)) if request.form.get('idade') else None
-            naturalidade = request.form.get('naturalidade', '').strip()
-            estado_civil = request.form.get('estado_civil', '').strip()
-            religiao = request.form.get('religiao', '').strip()
-            profissao = request.form.get('profissao', '').strip()
-            filiacao_mae = request.form.get('filiacao_mae', '').strip()
-            filiacao_pai = request.form.get('filiacao_pai', '').strip()
-            endereco = request.form.get('endereco', '').strip()
-            bairro = request.form.get('bairro', '').strip()
-            cidade = request.form.get('cidade', '').strip()
-
-            # Mostrar todos os pacientes existentes no banco PARA DEBUG
-            total_pacientes = Paciente.query.count()
-            print(f"\n📊 Total de pacientes no banco ANTES: {total_pacientes}")
-            if total_pacientes > 0 and total_pacientes <= 10:
-                print("\n👥 Lista de pacientes existentes:")
-                todos = Paciente.query.all()
-                for p in todos:
-                    print(f"   ID={p.id}, Nome={p.nome}, CPF={p.cpf or '(sem CPF)'}, Tel={p.telefone}")
-
-            # Verifica se o paciente já existe
-            # IMPORTANTE: Busca inteligente para evitar duplicatas
-            paciente = None
-
-            if cpf_paciente and cpf_paciente.strip():
-                # Se CPF foi fornecido, busca por CPF
-                paciente = Paciente.query.filter_by(cpf=cpf_paciente).first()
-                print(f"\n🔍 Buscando por CPF: {cpf_paciente}")
-                print(f"   Resultado: {'ENCONTRADO ID=' + str(paciente.id) if paciente else 'NÃO ENCONTRADO - CRIANDO NOVO'}")
-            else:
-                # Se CPF NÃO foi fornecido, busca por Nome + Telefone
-                paciente = Paciente.query.filter_by(
-                    nome=nome_paciente,
-                    telefone=telefone
-                ).first()
-                print(f"\n🔍 Buscando por Nome+Telefone: {nome_paciente} / {telefone}")
-                print(f"   Resultado: {'ENCONTRADO ID=' + str(paciente.id) if paciente else 'NÃO ENCONTRADO - CRIANDO NOVO'}")
-
-            if not paciente:
-                # CRIAR NOVO PACIENTE
-                print(f"\n➕ CRIANDO NOVO PACIENTE")
-                paciente = Paciente(
-                    nome=nome_paciente,
-                    cpf=cpf_paciente if cpf_paciente and cpf_paciente.strip() else None,
-                    telefone=telefone,
-                    email=email,
-                    data_nascimento=data_nascimento,
-                    idade=idade,
-                    naturalidade=naturalidade,
-                    estado_civil=estado_civil,
-                    religiao=religiao,
-                    profissao=profissao,
-                    filiacao_mae=filiacao_mae,
-                    filiacao_pai=filiacao_pai,
-                    endereco=endereco,
-                    bairro=bairro,
-                    cidade=cidade
-                )
-                db.session.add(paciente)
-                db.session.flush()
-                print(f"✅ NOVO PACIENTE CRIADO: ID={paciente.id}, Nome={paciente.nome}, CPF={paciente.cpf or '(sem CPF)'}")
-            else:
-                # ATUALIZAR PACIENTE EXISTENTE
-                print(f"\n✏️  ATUALIZANDO PACIENTE EXISTENTE: ID={paciente.id}")
-                print(f"   Nome antigo: {paciente.nome} → Novo: {nome_paciente}")
-                paciente.nome = nome_paciente
-                paciente.telefone = telefone
-                if email:
-                    paciente.email = email
-                if data_nascimento:
-                    paciente.data_nascimento = data_nascimento
-                if idade is not None:
-                    paciente.idade = idade
-                if naturalidade:
-                    paciente.naturalidade = naturalidade
-                if estado_civil:
-                    paciente.estado_civil = estado_civil
-                if religiao:
-                    paciente.religiao = religiao
-                if profissao:
-                    paciente.profissao = profissao
-                if filiacao_mae:
-                    paciente.filiacao_mae = filiacao_mae
-                if filiacao_pai:
-                    paciente.filiacao_pai = filiacao_pai
-                if endereco:
-                    paciente.endereco = endereco
-                if bairro:
-                    paciente.bairro = bairro
-                if cidade:
-                    paciente.cidade = cidade
-
-            # Cria o novo agendamento
-            novo_agendamento = Agendamento(
-                paciente_id=paciente.id,
-                profissional_id=dr_darlan.id,
-                data_agendamento=data_agendamento,
-                servico=servico,
-                observacoes=observacoes
-            )
-
-            db.session.add(novo_agendamento)
-            db.session.commit()
-
-            # Mostrar estado final do banco
-            total_pacientes_depois = Paciente.query.count()
-            print(f"\n📊 Total de pacientes no banco DEPOIS: {total_pacientes_depois}")
-            if total_pacientes_depois <= 10:
-                print("\n👥 Lista FINAL de pacientes:")
-                todos = Paciente.query.all()
-                for p in todos:
-                    print(f"   ID={p.id}, Nome={p.nome}, CPF={p.cpf or '(sem CPF)'}, Tel={p.telefone}")
-            print("="*60 + "\n")
+            dados_paciente = {
+                'nome': request.form['nome_paciente'].strip(),
+                'cpf': request.form.get('cpf_paciente', '').strip(),
+                'telefone': request.form['telefone'].strip(),
+                'email': request.form.get('email', '').strip(),
+                'data_nascimento': datetime.strptime(data_nascimento_str, '%Y-%m-%d').date() if data_nascimento_str else None,
+                'idade': int(request.form.get('idade', 0)) if request.form.get('idade') else None,
+                'naturalidade': request.form.get('naturalidade', '').strip(),
+                'estado_civil': request.form.get('estado_civil', '').strip(),
+                'religiao': request.form.get('religiao', '').strip(),
+                'profissao': request.form.get('profissao', '').strip(),
+                'filiacao_mae': request.form.get('filiacao_mae', '').strip(),
+                'filiacao_pai': request.form.get('filiacao_pai', '').strip(),
+                'endereco': request.form.get('endereco', '').strip(),
+                'bairro': request.form.get('bairro', '').strip(),
+                'cidade': request.form.get('cidade', '').strip()
+            }
+
+            agendar_paciente(dados_paciente, data_agendamento, servico, observacoes)
 
             flash('Agendamento realizado com sucesso!', 'success')
             return redirect(url_for('agendamento.lista_agendamentos'))
 
+        except ValueError as e:
+            flash(str(e), 'error')
+            db.session.rollback()
+            return redirect(url_for('agendamento.agendar'))
         except Exception as e:
             flash(f'Erro ao realizar agendamento: {str(e)}', 'error')
             db.session.rollback()
@@ -329,8 +215,7 @@ def checkin(agendamento_id):
     """
     try:
         agendamento = Agendamento.query.get_or_404(agendamento_id)
-        agendamento.status = 'em_espera'
-        agendamento.data_checkin = datetime.now()
+        alterar_status(agendamento, 'em_espera', session.get('usuario_id'))
         
         db.session.commit()
         flash('Check-in realizado com sucesso!', 'success')
@@ -350,7 +235,7 @@ def atualizar_status(agendamento_id, status):
     """
     try:
         agendamento = Agendamento.query.get_or_404(agendamento_id)
-        agendamento.status = status
+        alterar_status(agendamento, status, session.get('usuario_id'))
 
         db.session.commit()
         flash(f'Status atualizado para: {status}', 'success')
@@ -361,13 +246,127 @@ def atualizar_status(agendamento_id, status):
 
     return redirect(url_for('agendamento.fila_espera'))
 
+def _ler_booleano(valor) -> bool:
+    """Campo booleano de formulário ou JSON: true/1/on (strings ou valores JSON)"""
+    return str(valor if valor is not None else '').lower() in ('1', 'true', 'on')
+
+def _ler_operacao_em_lote(dados):
+    """Converte os campos do formulário/JSON da operação em lote"""
+    data_destino = dados.get('data_destino') or None
+    return {
+        'acao': dados.get('acao', ''),
+        'data_origem': datetime.strptime(dados.get('data_origem', ''), '%Y-%m-%d').date(),
+        'hora_inicio': datetime.strptime(dados.get('hora_inicio') or '00:00', '%H:%M').time(),
+        'hora_fim': datetime.strptime(dados.get('hora_fim') or '23:59', '%H:%M').time(),
+        'servico': (dados.get('servico') or '').strip() or None,
+        'data_destino': datetime.strptime(data_destino, '%Y-%m-%d').date() if data_destino else None,
+        'simular': _ler_booleano(dados.get('simular'))
+    }
+
+@agendamento_bp.route('/agenda-em-lote', methods=['GET', 'POST'])
+@agendamento_required
+def agenda_em_lote():
+    """
+    Rota para remarcar ou cancelar de uma vez os agendamentos de um período
+    (ex.: ausência do médico). Mostra o relatório de conflitos ao final.
+    """
+    relatorio = None
+    
+    if request.method == 'POST':
+        try:
+            relatorio = operar_agenda_em_lote(**_ler_operacao_em_lote(request.form))
+            
+            if relatorio['simulacao']:
+                flash('Simulação concluída. Nenhum agendamento foi alterado.', 'info')
+            else:
+                flash(f"{len(relatorio['processados'])} agendamento(s) processado(s), "
+                      f"{len(relatorio['conflitos'])} conflito(s).", 'success')
+        except ValueError as e:
+            flash(f'Dados inválidos: {str(e)}', 'error')
+        except Exception as e:
+            flash(f'Erro na operação em lote: {str(e)}', 'error')
+            db.session.rollback()
+    
+    return render_template('agendamento/agenda_em_lote.html',
+                         servicos=Config.SERVICOS_DISPONIVEIS,
+                         relatorio=relatorio,
+                         dados=request.form if request.method == 'POST' else request.args)
+
+@agendamento_bp.route('/api/agenda-em-lote', methods=['POST'])
+@agendamento_required
+def api_agenda_em_lote():
+    """
+    API da operação em lote: recebe acao, data_origem, hora_inicio, hora_fim,
+    servico, data_destino e simular; retorna o relatório de conflitos
+    """
+    try:
+        return jsonify(operar_agenda_em_lote(**_ler_operacao_em_lote(request.get_json(silent=True) or {})))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@agendamento_bp.route('/api/serie', methods=['POST'])
+@agendamento_required
+def api_criar_serie():
+    """
+    API para agendamentos recorrentes (Holter, terapias, retornos)
+    Recebe paciente_id, servico, data_agendamento (YYYY-MM-DDTHH:MM),
+    frequencia (semanal, quinzenal, mensal), ocorrencias, observacoes e simular
+    """
+    dados = request.get_json(silent=True) or {}
+    
+    try:
+        servico = (dados.get('servico') or '').strip()
+        if servico not in Config.SERVICOS_DISPONIVEIS:
+            return jsonify({'error': 'Serviço inválido'}), 400
+        
+        resultado = criar_serie_agendamentos(
+            paciente_id=int(dados.get('paciente_id') or 0),
+            servico=servico,
+            inicio=datetime.strptime(dados.get('data_agendamento', ''), '%Y-%m-%dT%H:%M'),
+            frequencia=dados.get('frequencia', ''),
+            ocorrencias=int(dados.get('ocorrencias') or 0),
+            observacoes=(dados.get('observacoes') or '').strip(),
+            simular=_ler_booleano(dados.get('simular'))
+        )
+        return jsonify(resultado), 201 if resultado['serie_id'] else 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@agendamento_bp.route('/api/serie/<int:serie_id>')
+@agendamento_required
+def api_serie(serie_id):
+    """
+    API com as ocorrências de uma série de agendamentos
+    """
+    serie = SerieAgendamento.query.get_or_404(serie_id)
+    ocorrencias = Agendamento.query.filter_by(serie_id=serie.id).order_by(Agendamento.data_agendamento).all()
+    
+    return jsonify({
+        'id': serie.id,
+        'paciente_id': serie.paciente_id,
+        'servico': serie.servico,
+        'frequencia': serie.frequencia,
+        'ocorrencias': [{
+            'id': a.id,
+            'data_agendamento': a.data_agendamento.strftime('%Y-%m-%d %H:%M'),
+            'status': a.status
+        } for a in ocorrencias]
+    })
+
 @agendamento_bp.route('/excluir/<int:agendamento_id>', methods=['POST'])
 @login_required
 def excluir_agendamento(agendamento_id):
     """
     Rota para excluir um agendamento quando o cliente desiste
     Remove completamente o agendamento e libera o horário
-    Bloqueia exclusão se houver prontuário vinculado
+    Bloqueia exclusão se houver prontuário vinculado ou histórico de status
+    (as transições só aceitam inclusões, como no cancelamento em lote)
     """
     try:
         agendamento = Agendamento.query.get_or_404(agendamento_id)
@@ -380,6 +379,10 @@ def excluir_agendamento(agendamento_id):
             flash('Não é possível excluir este agendamento pois já possui prontuário vinculado!', 'error')
             return redirect(url_for('agendamento.lista_agendamentos'))
 
+        if TransicaoStatusAgendamento.query.filter_by(agendamento_id=agendamento_id).first():
+            flash('Não é possível excluir este agendamento pois já possui histórico de mudanças de status!', 'error')
+            return redirect(url_for('agendamento.lista_agendamentos'))
+
         # Salvar informações para a mensagem
         paciente_nome = agendamento.paciente_ref.nome
         data_hora = agendamento.data_agendamento.strftime('%d/%m/%Y às %H:%M')
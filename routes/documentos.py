@@ -3,10 +3,19 @@ Rotas para Documentos Médicos
 Gerencia receituários, laudos, atestados e recibos
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, abort,
+                   Response, stream_with_context)
 from models.models import db, Paciente, Prontuario, Receituario, Laudo, Atestado, Recibo, Agendamento
 from config import Config
 from datetime import datetime, date, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from utils.auth_helpers import medico_required, financeiro_required, admin_required
+from utils.cid_helpers import buscar_cid, validar_cid, cid_catalogado, LIMITE_AUTOCOMPLETAR, LIMITE_MAXIMO_AUTOCOMPLETAR
+from utils.documentos_helpers import (pdf_documento, criar_recibos_do_dia, pdf_recibos_do_dia,
+                                      agendamentos_finalizados_do_dia)
+from utils.numeracao_helpers import numero_recibo, auditoria_numeracao_recibos
+import json
 
 documentos_bp = Blueprint('documentos', __name__)
 
@@ -16,9 +25,14 @@ def gerar_receituario(prontuario_id):
     prontuario = Prontuario.query.get_or_404(prontuario_id)
     paciente = Paciente.query.get_or_404(prontuario.paciente_id)
 
+    # Último receituário salvo, para o PDF
+    receituario = Receituario.query.filter_by(prontuario_id=prontuario_id)\
+                                   .order_by(Receituario.id.desc()).first()
+
     return render_template('documentos/receituario.html',
                          prontuario=prontuario,
                          paciente=paciente,
+                         receituario=receituario,
                          medico=Config.MEDICO_NOME,
                          crm=Config.MEDICO_CRM)
 
@@ -52,9 +66,13 @@ def gerar_laudo(prontuario_id):
     prontuario = Prontuario.query.get_or_404(prontuario_id)
     paciente = Paciente.query.get_or_404(prontuario.paciente_id)
 
+    # Último laudo salvo, para o PDF
+    laudo = Laudo.query.filter_by(prontuario_id=prontuario_id).order_by(Laudo.id.desc()).first()
+
     return render_template('documentos/laudo.html',
                          prontuario=prontuario,
                          paciente=paciente,
+                         laudo=laudo,
                          medico=Config.MEDICO_NOME,
                          crm=Config.MEDICO_CRM)
 
@@ -105,6 +123,14 @@ def salvar_atestado(prontuario_id):
     try:
         prontuario = Prontuario.query.get_or_404(prontuario_id)
 
+        try:
+            cid = validar_cid(request.form.get('cid', ''))
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('documentos.gerar_atestado', prontuario_id=prontuario_id))
+        if cid and not cid_catalogado(cid):
+            flash(f'CID {cid} não consta no catálogo do sistema. Confira o código antes de entregar o atestado.', 'warning')
+
         dias = int(request.form.get('dias_afastamento', 0))
         data_inicio = datetime.strptime(request.form.get('data_inicio'), '%Y-%m-%d').date()
         data_fim = data_inicio + timedelta(days=dias) if dias > 0 else None
@@ -112,7 +138,7 @@ def salvar_atestado(prontuario_id):
         atestado = Atestado(
             paciente_id=prontuario.paciente_id,
             prontuario_id=prontuario_id,
-            cid=request.form.get('cid', '').strip(),
+            cid=cid,
             dias_afastamento=dias,
             data_inicio=data_inicio,
             data_fim=data_fim,
@@ -128,14 +154,21 @@ def salvar_atestado(prontuario_id):
         flash(f'Erro ao salvar atestado: {str(e)}', 'error')
         return redirect(url_for('prontuario.ver_prontuario', paciente_id=prontuario.paciente_id))
 
+@documentos_bp.route('/api/cid')
+@medico_required
+def api_cid():
+    """Autocompletar CID-10 por código ou descrição (parâmetros: q, limite)"""
+    limite = min(max(request.args.get('limite', LIMITE_AUTOCOMPLETAR, type=int), 1), LIMITE_MAXIMO_AUTOCOMPLETAR)
+    return jsonify({'cids': buscar_cid(request.args.get('q', ''), limite)})
+
 @documentos_bp.route('/recibo/<int:agendamento_id>')
 def gerar_recibo(agendamento_id):
     """Gera recibo de pagamento"""
     agendamento = Agendamento.query.get_or_404(agendamento_id)
     paciente = Paciente.query.get_or_404(agendamento.paciente_id)
 
-    # Verificar se já existe recibo
-    recibo_existente = Recibo.query.filter_by(agendamento_id=agendamento_id).first()
+    # Verificar se já existe recibo (o vigente, se houve reemissão)
+    recibo_existente = Recibo.query.filter_by(agendamento_id=agendamento_id, substituido_em=None).first()
 
     return render_template('documentos/recibo.html',
                          agendamento=agendamento,
@@ -146,42 +179,85 @@ def gerar_recibo(agendamento_id):
 
 @documentos_bp.route('/recibo/<int:agendamento_id>/salvar', methods=['POST'])
 def salvar_recibo(agendamento_id):
-    """Salva ou atualiza recibo"""
+    """
+    Emite o recibo do agendamento. Recibo já emitido não é alterado:
+    correções passam pela reemissão, que gera um novo número
+    """
     try:
         agendamento = Agendamento.query.get_or_404(agendamento_id)
 
-        # Verificar se já existe
-        recibo = Recibo.query.filter_by(agendamento_id=agendamento_id).first()
-
-        valor = float(request.form.get('valor', 0))
-        forma_pagamento = request.form.get('forma_pagamento', '').strip()
-
-        if recibo:
-            # Atualizar existente
-            recibo.valor = valor
-            recibo.forma_pagamento = forma_pagamento
-            recibo.descricao_servico = agendamento.servico
-        else:
-            # Criar novo
-            numero_recibo = f"REC-{datetime.now().strftime('%Y%m%d')}-{agendamento_id}"
-
-            recibo = Recibo(
-                paciente_id=agendamento.paciente_id,
-                agendamento_id=agendamento_id,
-                descricao_servico=agendamento.servico,
-                valor=valor,
-                forma_pagamento=forma_pagamento,
-                numero_recibo=numero_recibo
-            )
-            db.session.add(recibo)
+        if Recibo.query.filter_by(agendamento_id=agendamento_id, substituido_em=None).first():
+            flash('O recibo deste agendamento já foi emitido. Para corrigir os dados, use Reemitir.', 'warning')
+            return redirect(url_for('documentos.gerar_recibo', agendamento_id=agendamento_id))
+
+        recibo = Recibo(
+            paciente_id=agendamento.paciente_id,
+            agendamento_id=agendamento_id,
+            descricao_servico=agendamento.servico,
+            valor=float(request.form.get('valor', 0)),
+            forma_pagamento=request.form.get('forma_pagamento', '').strip(),
+            numero_recibo=numero_recibo()
+        )
+        db.session.add(recibo)
 
         db.session.commit()
         flash('Recibo salvo com sucesso!', 'success')
         return redirect(url_for('documentos.gerar_recibo', agendamento_id=agendamento_id))
+    except IntegrityError:
+        # Outro usuário emitiu o recibo deste agendamento ao mesmo tempo
+        db.session.rollback()
+        flash('O recibo deste agendamento já foi emitido. Para corrigir os dados, use Reemitir.', 'warning')
+        return redirect(url_for('documentos.gerar_recibo', agendamento_id=agendamento_id))
     except Exception as e:
         flash(f'Erro ao salvar recibo: {str(e)}', 'error')
         return redirect(url_for('documentos.gerar_recibo', agendamento_id=agendamento_id))
 
+@documentos_bp.route('/recibo/<int:agendamento_id>/reemitir', methods=['POST'])
+@financeiro_required
+def reemitir_recibo(agendamento_id):
+    """
+    Reemite o recibo do agendamento com um novo número da sequência.
+    O recibo anterior continua no banco, marcado como substituído, para que
+    o número dele não vire lacuna na auditoria da numeração.
+    """
+    try:
+        agendamento = Agendamento.query.get_or_404(agendamento_id)
+        anterior = Recibo.query.filter_by(agendamento_id=agendamento_id, substituido_em=None).first()
+        if not anterior:
+            flash('Este agendamento ainda não tem recibo para reemitir.', 'warning')
+            return redirect(url_for('documentos.gerar_recibo', agendamento_id=agendamento_id))
+
+        valor = float(request.form.get('valor', anterior.valor))
+        forma_pagamento = request.form.get('forma_pagamento', '').strip() or anterior.forma_pagamento
+        numero = numero_recibo()
+
+        # Só uma reemissão vence se duas chegarem ao mesmo tempo
+        substituidos = Recibo.query.filter_by(id=anterior.id, substituido_em=None)\
+                                   .update({'substituido_em': datetime.now()}, synchronize_session=False)
+        if not substituidos:
+            db.session.rollback()
+            flash('O recibo deste agendamento acabou de ser reemitido por outro usuário.', 'warning')
+            return redirect(url_for('documentos.gerar_recibo', agendamento_id=agendamento_id))
+
+        db.session.add(Recibo(
+            paciente_id=agendamento.paciente_id,
+            agendamento_id=agendamento_id,
+            descricao_servico=agendamento.servico,
+            valor=valor,
+            forma_pagamento=forma_pagamento,
+            numero_recibo=numero,
+            substitui_id=anterior.id
+        ))
+        db.session.commit()
+        flash(f'Recibo reemitido com o número {numero} (substitui o {anterior.numero_recibo}).', 'success')
+    except IntegrityError:
+        db.session.rollback()
+        flash('O recibo deste agendamento acabou de ser reemitido por outro usuário.', 'warning')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao reemitir recibo: {str(e)}', 'error')
+    return redirect(url_for('documentos.gerar_recibo', agendamento_id=agendamento_id))
+
 @documentos_bp.route('/pedido-exame/<int:prontuario_id>')
 def gerar_pedido_exame(prontuario_id):
     """Gera pedido de exame"""
@@ -225,3 +301,124 @@ def salvar_pedido_exame(prontuario_id):
     except Exception as e:
         flash(f'Erro ao salvar pedido: {str(e)}', 'error')
         return redirect(url_for('prontuario.ver_prontuario', paciente_id=prontuario.paciente_id))
+
+def _enviar_pdf(tipo, registro_id):
+    """Envia o PDF do documento (gerado ou reaproveitado do cache) em streaming"""
+    try:
+        pdf = pdf_documento(tipo, registro_id)
+    except ImportError:
+        flash('Geração de PDF indisponível: instale o pacote reportlab.', 'error')
+        return redirect(request.referrer or url_for('index'))
+    except Exception as e:
+        print(f"Erro ao gerar PDF ({tipo} {registro_id}): {e}")
+        flash(f'Erro ao gerar PDF: {str(e)}', 'error')
+        return redirect(request.referrer or url_for('index'))
+
+    if not pdf:
+        abort(404)
+
+    # O ETag é o hash do conteúdo: navegadores com a versão atual recebem 304
+    return send_file(pdf['caminho'], mimetype='application/pdf', download_name=pdf['nome'],
+                     etag=pdf['hash'], conditional=True, max_age=0)
+
+@documentos_bp.route('/pdf/<tipo>/<int:registro_id>')
+@medico_required
+def baixar_pdf(tipo, registro_id):
+    """
+    PDF de receituário, laudo ou atestado (id do próprio documento) ou de
+    pedido de exame (id do prontuário, onde o pedido fica gravado)
+    """
+    if tipo not in ('receituario', 'laudo', 'atestado', 'pedido_exame'):
+        abort(404)
+    return _enviar_pdf(tipo, registro_id)
+
+@documentos_bp.route('/recibo/pdf/<int:recibo_id>')
+@financeiro_required
+def baixar_recibo_pdf(recibo_id):
+    """PDF do recibo de pagamento"""
+    return _enviar_pdf('recibo', recibo_id)
+
+@documentos_bp.route('/api/recibos/numeracao')
+@admin_required
+def api_auditoria_numeracao():
+    """API: blocos da numeração de recibos e lacunas (números reservados sem recibo)"""
+    return jsonify(auditoria_numeracao_recibos())
+
+def _ler_dia():
+    try:
+        return datetime.strptime(request.values.get('data', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return date.today()
+
+@documentos_bp.route('/recibos-do-dia')
+@financeiro_required
+def recibos_dia():
+    """Recibos dos agendamentos finalizados no dia, com geração em lote"""
+    dia = _ler_dia()
+    agendamentos = agendamentos_finalizados_do_dia(dia).options(joinedload(Agendamento.paciente_ref))\
+                                                      .order_by(Agendamento.data_agendamento).all()
+
+    recibos = {r.agendamento_id: r for r in Recibo.query.filter(
+        Recibo.agendamento_id.in_([a.id for a in agendamentos]),
+        Recibo.substituido_em.is_(None)
+    )} if agendamentos else {}
+
+    return render_template('documentos/recibos_do_dia.html',
+                         agendamentos=agendamentos,
+                         recibos=recibos,
+                         data=dia.strftime('%Y-%m-%d'))
+
+@documentos_bp.route('/recibos-do-dia', methods=['POST'])
+@financeiro_required
+def gerar_recibos_dia():
+    """
+    Cria os recibos que faltam no dia e gera o PDF único com todos eles.
+    A resposta é um fluxo NDJSON com o andamento (uma linha por etapa).
+    """
+    dia = _ler_dia()
+
+    def andamento():
+        try:
+            yield json.dumps({'etapa': 'criando'}) + '\n'
+            resultado = criar_recibos_do_dia(dia)
+            yield json.dumps({'etapa': 'criados', **resultado}) + '\n'
+
+            for progresso in pdf_recibos_do_dia(dia):
+                if progresso['etapa'] == 'concluido':
+                    progresso = {
+                        'etapa': 'concluido',
+                        'total': progresso['total'],
+                        'url': url_for('documentos.baixar_recibos_dia', data=dia.strftime('%Y-%m-%d'))
+                               if progresso['caminho'] else None
+                    }
+                yield json.dumps(progresso) + '\n'
+        except ImportError:
+            yield json.dumps({'etapa': 'erro', 'mensagem': 'Geração de PDF indisponível: instale reportlab e pypdf.'}) + '\n'
+        except Exception as e:
+            print(f"Erro ao gerar recibos do dia {dia}: {e}")
+            db.session.rollback()
+            yield json.dumps({'etapa': 'erro', 'mensagem': str(e)}) + '\n'
+
+    return Response(stream_with_context(andamento()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@documentos_bp.route('/recibos-do-dia/pdf')
+@financeiro_required
+def baixar_recibos_dia():
+    """PDF único com os recibos do dia (reaproveita os arquivos em cache)"""
+    dia = _ler_dia()
+    try:
+        final = None
+        for progresso in pdf_recibos_do_dia(dia):
+            final = progresso
+    except ImportError:
+        flash('Geração de PDF indisponível: instale os pacotes reportlab e pypdf.', 'error')
+        return redirect(url_for('documentos.recibos_dia', data=dia.strftime('%Y-%m-%d')))
+
+    if not final or not final['caminho']:
+        flash('Nenhum recibo emitido para os atendimentos do dia.', 'warning')
+        return redirect(url_for('documentos.recibos_dia', data=dia.strftime('%Y-%m-%d')))
+
+    return send_file(final['caminho'], mimetype='application/pdf',
+                     download_name=f"recibos_{dia.strftime('%Y%m%d')}.pdf",
+                     etag=final['hash'], conditional=True, max_age=0)
@@ -3,12 +3,19 @@ Rotas do Módulo 3 - Financeiro
 Gerencia todas as funcionalidades relacionadas ao controle financeiro
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify,
+                   Response, stream_with_context, send_file, abort)
 from models.models import db, ContaReceber, ContaPagar, FluxoCaixa, Paciente, Profissional, Agendamento
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import joinedload
 from decimal import Decimal
 from utils.auth_helpers import get_usuario_atual, financeiro_required
+from utils.financeiro_helpers import (STATUS_EM_ABERTO, TABELAS_EXPORTACAO, ler_filtros_contas, filtrar_contas,
+                                      paginar_contas, gerar_json_em_lotes, serializar_conta_receber,
+                                      serializar_conta_pagar, consultar_exportacao, gerar_csv_em_lotes,
+                                      gerar_xlsx_em_lotes, HORIZONTES_PROJECAO, projetar_fluxo_caixa,
+                                      liquidar_contas_em_lote, filtro_vencidas)
 
 # Criação do Blueprint para financeiro
 financeiro_bp = Blueprint('financeiro', __name__)
@@ -28,22 +35,22 @@ def dashboard():
         hoje = date.today()
         inicio_mes = hoje.replace(day=1)
         
-        # Contas a receber
+        # Contas a receber (vencidas: marcadas pela rotina diária ou pendentes já vencidas)
         total_receber = db.session.query(func.sum(ContaReceber.valor)).filter(
-            ContaReceber.status == 'pendente'
+            ContaReceber.status.in_(STATUS_EM_ABERTO)
         ).scalar() or 0
         
         vencidas_receber = db.session.query(func.sum(ContaReceber.valor)).filter(
-            and_(ContaReceber.status == 'pendente', ContaReceber.data_vencimento < hoje)
+            filtro_vencidas(ContaReceber, hoje)
         ).scalar() or 0
         
         # Contas a pagar
         total_pagar = db.session.query(func.sum(ContaPagar.valor)).filter(
-            ContaPagar.status == 'pendente'
+            ContaPagar.status.in_(STATUS_EM_ABERTO)
         ).scalar() or 0
         
         vencidas_pagar = db.session.query(func.sum(ContaPagar.valor)).filter(
-            and_(ContaPagar.status == 'pendente', ContaPagar.data_vencimento < hoje)
+            filtro_vencidas(ContaPagar, hoje)
         ).scalar() or 0
         
         # Fluxo de caixa do mês
@@ -81,20 +88,23 @@ def dashboard():
 @financeiro_required
 def contas_receber():
     """
-    Lista de contas a receber
+    Lista de contas a receber (paginada por cursor)
     """
-    status_filtro = request.args.get('status', 'todas')
+    filtros = ler_filtros_contas(request.args)
     
-    query = ContaReceber.query
+    query = filtrar_contas(ContaReceber, filtros['status'], filtros['data_inicio'], filtros['data_fim'])
+    total_contas = query.order_by(None).count()
     
-    if status_filtro != 'todas':
-        query = query.filter(ContaReceber.status == status_filtro)
-    
-    contas = query.order_by(ContaReceber.data_vencimento).all()
+    query = query.options(joinedload(ContaReceber.paciente_conta).load_only(Paciente.nome, Paciente.cpf))
+    contas, proximo_cursor = paginar_contas(query, ContaReceber, filtros['ordenar'], filtros['direcao'],
+                                            filtros['limite'], filtros['cursor'])
     
     return render_template('financeiro/contas_receber.html', 
                          contas=contas, 
-                         status_filtro=status_filtro)
+                         total_contas=total_contas,
+                         proximo_cursor=proximo_cursor,
+                         filtros=filtros,
+                         status_filtro=filtros['status'])
 
 @financeiro_bp.route('/contas-receber/nova', methods=['GET', 'POST'])
 @financeiro_required
@@ -165,20 +175,22 @@ def nova_conta_receber():
 @financeiro_required
 def contas_pagar():
     """
-    Lista de contas a pagar
+    Lista de contas a pagar (paginada por cursor)
     """
-    status_filtro = request.args.get('status', 'todas')
-    
-    query = ContaPagar.query
+    filtros = ler_filtros_contas(request.args)
     
-    if status_filtro != 'todas':
-        query = query.filter(ContaPagar.status == status_filtro)
+    query = filtrar_contas(ContaPagar, filtros['status'], filtros['data_inicio'], filtros['data_fim'])
+    total_contas = query.order_by(None).count()
     
-    contas = query.order_by(ContaPagar.data_vencimento).all()
+    contas, proximo_cursor = paginar_contas(query, ContaPagar, filtros['ordenar'], filtros['direcao'],
+                                            filtros['limite'], filtros['cursor'])
     
     return render_template('financeiro/contas_pagar.html', 
                          contas=contas, 
-                         status_filtro=status_filtro)
+                         total_contas=total_contas,
+                         proximo_cursor=proximo_cursor,
+                         filtros=filtros,
+                         status_filtro=filtros['status'])
 
 @financeiro_bp.route('/contas-pagar/nova', methods=['GET', 'POST'])
 @financeiro_required
@@ -335,6 +347,42 @@ def receber_conta(conta_id):
 
     return redirect(url_for('financeiro.contas_receber'))
 
+@financeiro_bp.route('/api/liquidar-lote/<string:tipo>', methods=['POST'])
+@financeiro_required
+def api_liquidar_lote(tipo):
+    """
+    Liquida várias contas de uma vez (fechamento do mês)
+    tipo: 'receber' ou 'pagar'
+    JSON: {"ids": [1, 2, 3], "forma_pagamento": "PIX", "data_pagamento": "2024-01-31"}
+    Pode ser repetido com segurança: contas já pagas não geram novo movimento
+    """
+    modelos = {'receber': ContaReceber, 'pagar': ContaPagar}
+    if tipo not in modelos:
+        return jsonify({'error': 'Tipo inválido. Use receber ou pagar'}), 404
+
+    dados = request.get_json(silent=True) or {}
+    ids = dados.get('ids') or []
+    forma_pagamento = (dados.get('forma_pagamento') or '').strip() or None
+
+    try:
+        ids = [int(i) for i in ids]
+        data_pagamento = (datetime.strptime(dados['data_pagamento'], '%Y-%m-%d').date()
+                          if dados.get('data_pagamento') else date.today())
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Lista de ids ou data de pagamento inválida'}), 400
+
+    if not ids:
+        return jsonify({'error': 'Nenhuma conta informada'}), 400
+
+    try:
+        resultados = liquidar_contas_em_lote(modelos[tipo], ids, data_pagamento, forma_pagamento)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({
+        'liquidadas': sum(1 for r in resultados if r['resultado'] == 'liquidada'),
+        'resultados': resultados
+    })
 
 # Novas rotas para API/JSON
 @financeiro_bp.route('/api/contas-receber')
@@ -342,44 +390,51 @@ def receber_conta(conta_id):
 def api_contas_receber():
     """
     API para obter contas a receber em formato JSON
+    Parâmetros: status, data_inicio, data_fim, ordenar, direcao, limite, cursor
+    Com exportar=1 retorna todas as contas filtradas em um array JSON transmitido em lotes
     """
-    contas = ContaReceber.query.order_by(ContaReceber.data_vencimento).all()
+    filtros = ler_filtros_contas(request.args)
     
-    contas_data = []
-    for conta in contas:
-        contas_data.append({
-            'id': conta.id,
-            'paciente_nome': conta.paciente_conta.nome,
-            'descricao': conta.descricao,
-            'valor': float(conta.valor),
-            'data_vencimento': conta.data_vencimento.strftime('%Y-%m-%d'),
-            'status': conta.status,
-            'data_pagamento': conta.data_pagamento.strftime('%Y-%m-%d') if conta.data_pagamento else None
-        })
+    query = filtrar_contas(ContaReceber, filtros['status'], filtros['data_inicio'], filtros['data_fim'])
+    query = query.options(joinedload(ContaReceber.paciente_conta).load_only(Paciente.nome))
     
-    return jsonify(contas_data)
+    if request.args.get('exportar') == '1':
+        query = query.order_by(ContaReceber.data_vencimento, ContaReceber.id)
+        return Response(stream_with_context(gerar_json_em_lotes(query, serializar_conta_receber)),
+                        mimetype='application/json')
+    
+    contas, proximo_cursor = paginar_contas(query, ContaReceber, filtros['ordenar'], filtros['direcao'],
+                                            filtros['limite'], filtros['cursor'])
+    
+    return jsonify({
+        'contas': [serializar_conta_receber(conta) for conta in contas],
+        'proximo_cursor': proximo_cursor
+    })
 
 @financeiro_bp.route('/api/contas-pagar')
 @financeiro_required
 def api_contas_pagar():
     """
     API para obter contas a pagar em formato JSON
+    Parâmetros: status, data_inicio, data_fim, ordenar, direcao, limite, cursor
+    Com exportar=1 retorna todas as contas filtradas em um array JSON transmitido em lotes
     """
-    contas = ContaPagar.query.order_by(ContaPagar.data_vencimento).all()
+    filtros = ler_filtros_contas(request.args)
     
-    contas_data = []
-    for conta in contas:
-        contas_data.append({
-            'id': conta.id,
-            'fornecedor': conta.fornecedor,
-            'descricao': conta.descricao,
-            'valor': float(conta.valor),
-            'data_vencimento': conta.data_vencimento.strftime('%Y-%m-%d'),
-            'status': conta.status,
-            'categoria': conta.categoria
-        })
+    query = filtrar_contas(ContaPagar, filtros['status'], filtros['data_inicio'], filtros['data_fim'])
     
-    return jsonify(contas_data)
+    if request.args.get('exportar') == '1':
+        query = query.order_by(ContaPagar.data_vencimento, ContaPagar.id)
+        return Response(stream_with_context(gerar_json_em_lotes(query, serializar_conta_pagar)),
+                        mimetype='application/json')
+    
+    contas, proximo_cursor = paginar_contas(query, ContaPagar, filtros['ordenar'], filtros['direcao'],
+                                            filtros['limite'], filtros['cursor'])
+    
+    return jsonify({
+        'contas': [serializar_conta_pagar(conta) for conta in contas],
+        'proximo_cursor': proximo_cursor
+    })
 
 @financeiro_bp.route('/api/fluxo-caixa/<string:periodo>')
 @financeiro_required
@@ -416,3 +471,75 @@ def api_fluxo_caixa(periodo):
         })
     
     return jsonify(fluxo_data)
+
+
+@financeiro_bp.route('/api/projecao-fluxo')
+@financeiro_required
+def api_projecao_fluxo():
+    """
+    API de projeção do saldo de caixa dia a dia (30, 60 ou 90 dias)
+    considerando as contas a receber e a pagar em aberto
+    """
+    try:
+        dias = int(request.args.get('dias', 30))
+    except ValueError:
+        dias = 0
+
+    if dias not in HORIZONTES_PROJECAO:
+        return jsonify({'error': 'Horizonte inválido. Use 30, 60 ou 90 dias'}), 400
+
+    try:
+        return jsonify(projetar_fluxo_caixa(dias))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _consulta_exportacao_da_requisicao(tabela):
+    """
+    Valida a tabela e aplica os filtros da query string (data_inicio, data_fim,
+    categoria, status) à consulta de exportação
+    """
+    if tabela not in TABELAS_EXPORTACAO:
+        abort(404)
+
+    filtros = ler_filtros_contas(request.args)
+    return consultar_exportacao(tabela,
+                                data_inicio=filtros['data_inicio'],
+                                data_fim=filtros['data_fim'],
+                                categoria=request.args.get('categoria', '').strip() or None,
+                                status=filtros['status'])
+
+@financeiro_bp.route('/export/<string:tabela>.csv')
+@financeiro_required
+def exportar_csv(tabela):
+    """
+    Exporta contas a receber, contas a pagar ou fluxo de caixa em CSV
+    O arquivo é transmitido em lotes, sem carregar a tabela inteira em memória
+    """
+    query = _consulta_exportacao_da_requisicao(tabela)
+    colunas = TABELAS_EXPORTACAO[tabela]['colunas']
+    nome_arquivo = f"{tabela}_{date.today().strftime('%Y%m%d')}.csv"
+
+    return Response(stream_with_context(gerar_csv_em_lotes(query, colunas)),
+                    mimetype='text/csv; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename="{nome_arquivo}"'})
+
+@financeiro_bp.route('/export/<string:tabela>.xlsx')
+@financeiro_required
+def exportar_xlsx(tabela):
+    """
+    Exporta contas a receber, contas a pagar ou fluxo de caixa em planilha Excel
+    """
+    query = _consulta_exportacao_da_requisicao(tabela)
+    colunas = TABELAS_EXPORTACAO[tabela]['colunas']
+    nome_arquivo = f"{tabela}_{date.today().strftime('%Y%m%d')}.xlsx"
+
+    try:
+        arquivo = gerar_xlsx_em_lotes(query, colunas, titulo=tabela)
+    except ImportError:
+        flash('Exportação em Excel indisponível: instale o pacote openpyxl.', 'error')
+        return redirect(url_for('financeiro.dashboard'))
+
+    return send_file(arquivo,
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                     as_attachment=True,
+                     download_name=nome_arquivo)
@@ -3,10 +3,16 @@ Rotas do Módulo 2 - Prontuário Eletrônico
 Gerencia todas as funcionalidades relacionadas aos prontuários
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from models.models import db, Prontuario, Paciente, AtendimentoHistorico
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from models.models import db, Prontuario, Paciente, AtendimentoHistorico, Agendamento
 from datetime import datetime
 from utils.auth_helpers import medico_required, agendamento_required, get_usuario_atual
+from utils.pacientes_helpers import somente_digitos
+from utils.prontuario_helpers import (linha_do_tempo, indice_prontuarios, detalhe_prontuario,
+                                     buscar_registros_clinicos, LIMITE_LINHA_DO_TEMPO,
+                                     LIMITE_MAXIMO_LINHA_DO_TEMPO, LIMITE_INDICE_PRONTUARIOS,
+                                     LIMITE_MAXIMO_INDICE_PRONTUARIOS, RESULTADOS_POR_PAGINA,
+                                     MAXIMO_RESULTADOS_POR_PAGINA)
 
 # Criação do Blueprint para prontuários
 prontuario_bp = Blueprint('prontuario', __name__)
@@ -22,10 +28,11 @@ def lista_pacientes():
     
     if busca:
         # Busca por nome ou CPF
-        pacientes = Paciente.query.filter(
-            (Paciente.nome.contains(busca)) | 
-            (Paciente.cpf.contains(busca))
-        ).all()
+        filtro = Paciente.nome.contains(busca)
+        digitos = somente_digitos(busca)
+        if digitos:
+            filtro = filtro | Paciente.cpf_digitos.startswith(digitos)
+        pacientes = Paciente.query.filter(filtro).all()
     else:
         # Lista todos os pacientes
         pacientes = Paciente.query.order_by(Paciente.nome).all()
@@ -45,15 +52,42 @@ def ver_prontuario(paciente_id):
     paciente = Paciente.query.get_or_404(paciente_id)
     usuario = get_usuario_atual()
 
-    # Busca todos os prontuários do paciente
-    prontuarios = Prontuario.query.filter_by(paciente_id=paciente_id)\
-                                  .order_by(Prontuario.data_atendimento.desc()).all()
+    # Só o índice (em cache); o conteúdo de cada atendimento vem de
+    # api_prontuario_detalhe quando ele é aberto na tela
+    indice = indice_prontuarios(paciente_id, LIMITE_MAXIMO_INDICE_PRONTUARIOS)
+
+    # Contagem no banco em vez de carregar paciente.agendamentos
+    total_agendamentos = db.session.query(db.func.count(Agendamento.id))\
+                                   .filter(Agendamento.paciente_id == paciente_id).scalar()
 
     return render_template('prontuario/ver_prontuario.html',
                          paciente=paciente,
-                         prontuarios=prontuarios,
+                         prontuarios=indice['prontuarios'],
+                         total_prontuarios=indice['total'],
+                         total_agendamentos=total_agendamentos,
                          usuario=usuario)
 
+@prontuario_bp.route('/api/linha-do-tempo/<int:paciente_id>')
+@agendamento_required
+def api_linha_do_tempo(paciente_id):
+    """
+    API com a linha do tempo clínica do paciente (atendimentos, histórico,
+    exames, receituários, laudos, atestados e anexos), mais recentes primeiro.
+    Paginação por cursor: ?limite=30&cursor=<proximo_cursor>
+    """
+    Paciente.query.get_or_404(paciente_id)
+
+    try:
+        limite = min(max(int(request.args.get('limite', LIMITE_LINHA_DO_TEMPO)), 1), LIMITE_MAXIMO_LINHA_DO_TEMPO)
+    except ValueError:
+        limite = LIMITE_LINHA_DO_TEMPO
+
+    try:
+        eventos, proximo_cursor = linha_do_tempo(paciente_id, limite, request.args.get('cursor'))
+        return jsonify({'eventos': eventos, 'proximo_cursor': proximo_cursor})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @prontuario_bp.route('/editar/<int:paciente_id>', methods=['GET', 'POST'])
 @medico_required
 def editar_prontuario(paciente_id):
@@ -211,32 +245,50 @@ def editar_paciente(paciente_id):
     return redirect(url_for('prontuario.lista_pacientes'))
 
 @prontuario_bp.route('/api/prontuarios-anteriores/<int:paciente_id>')
+@medico_required
 def api_prontuarios_anteriores(paciente_id):
     """
-    API para retornar prontuários anteriores do paciente
-    Usado para copiar conteúdo em documentos
+    API com o índice dos prontuários anteriores do paciente (id, data,
+    especialidade e trecho do diagnóstico), usado para escolher o que copiar
+    nos documentos. O conteúdo completo vem de api_prontuario_detalhe.
+    Parâmetro opcional: limite
     """
     try:
-        from flask import jsonify
-
-        prontuarios = Prontuario.query.filter_by(paciente_id=paciente_id)\
-                                      .order_by(Prontuario.data_atendimento.desc())\
-                                      .all()
-
-        resultado = []
-        for p in prontuarios:
-            resultado.append({
-                'id': p.id,
-                'data_atendimento': p.data_atendimento.strftime('%d/%m/%Y'),
-                'especialidade': p.especialidade or '',
-                'queixa_principal': p.queixa_principal or '',
-                'historia_doenca': p.historia_doenca or '',
-                'exame_fisico': p.exame_fisico or '',
-                'diagnostico': p.diagnostico or '',
-                'prescricao': p.prescricao or '',
-                'observacoes': p.observacoes or ''
-            })
-
-        return jsonify({'prontuarios': resultado})
+        limite = min(max(request.args.get('limite', LIMITE_INDICE_PRONTUARIOS, type=int), 1),
+                     LIMITE_MAXIMO_INDICE_PRONTUARIOS)
+        return jsonify(indice_prontuarios(paciente_id, limite))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@prontuario_bp.route('/api/prontuario/<int:prontuario_id>')
+@agendamento_required
+def api_prontuario_detalhe(prontuario_id):
+    """
+    API com o conteúdo completo de um prontuário, carregado pela tela do
+    prontuário ao abrir cada atendimento (mesmos perfis de ver_prontuario)
+    """
+    prontuario = db.session.get(Prontuario, prontuario_id)
+    if not prontuario:
+        return jsonify({'error': 'Prontuário não encontrado'}), 404
+    return jsonify(detalhe_prontuario(prontuario))
+
+
+@prontuario_bp.route('/api/busca')
+@medico_required
+def api_busca_clinica():
+    """
+    API de busca textual em prontuários e receituários, por relevância
+    (ex.: pacientes com determinado diagnóstico ou em uso de um medicamento).
+    Parâmetros: q, pagina, por_pagina
+    """
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = min(max(request.args.get('por_pagina', RESULTADOS_POR_PAGINA, type=int), 1),
+                     MAXIMO_RESULTADOS_POR_PAGINA)
+
+    try:
+        return jsonify(buscar_registros_clinicos(request.args.get('q', ''), pagina, por_pagina))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
+        print(f"Erro na busca clínica: {e}")
         return jsonify({'error': str(e)}), 500
@@ -9,6 +9,12 @@ from models.models import (db, Agendamento, Paciente, Profissional, ContaReceber
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, and_, or_, extract
 from decimal import Decimal
+from utils.financeiro_helpers import marcar_contas_vencidas
+from utils.relatorios_helpers import (ler_periodo, faturamento_por_profissional, faturamento_por_especialidade,
+                                      analise_servicos, totalizar_por_servico, analise_faltas,
+                                      tempos_atendimento)
+from utils.cid_helpers import estatisticas_cid
+from utils.auth_helpers import medico_required, admin_required
 import json
 
 # Criação do Blueprint para relatórios
@@ -82,72 +88,144 @@ def dashboard():
 def faturamento():
     """
     Relatório de faturamento por empresa e profissional
+    Agrupa sobre a tabela FatoReceita (inclui contas sem agendamento vinculado)
     """
-    data_inicio = request.args.get('data_inicio', date.today().replace(day=1).strftime('%Y-%m-%d'))
-    data_fim = request.args.get('data_fim', date.today().strftime('%Y-%m-%d'))
+    hoje = date.today()
+    inicio, fim = ler_periodo(request.args, hoje.replace(day=1), hoje)
     
     # Faturamento por profissional
-    faturamento_profissional = db.session.query(
-        Profissional.nome,
-        Profissional.especialidade,
-        func.count(Agendamento.id).label('total_atendimentos'),
-        func.sum(ContaReceber.valor).label('faturamento_total')
-    ).join(
-        Agendamento, Profissional.id == Agendamento.profissional_id
-    ).join(
-        ContaReceber, Agendamento.id == ContaReceber.agendamento_id
-    ).filter(
-        and_(ContaReceber.data_criacao >= data_inicio,
-             ContaReceber.data_criacao <= data_fim)
-    ).group_by(Profissional.id).all()
+    faturamento_profissional = faturamento_por_profissional(inicio, fim)
     
     # Faturamento por especialidade
-    faturamento_especialidade = db.session.query(
-        Profissional.especialidade,
-        func.count(Agendamento.id).label('total_atendimentos'),
-        func.sum(ContaReceber.valor).label('faturamento_total')
-    ).join(
-        Agendamento, Profissional.id == Agendamento.profissional_id
-    ).join(
-        ContaReceber, Agendamento.id == ContaReceber.agendamento_id
-    ).filter(
-        and_(ContaReceber.data_criacao >= data_inicio,
-             ContaReceber.data_criacao <= data_fim)
-    ).group_by(Profissional.especialidade).all()
+    faturamento_especialidade = faturamento_por_especialidade(inicio, fim)
     
     return render_template('relatorios/faturamento.html',
                          faturamento_profissional=faturamento_profissional,
                          faturamento_especialidade=faturamento_especialidade,
-                         data_inicio=data_inicio,
-                         data_fim=data_fim)
+                         data_inicio=inicio.strftime('%Y-%m-%d'),
+                         data_fim=fim.strftime('%Y-%m-%d'))
 
 @relatorios_bp.route('/ticket-medio')
 def ticket_medio():
     """
     Relatório de ticket médio por profissional
     """
-    data_inicio = request.args.get('data_inicio', date.today().replace(day=1).strftime('%Y-%m-%d'))
-    data_fim = request.args.get('data_fim', date.today().strftime('%Y-%m-%d'))
+    hoje = date.today()
+    inicio, fim = ler_periodo(request.args, hoje.replace(day=1), hoje)
     
-    ticket_medio_profissional = db.session.query(
-        Profissional.nome,
-        Profissional.especialidade,
-        func.count(Agendamento.id).label('total_atendimentos'),
-        func.sum(ContaReceber.valor).label('faturamento_total'),
-        (func.sum(ContaReceber.valor) / func.count(Agendamento.id)).label('ticket_medio')
-    ).join(
-        Agendamento, Profissional.id == Agendamento.profissional_id
-    ).join(
-        ContaReceber, Agendamento.id == ContaReceber.agendamento_id
-    ).filter(
-        and_(ContaReceber.data_criacao >= data_inicio,
-             ContaReceber.data_criacao <= data_fim)
-    ).group_by(Profissional.id).all()
+    ticket_medio_profissional = faturamento_por_profissional(inicio, fim)
     
     return render_template('relatorios/ticket_medio.html',
                          ticket_medio_profissional=ticket_medio_profissional,
-                         data_inicio=data_inicio,
-                         data_fim=data_fim)
+                         data_inicio=inicio.strftime('%Y-%m-%d'),
+                         data_fim=fim.strftime('%Y-%m-%d'))
+
+@relatorios_bp.route('/servicos')
+@admin_required
+def servicos():
+    """
+    Relatório por serviço: agendamentos, finalizados, faltas,
+    ocupação da grade de horários e receita por semana
+    """
+    hoje = date.today()
+    inicio, fim = ler_periodo(request.args, hoje - timedelta(weeks=8), hoje)
+    
+    semanas = analise_servicos(inicio, fim)
+    totais = totalizar_por_servico(semanas)
+    
+    return render_template('relatorios/servicos.html',
+                         semanas=semanas,
+                         totais=totais,
+                         data_inicio=inicio.strftime('%Y-%m-%d'),
+                         data_fim=fim.strftime('%Y-%m-%d'))
+
+@relatorios_bp.route('/api/servicos')
+@admin_required
+def api_servicos():
+    """
+    API com a análise semanal por serviço (mesmos filtros do relatório)
+    """
+    try:
+        hoje = date.today()
+        inicio, fim = ler_periodo(request.args, hoje - timedelta(weeks=8), hoje)
+        semanas = analise_servicos(inicio, fim)
+        
+        return jsonify({
+            'semanas': semanas,
+            'totais': totalizar_por_servico(semanas)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@relatorios_bp.route('/faltas')
+@admin_required
+def faltas():
+    """
+    Relatório de faltas por dia da semana, horário e serviço,
+    com a espera média entre check-in e início do atendimento
+    """
+    hoje = date.today()
+    inicio, fim = ler_periodo(request.args, hoje - timedelta(days=90), hoje)
+    
+    return render_template('relatorios/faltas.html',
+                         analise=analise_faltas(inicio, fim),
+                         data_inicio=inicio.strftime('%Y-%m-%d'),
+                         data_fim=fim.strftime('%Y-%m-%d'))
+
+@relatorios_bp.route('/api/faltas')
+@admin_required
+def api_faltas():
+    """
+    API com a análise de faltas e pontualidade (mesmos filtros do relatório)
+    """
+    try:
+        hoje = date.today()
+        inicio, fim = ler_periodo(request.args, hoje - timedelta(days=90), hoje)
+        return jsonify(analise_faltas(inicio, fim))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@relatorios_bp.route('/api/tempos-atendimento')
+@admin_required
+def api_tempos_atendimento():
+    """
+    API com atendimentos finalizados, mediana de espera e mediana de
+    duração da consulta por dia, a partir do histórico de transições
+    """
+    try:
+        hoje = date.today()
+        inicio, fim = ler_periodo(request.args, hoje - timedelta(days=30), hoje)
+        return jsonify({'dias': tempos_atendimento(inicio, fim)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@relatorios_bp.route('/cid')
+@medico_required
+def cid():
+    """
+    Relatório por CID-10: atestados, pacientes, dias de afastamento e
+    diagnósticos que citam o código
+    """
+    hoje = date.today()
+    inicio, fim = ler_periodo(request.args, hoje - timedelta(days=90), hoje)
+
+    return render_template('relatorios/cid.html',
+                         estatisticas=estatisticas_cid(inicio, fim),
+                         data_inicio=inicio.strftime('%Y-%m-%d'),
+                         data_fim=fim.strftime('%Y-%m-%d'))
+
+@relatorios_bp.route('/api/cid')
+@medico_required
+def api_cid():
+    """
+    API com as estatísticas por CID-10 (mesmos filtros do relatório)
+    """
+    try:
+        hoje = date.today()
+        inicio, fim = ler_periodo(request.args, hoje - timedelta(days=90), hoje)
+        return jsonify(estatisticas_cid(inicio, fim))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @relatorios_bp.route('/nps')
 def nps():
@@ -303,10 +381,11 @@ def gerar_alertas():
         hoje = date.today()
         alertas_criados = 0
 
-        # 1. Alertas de contas vencidas
+        # 1. Alertas de contas vencidas (garante que o status 'vencido' está em dia)
+        marcar_contas_vencidas(hoje)
+
         contas_vencidas_receber = ContaReceber.query.filter(
-            and_(ContaReceber.status == 'pendente',
-                 ContaReceber.data_vencimento < hoje)
+            ContaReceber.status == 'vencido'
         ).all()
 
         for conta in contas_vencidas_receber:
@@ -329,8 +408,7 @@ def gerar_alertas():
                 alertas_criados += 1
 
         contas_vencidas_pagar = ContaPagar.query.filter(
-            and_(ContaPagar.status == 'pendente',
-                 ContaPagar.data_vencimento < hoje)
+            ContaPagar.status == 'vencido'
         ).all()
 
         for conta in contas_vencidas_pagar:
@@ -418,21 +496,12 @@ def api_dados_dashboard():
             })
         
         # Faturamento por especialidade
-        faturamento_especialidade = db.session.query(
-            Profissional.especialidade,
-            func.sum(ContaReceber.valor).label('total')
-        ).join(
-            Agendamento, Profissional.id == Agendamento.profissional_id
-        ).join(
-            ContaReceber, Agendamento.id == ContaReceber.agendamento_id
-        ).filter(
-            ContaReceber.data_criacao >= inicio_mes
-        ).group_by(Profissional.especialidade).all()
+        faturamento_especialidade = faturamento_por_especialidade(inicio_mes)
         
         return jsonify({
             'atendimentos_diarios': list(reversed(atendimentos_diarios)),
             'faturamento_especialidade': [
-                {'especialidade': item[0], 'valor': float(item[1] or 0)}
+                {'especialidade': item.especialidade, 'valor': float(item.faturamento_total or 0)}
                 for item in faturamento_especialidade
             ]
         })
@@ -465,4 +465,53 @@ window.clinedSpa = {
     formatters,
     dateUtils,
     validateCPF
-};
\ No newline at end of file
+};
+
+/**
+ * Menu lateral: recolher, submenus e item ativo
+ */
+// Sidebar functionality
+document.addEventListener('DOMContentLoaded', function() {
+    const sidebar = document.getElementById('sidebar');
+    const sidebarToggle = document.getElementById('sidebarToggle');
+    const dropdownToggles = document.querySelectorAll('.nav-dropdown-toggle');
+
+    // Toggle sidebar
+    sidebarToggle.addEventListener('click', function() {
+        sidebar.classList.toggle('collapsed');
+        const icon = this.querySelector('i');
+        if (sidebar.classList.contains('collapsed')) {
+            icon.className = 'fas fa-chevron-right';
+        } else {
+            icon.className = 'fas fa-chevron-left';
+        }
+    });
+
+    // Dropdown functionality
+    dropdownToggles.forEach(toggle => {
+        toggle.addEventListener('click', function(e) {
+            e.preventDefault();
+            const dropdown = this.closest('.nav-dropdown');
+            dropdown.classList.toggle('open');
+        });
+    });
+
+    // Set active nav item
+    const currentPath = window.location.pathname;
+    const navLinks = document.querySelectorAll('.nav-link');
+    navLinks.forEach(link => {
+        if (link.getAttribute('href') === currentPath) {
+            link.classList.add('active');
+            // Open parent dropdown if exists
+            const dropdown = link.closest('.nav-dropdown');
+            if (dropdown) {
+                dropdown.classList.add('open');
+            }
+        }
+    });
+
+    // Mobile sidebar
+    if (window.innerWidth <= 768) {
+        sidebar.classList.add('collapsed');
+    }
+});
@@ -0,0 +1,196 @@
+/**
+ * Painel de atendimentos (TV da recepção)
+ * Atualiza as chamadas e as estatísticas periodicamente
+ */
+
+// Estado global
+let ultimosIdsEmAtendimento = new Set();
+let filaAlertas = [];
+let mostrandoAlerta = false;
+
+// Atualizar relógio
+function atualizarRelogio() {
+    const agora = new Date();
+    const horas = String(agora.getHours()).padStart(2, '0');
+    const minutos = String(agora.getMinutes()).padStart(2, '0');
+    const segundos = String(agora.getSeconds()).padStart(2, '0');
+    document.getElementById('clock').textContent = `${horas}:${minutos}:${segundos}`;
+
+    const dias = ['Domingo', 'Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado'];
+    const meses = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+                  'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'];
+
+    const diaSemana = dias[agora.getDay()];
+    const dia = agora.getDate();
+    const mes = meses[agora.getMonth()];
+    const ano = agora.getFullYear();
+
+    document.getElementById('date').textContent = `${diaSemana}, ${dia} de ${mes} de ${ano}`;
+}
+
+// Mostrar alerta de chamado
+function mostrarAlerta(atendimento) {
+    return new Promise((resolve) => {
+        mostrandoAlerta = true;
+
+        const alerta = document.getElementById('alertaChamado');
+        const timer = document.getElementById('alertaTimer');
+        const sound = document.getElementById('notificationSound');
+
+        document.getElementById('alertaPaciente').textContent = atendimento.paciente;
+        document.getElementById('alertaServicoTexto').textContent = atendimento.servico;
+        document.getElementById('alertaHorario').textContent = atendimento.horario;
+
+        alerta.classList.add('show');
+
+        try {
+            sound.play().catch(e => console.log('Não foi possível reproduzir som:', e));
+        } catch (e) {
+            console.log('Erro ao reproduzir som:', e);
+        }
+
+        let segundos = 10;
+        timer.textContent = segundos;
+
+        const intervalo = setInterval(() => {
+            segundos--;
+            timer.textContent = segundos;
+
+            if (segundos <= 0) {
+                clearInterval(intervalo);
+                alerta.classList.remove('show');
+                mostrandoAlerta = false;
+                resolve();
+            }
+        }, 1000);
+    });
+}
+
+// Processar fila de alertas
+async function processarFilaAlertas() {
+    if (mostrandoAlerta || filaAlertas.length === 0) {
+        return;
+    }
+
+    const atendimento = filaAlertas.shift();
+    await mostrarAlerta(atendimento);
+
+    if (filaAlertas.length > 0) {
+        setTimeout(processarFilaAlertas, 500);
+    }
+}
+
+// Atualizar atendimentos
+async function atualizarAtendimentos() {
+    try {
+        const response = await fetch('/chamados/api/atendimentos-atual');
+        const data = await response.json();
+
+        // Atualizar informações do médico
+        document.getElementById('medicoNome').textContent = data.profissional.nome;
+        document.getElementById('medicoEsp').textContent = data.profissional.especialidade;
+        document.getElementById('medicoCrm').textContent = data.profissional.crm;
+
+        // Verificar novos atendimentos
+        const idsAtuais = new Set(data.em_atendimento.map(a => a.id));
+
+        data.em_atendimento.forEach(atendimento => {
+            if (!ultimosIdsEmAtendimento.has(atendimento.id)) {
+                filaAlertas.push(atendimento);
+            }
+        });
+
+        ultimosIdsEmAtendimento = idsAtuais;
+
+        // Processar fila de alertas
+        processarFilaAlertas();
+
+        // Atualizar lista de em atendimento
+        const emAtendimentoContent = document.getElementById('emAtendimentoContent');
+        if (data.em_atendimento.length === 0) {
+            emAtendimentoContent.innerHTML = `
+                <div class="sem-atendimento">
+                    <i class="fas fa-clock"></i>
+                    <h3>Aguardando próximo atendimento</h3>
+                </div>
+            `;
+        } else {
+            let html = '';
+            data.em_atendimento.forEach((atendimento, index) => {
+                html += `
+                    <div class="atendimento-item" style="animation-delay: ${index * 0.1}s">
+                        <h3><i class="fas fa-user"></i> ${atendimento.paciente}</h3>
+                        <div class="info">
+                            <i class="fas fa-clock"></i>
+                            <span>${atendimento.horario}</span>
+                        </div>
+                        <div class="info">
+                            <i class="fas fa-notes-medical"></i>
+                            <span>${atendimento.servico}</span>
+                        </div>
+                        <div class="status-badge">
+                            <i class="fas fa-heartbeat"></i> ${atendimento.status}
+                        </div>
+                    </div>
+                `;
+            });
+            emAtendimentoContent.innerHTML = html;
+        }
+
+        // Atualizar próximos atendimentos
+        const proximosContent = document.getElementById('proximosContent');
+        if (data.proximos.length === 0) {
+            proximosContent.innerHTML = `
+                <p style="text-align: center; color: #999; padding: 40px;">
+                    <i class="fas fa-check-circle" style="font-size: 2rem;"></i><br><br>
+                    Nenhum atendimento pendente
+                </p>
+            `;
+        } else {
+            let html = '';
+            data.proximos.forEach((proximo, index) => {
+                html += `
+                    <div class="proximo-item" style="animation-delay: ${index * 0.1}s">
+                        <h4>${index + 1}. ${proximo.paciente}</h4>
+                        <p class="horario"><i class="fas fa-clock"></i> ${proximo.horario}</p>
+                        <p><i class="fas fa-notes-medical"></i> ${proximo.servico}</p>
+                        <p><i class="fas fa-info-circle"></i> ${proximo.status}</p>
+                    </div>
+                `;
+            });
+            proximosContent.innerHTML = html;
+        }
+
+    } catch (error) {
+        console.error('Erro ao atualizar atendimentos:', error);
+    }
+}
+
+// Atualizar estatísticas
+async function atualizarEstatisticas() {
+    try {
+        const response = await fetch('/chamados/api/estatisticas-dia');
+        const data = await response.json();
+
+        document.getElementById('statTotal').textContent = data.total;
+        document.getElementById('statAtendidos').textContent = data.atendidos;
+        document.getElementById('statEspera').textContent = data.em_espera;
+
+    } catch (error) {
+        console.error('Erro ao atualizar estatísticas:', error);
+    }
+}
+
+// Inicializar
+atualizarRelogio();
+atualizarAtendimentos();
+atualizarEstatisticas();
+
+// Atualizar a cada segundo (relógio)
+setInterval(atualizarRelogio, 1000);
+
+// Atualizar a cada 3 segundos (atendimentos)
+setInterval(atualizarAtendimentos, 3000);
+
+// Atualizar a cada 10 segundos (estatísticas)
+setInterval(atualizarEstatisticas, 10000);
@@ -0,0 +1,44 @@
+"""
+Configuração dos testes
+Banco SQLite em arquivo temporário (as threads dos testes de concorrência
+precisam de conexões independentes), preparado pelos mesmos passos dos
+comandos init-db e seed.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+
+PASTA_TESTES = tempfile.mkdtemp(prefix='clined-testes-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(PASTA_TESTES, 'testes.db')}"
+os.environ['PDF_CACHE_DIR'] = os.path.join(PASTA_TESTES, 'pdf')
+os.environ['JINJA_CACHE_DIR'] = os.path.join(PASTA_TESTES, 'jinja')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as aplicacao, inicializar_banco, criar_dados_iniciais, criar_usuarios_iniciais  # noqa: E402
+
+USUARIO_RECEPCAO = ('recepcao@clined.com.br', 'recepcao123')
+
+
+@pytest.fixture(scope='session')
+def app():
+    aplicacao.config['TESTING'] = True
+    with aplicacao.app_context():
+        inicializar_banco()
+        criar_dados_iniciais()
+        criar_usuarios_iniciais()
+    yield aplicacao
+    shutil.rmtree(PASTA_TESTES, ignore_errors=True)
+
+
+@pytest.fixture
+def novo_cliente(app):
+    """Fábrica de clientes de teste já autenticados (um por recepção simulada)"""
+    def criar(email=USUARIO_RECEPCAO[0], senha=USUARIO_RECEPCAO[1]):
+        cliente = app.test_client()
+        resposta = cliente.post('/auth/login', data={'email': email, 'senha': senha})
+        assert resposta.status_code == 302
+        return cliente
+    return criar
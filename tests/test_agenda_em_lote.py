@@ -0,0 +1,94 @@
+"""
+Testes da operação em lote na agenda: remarcação com relatório de conflitos,
+simulação sem gravar e cancelamento que respeita o histórico de status
+"""
+
+from datetime import date, datetime, time
+import pytest
+from models.models import db, Agendamento, Paciente, Profissional
+from utils.agendamento_helpers import alterar_status
+
+SERVICO = 'Consulta Médica'
+ORIGEM = date(2033, 5, 2)   # segunda-feira
+DESTINO = date(2033, 5, 3)  # terça-feira
+
+
+def _agendamento(dia: date, hora: int, status: str = 'agendado') -> Agendamento:
+    agendamento = Agendamento(paciente_id=Paciente.query.first().id, profissional_id=Profissional.query.first().id,
+                              data_agendamento=datetime.combine(dia, time(hora)), servico=SERVICO, status=status)
+    db.session.add(agendamento)
+    db.session.flush()
+    return agendamento
+
+
+@pytest.fixture
+def agenda(app):
+    """Manhã do dia de origem (9h, 10h, 11h e 12h em espera) e o dia de destino já ocupado às 10h"""
+    with app.app_context():
+        ids = {hora: _agendamento(ORIGEM, hora).id for hora in (9, 10, 11)}
+        ids[12] = _agendamento(ORIGEM, 12, status='em_espera').id
+        ocupado = _agendamento(DESTINO, 10).id
+        db.session.commit()
+    yield ids
+    with app.app_context():
+        Agendamento.query.filter(Agendamento.id.in_(list(ids.values()) + [ocupado])).delete(
+            synchronize_session=False)
+        db.session.commit()
+
+
+def _operar(cliente, **dados) -> dict:
+    dados = dict({'data_origem': ORIGEM.isoformat(), 'hora_inicio': '08:00', 'hora_fim': '13:00'}, **dados)
+    resposta = cliente.post('/agendamento/api/agenda-em-lote', json=dados)
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def _horarios(ids: dict) -> dict:
+    return {hora: db.session.get(Agendamento, agendamento_id).data_agendamento
+            for hora, agendamento_id in ids.items() if db.session.get(Agendamento, agendamento_id)}
+
+
+def test_remarcacao_relata_conflitos_e_move_o_restante(app, novo_cliente, agenda):
+    relatorio = _operar(novo_cliente(), acao='remarcar', data_destino=DESTINO.isoformat())
+
+    assert sorted(p['id'] for p in relatorio['processados']) == [agenda[9], agenda[11]]
+    motivos = {c['id']: c['motivo'] for c in relatorio['conflitos']}
+    assert motivos[agenda[10]].endswith('já ocupado')
+    assert motivos[agenda[12]] == 'Status em_espera'
+
+    with app.app_context():
+        assert _horarios(agenda) == {9: datetime.combine(DESTINO, time(9)), 10: datetime.combine(ORIGEM, time(10)),
+                                     11: datetime.combine(DESTINO, time(11)), 12: datetime.combine(ORIGEM, time(12))}
+
+
+def test_simulacao_nao_altera_a_agenda(app, novo_cliente, agenda):
+    with app.app_context():
+        antes = _horarios(agenda)
+
+    relatorio = _operar(novo_cliente(), acao='remarcar', data_destino=DESTINO.isoformat(), simular=True)
+    assert relatorio['simulacao'] and len(relatorio['processados']) == 2
+
+    with app.app_context():
+        assert _horarios(agenda) == antes
+
+
+def test_cancelamento_preserva_agendamentos_com_historico(app, novo_cliente, agenda):
+    with app.app_context():
+        agendamento = db.session.get(Agendamento, agenda[11])
+        alterar_status(agendamento, 'em_espera')
+        alterar_status(agendamento, 'agendado')
+        db.session.commit()
+
+    relatorio = _operar(novo_cliente(), acao='cancelar')
+
+    assert sorted(p['id'] for p in relatorio['processados']) == [agenda[9], agenda[10]]
+    motivos = {c['id']: c['motivo'] for c in relatorio['conflitos']}
+    assert motivos[agenda[11]] == 'Possui histórico de mudanças de status'
+    with app.app_context():
+        assert sorted(_horarios(agenda)) == [11, 12]
+
+
+def test_remarcacao_sem_destino_e_recusada(novo_cliente):
+    resposta = novo_cliente().post('/agendamento/api/agenda-em-lote',
+                                   json={'acao': 'remarcar', 'data_origem': ORIGEM.isoformat()})
+    assert resposta.status_code == 400
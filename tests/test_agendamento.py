@@ -0,0 +1,164 @@
+"""
+Testes do agendamento: concorrência no mesmo horário, quantidade de
+comandos SQL por agendamento e o índice único que protege os horários
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+from models.models import db, Agendamento, Paciente, Profissional
+from utils.agendamento_helpers import agendar_paciente, alterar_status
+from utils.db_helpers import criar_indices_faltantes
+
+RECEPCOES_SIMULTANEAS = 8
+SERVICO = 'Consulta Médica'
+COMANDOS_AUTENTICACAO = 3
+COMANDOS_AGENDAMENTO = 4
+
+
+def _proximo_dia_util(dias: int) -> datetime:
+    # Domingo passa para segunda: use deslocamentos com pelo menos 2 dias de distância
+    dia = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=dias)
+    while dia.weekday() == 6:
+        dia += timedelta(days=1)
+    return dia
+
+
+def _formulario(n: int, horario: datetime) -> dict:
+    return {
+        'nome_paciente': f'Paciente Concorrente {n}',
+        'telefone': f'(11) 98888-{n:04d}',
+        'cpf_paciente': f'{n:011d}',
+        'data_agendamento': horario.strftime('%Y-%m-%dT%H:%M'),
+        'servico': SERVICO
+    }
+
+
+def test_mesmo_horario_concorrente_tem_um_vencedor(app, novo_cliente):
+    horario = _proximo_dia_util(30)
+    clientes = [novo_cliente() for _ in range(RECEPCOES_SIMULTANEAS)]
+    largada = threading.Barrier(RECEPCOES_SIMULTANEAS)
+
+    def agendar(n):
+        largada.wait()
+        resposta = clientes[n].post('/agendamento/agendar', data=_formulario(n + 1, horario))
+        assert resposta.status_code == 302
+        return resposta.headers['Location']
+
+    with ThreadPoolExecutor(max_workers=RECEPCOES_SIMULTANEAS) as executor:
+        destinos = list(executor.map(agendar, range(RECEPCOES_SIMULTANEAS)))
+
+    # Sucesso volta para a lista; conflito volta para o formulário
+    assert sum(destino.endswith('/agendamento/lista') for destino in destinos) == 1
+    assert sum(destino.endswith('/agendamento/agendar') for destino in destinos) == RECEPCOES_SIMULTANEAS - 1
+
+    with app.app_context():
+        assert Agendamento.query.filter_by(data_agendamento=horario, servico=SERVICO).count() == 1
+
+
+@contextmanager
+def _contar_comandos():
+    comandos = []
+
+    def registrar(conexao, cursor, sql, parametros, contexto, executemany):
+        comandos.append(sql)
+
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        yield comandos
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+
+
+@pytest.mark.parametrize('paciente_existente', [False, True])
+def test_agendamento_executa_comandos_previstos(app, paciente_existente):
+    dados = {'nome': 'Paciente Orçamento SQL', 'cpf': '123.456.789-09', 'telefone': '(11) 97777-0000'}
+
+    with app.app_context():
+        if paciente_existente:
+            agendar_paciente(dict(dados), _proximo_dia_util(40), SERVICO)
+
+        with _contar_comandos() as comandos:
+            agendar_paciente(dict(dados, telefone='(11) 97777-1111'), _proximo_dia_util(42 + 2 * paciente_existente), SERVICO)
+
+    # Profissional e paciente: uma busca cada; gravação do paciente e do agendamento
+    tipos = [sql.split(None, 1)[0].upper() for sql in comandos]
+    assert tipos == ['SELECT', 'SELECT', 'UPDATE' if paciente_existente else 'INSERT', 'INSERT'], comandos
+    assert not any('count(' in sql.lower() for sql in comandos)
+
+
+def test_rota_agendar_respeita_orcamento_de_comandos(app, novo_cliente):
+    cliente = novo_cliente()
+    formulario = _formulario(9001, _proximo_dia_util(50))
+
+    with app.app_context():
+        with _contar_comandos() as comandos:
+            resposta = cliente.post('/agendamento/agendar', data=formulario)
+
+    assert resposta.status_code == 302
+    assert resposta.headers['Location'].endswith('/agendamento/lista')
+    # Validação da sessão (sessão, usuário e último acesso, uma vez por requisição) + agendamento
+    assert len(comandos) <= COMANDOS_AUTENTICACAO + COMANDOS_AGENDAMENTO, comandos
+
+
+def _agendamento_direto(horario: datetime, status: str = 'agendado') -> Agendamento:
+    agendamento = Agendamento(paciente_id=Paciente.query.first().id, profissional_id=Profissional.query.first().id,
+                              data_agendamento=horario, servico=SERVICO, status=status)
+    db.session.add(agendamento)
+    db.session.commit()
+    return agendamento
+
+
+def test_falta_e_cancelamento_liberam_o_horario(app, novo_cliente):
+    horario = _proximo_dia_util(60)
+    with app.app_context():
+        faltou = _agendamento_direto(horario, status='faltou')
+        agendamento = _agendamento_direto(horario)
+        assert faltou.id != agendamento.id
+
+        # Cancelar não é um status: o agendamento é excluído
+        with pytest.raises(ValueError):
+            alterar_status(agendamento, 'cancelado')
+        db.session.rollback()
+        with pytest.raises(IntegrityError):
+            _agendamento_direto(horario)
+        db.session.rollback()
+        agendamento_id = agendamento.id
+
+    novo_cliente().post(f'/agendamento/excluir/{agendamento_id}')
+
+    with app.app_context():
+        assert _agendamento_direto(horario).id
+
+
+def test_init_db_falha_com_horarios_duplicados(app):
+    horario = _proximo_dia_util(62)
+    with app.app_context():
+        db.session.execute(text('DROP INDEX ux_agendamentos_horario_servico'))
+        db.session.commit()
+        ids = [_agendamento_direto(horario).id for _ in range(2)]
+
+        with pytest.raises(RuntimeError, match=f'{ids[0]}, {ids[1]}'):
+            criar_indices_faltantes()
+
+        db.session.delete(db.session.get(Agendamento, ids[1]))
+        db.session.commit()
+        criar_indices_faltantes()
+        with pytest.raises(IntegrityError):
+            _agendamento_direto(horario)
+        db.session.rollback()
+
+
+def test_log_do_agendamento_nao_expoe_dados_do_paciente(app, caplog):
+    dados = {'nome': 'Paciente Log Sigiloso', 'cpf': '987.654.321-00', 'telefone': '(11) 96666-0000'}
+    with app.app_context(), caplog.at_level(logging.DEBUG, logger='utils.agendamento_helpers'):
+        agendar_paciente(dict(dados), _proximo_dia_util(64), SERVICO)
+
+    assert 'Novo paciente' in caplog.text
+    assert dados['nome'] not in caplog.text
+    assert '98765432100' not in caplog.text and dados['cpf'] not in caplog.text
@@ -0,0 +1,100 @@
+"""
+Testes dos arquivos estáticos versionados e dos templates pré-compilados:
+nomes com o hash do conteúdo, manifesto usado pelo url_for('static'), cache
+imutável só para as cópias versionadas e cache de bytecode do Jinja em disco
+"""
+
+import os
+from flask import Flask, render_template_string, url_for
+import pytest
+from utils.assets_helpers import (construir_assets, configurar_assets, aquecer_templates, CACHE_IMUTAVEL,
+                                  PASTA_VERSIONADA)
+
+CSS = '/* estilos da clínica */\nbody {\n    margin: 0;\n    color: #333333;\n}\n'
+JS = '// comentário removido no build\nfunction saudacao(nome) {\n    return "Olá, " + nome;\n}\n'
+
+
+def _escrever(caminho, conteudo):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    modo = 'wb' if isinstance(conteudo, bytes) else 'w'
+    with open(caminho, modo) as arquivo:
+        arquivo.write(conteudo)
+
+
+@pytest.fixture
+def pasta_static(tmp_path):
+    static = tmp_path / 'static'
+    _escrever(str(static / 'css' / 'style.css'), CSS)
+    _escrever(str(static / 'js' / 'app.js'), JS)
+    _escrever(str(static / 'img' / 'logo.png'), b'\x89PNG\r\n\x1a\n' + bytes(range(64)))
+    return static
+
+
+def _aplicacao(pasta_static, debug=False) -> Flask:
+    aplicacao = Flask(__name__, static_folder=str(pasta_static),
+                      template_folder=str(pasta_static.parent / 'templates'))
+    aplicacao.debug = debug
+    configurar_assets(aplicacao)
+    return aplicacao
+
+
+def test_build_versiona_e_minifica(pasta_static):
+    tamanhos = construir_assets(str(pasta_static))
+    manifesto = _aplicacao(pasta_static).extensions['assets_manifesto']
+
+    assert set(manifesto) == {'css/style.css', 'js/app.js', 'img/logo.png'}
+    assert all(os.path.exists(pasta_static / caminho) for caminho in manifesto.values())
+    assert manifesto['css/style.css'].startswith(f'{PASTA_VERSIONADA}/css/style.')
+    assert tamanhos['css/style.css'][1] < tamanhos['css/style.css'][0]
+    assert tamanhos['js/app.js'][1] < tamanhos['js/app.js'][0]
+    assert tamanhos['img/logo.png'][0] == tamanhos['img/logo.png'][1]
+
+
+def test_novo_build_troca_o_nome_so_do_que_mudou(pasta_static):
+    construir_assets(str(pasta_static))
+    antes = _aplicacao(pasta_static).extensions['assets_manifesto']
+
+    _escrever(str(pasta_static / 'css' / 'style.css'), CSS + 'h1 { font-size: 2em; }\n')
+    construir_assets(str(pasta_static))
+    depois = _aplicacao(pasta_static).extensions['assets_manifesto']
+
+    assert depois['css/style.css'] != antes['css/style.css']
+    assert depois['js/app.js'] == antes['js/app.js']
+    # A pasta versionada não entra no próprio build nem guarda versões antigas
+    assert not os.path.exists(pasta_static / antes['css/style.css'])
+    assert not any(caminho.startswith(f'{PASTA_VERSIONADA}/{PASTA_VERSIONADA}') for caminho in depois.values())
+
+
+def test_url_for_aponta_para_a_copia_com_cache_imutavel(pasta_static):
+    construir_assets(str(pasta_static))
+    aplicacao = _aplicacao(pasta_static)
+    versionado = aplicacao.extensions['assets_manifesto']['css/style.css']
+
+    with aplicacao.test_request_context():
+        assert url_for('static', filename='css/style.css') == f'/static/{versionado}'
+
+    cliente = aplicacao.test_client()
+    resposta = cliente.get(f'/static/{versionado}')
+    assert resposta.status_code == 200
+    assert resposta.cache_control.max_age == CACHE_IMUTAVEL and resposta.cache_control.immutable
+
+    original = cliente.get('/static/css/style.css')
+    assert original.status_code == 200 and not original.cache_control.immutable
+
+
+def test_modo_debug_serve_os_originais(pasta_static):
+    construir_assets(str(pasta_static))
+    with _aplicacao(pasta_static, debug=True).test_request_context():
+        assert url_for('static', filename='css/style.css') == '/static/css/style.css'
+
+
+def test_templates_compilados_ficam_em_cache_no_disco(pasta_static, tmp_path):
+    _escrever(str(tmp_path / 'templates' / 'pagina.html'), '<p>{{ nome }}</p>')
+    _escrever(str(tmp_path / 'templates' / 'base' / 'layout.html'), '<main>{% block conteudo %}{% endblock %}</main>')
+    aplicacao = _aplicacao(pasta_static)
+
+    assert aquecer_templates(aplicacao, str(tmp_path / 'jinja')) == 2
+    assert len(os.listdir(tmp_path / 'jinja')) == 2
+
+    with aplicacao.app_context():
+        assert render_template_string('{% include "pagina.html" %}', nome='Clined') == '<p>Clined</p>'
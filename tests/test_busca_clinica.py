@@ -0,0 +1,84 @@
+"""
+Testes da busca textual em prontuários e receituários: prefixos, todos os
+termos obrigatórios, índice mantido pelo banco a cada gravação e texto
+digitado que nunca chega cru ao MATCH. Os testes rodam no SQLite; no
+PostgreSQL a mesma indiferença a acentos vem da configuração pt_unaccent,
+conferida aqui nas consultas geradas
+"""
+
+import re
+import pytest
+from models.models import db, Paciente, Prontuario, Receituario
+from utils.db_helpers import CONFIGURACAO_BUSCA_POSTGRES, documento_busca_postgres
+from utils.prontuario_helpers import _busca_postgres
+
+USUARIO_MEDICO = ('darlan@clined.com.br', 'medico123')
+
+
+@pytest.fixture(scope='module')
+def registros(app):
+    with app.app_context():
+        paciente = Paciente(nome='Paciente Busca Clínica', telefone='(11) 96666-0000')
+        db.session.add(paciente)
+        db.session.flush()
+        prontuario = Prontuario(paciente_id=paciente.id, queixa_principal='Dor torácica xerofílica',
+                                diagnostico='Angina zetálgica estável')
+        db.session.add(prontuario)
+        db.session.flush()
+        receituario = Receituario(paciente_id=paciente.id, prontuario_id=prontuario.id,
+                                  medicamentos='Zetacilina 500mg de 8/8h')
+        db.session.add(receituario)
+        db.session.commit()
+        return {'prontuario': prontuario.id, 'receituario': receituario.id}
+
+
+def _buscar(cliente, q, **parametros):
+    return cliente.get('/prontuario/api/busca', query_string={'q': q, **parametros})
+
+
+def _encontrados(resposta) -> set:
+    assert resposta.status_code == 200
+    return {(r['tipo'], r['id']) for r in resposta.get_json()['resultados']}
+
+
+def test_busca_por_prefixo_sem_acento(novo_cliente, registros):
+    cliente = novo_cliente(*USUARIO_MEDICO)
+    assert _encontrados(_buscar(cliente, 'zetac')) == {('receituario', registros['receituario'])}
+    assert _encontrados(_buscar(cliente, 'ZETALGICA')) == {('prontuario', registros['prontuario'])}
+
+
+def test_busca_exige_todos_os_termos(novo_cliente, registros):
+    cliente = novo_cliente(*USUARIO_MEDICO)
+    assert _encontrados(_buscar(cliente, 'angina xerofilica')) == {('prontuario', registros['prontuario'])}
+    assert _encontrados(_buscar(cliente, 'angina zetacilina')) == set()
+
+
+def test_indice_acompanha_alteracao_do_prontuario(app, novo_cliente, registros):
+    with app.app_context():
+        db.session.get(Prontuario, registros['prontuario']).diagnostico = 'Arritmia quimérica'
+        db.session.commit()
+
+    cliente = novo_cliente(*USUARIO_MEDICO)
+    assert _encontrados(_buscar(cliente, 'zetalgica')) == set()
+    assert _encontrados(_buscar(cliente, 'quimerica')) == {('prontuario', registros['prontuario'])}
+
+
+@pytest.mark.parametrize('q', ['"zetacilina', 'zetacilina*)', '(zetacilina:', "zetacilina'; --", 'zetacilina & !'])
+def test_operadores_digitados_sao_ignorados(novo_cliente, registros, q):
+    assert _encontrados(_buscar(novo_cliente(*USUARIO_MEDICO), q)) == {('receituario', registros['receituario'])}
+
+
+def test_palavras_de_operador_sao_termos_comuns(novo_cliente, registros):
+    # "OR" é procurado como palavra, não une as duas buscas
+    assert _encontrados(_buscar(novo_cliente(*USUARIO_MEDICO), 'zetacilina OR angina')) == set()
+
+
+def test_busca_vazia_e_acesso_restrito(novo_cliente, registros):
+    assert _buscar(novo_cliente(*USUARIO_MEDICO), ' ?! ').status_code == 400
+    assert _buscar(novo_cliente(), 'zetacilina').status_code == 302
+
+
+def test_busca_postgres_usa_a_configuracao_sem_acentos():
+    sql = _busca_postgres() + documento_busca_postgres('prontuarios')
+    configuracoes = re.findall(r"(?:to_tsvector|to_tsquery|ts_headline)\('(\w+)'", sql)
+    assert set(configuracoes) == {CONFIGURACAO_BUSCA_POSTGRES} == {'pt_unaccent'}
@@ -0,0 +1,64 @@
+"""
+Testes do CID-10 nos atestados: a gravação confere só o formato (o catálogo
+do sistema é um recorte) e o catálogo não aceita subcategorias inexistentes
+"""
+
+import pytest
+from models.models import db, Atestado, Paciente, Prontuario
+from utils.cid_helpers import validar_cid, cid_catalogado
+
+USUARIO_MEDICO = ('darlan@clined.com.br', 'medico123')
+
+
+@pytest.fixture
+def prontuario_id(app):
+    with app.app_context():
+        prontuario = Prontuario(paciente_id=Paciente.query.first().id, diagnostico='Teste CID')
+        db.session.add(prontuario)
+        db.session.commit()
+        return prontuario.id
+
+
+@pytest.mark.parametrize('valor, esperado', [
+    ('O80', 'O80'), ('z32', 'Z32'), ('S62.6', 'S62.6'), ('s626', 'S62.6'), (' f32.1 ', 'F32.1'), ('', '')
+])
+def test_validar_cid_aceita_formato_valido(valor, esperado):
+    assert validar_cid(valor) == esperado
+
+
+@pytest.mark.parametrize('valor', ['F3', 'FF32', '32F', 'F32.12', 'F-32'])
+def test_validar_cid_rejeita_formato_invalido(valor):
+    with pytest.raises(ValueError):
+        validar_cid(valor)
+
+
+def test_catalogo_nao_aceita_subcategoria_inexistente(app):
+    assert cid_catalogado('I10')
+    assert not cid_catalogado('I10.9')
+    assert not cid_catalogado('O80')
+
+
+def test_atestado_com_cid_fora_do_catalogo_e_salvo_com_aviso(app, novo_cliente, prontuario_id):
+    cliente = novo_cliente(*USUARIO_MEDICO)
+    resposta = cliente.post(f'/documentos/atestado/{prontuario_id}/salvar', data={
+        'cid': 's62.6', 'dias_afastamento': '3', 'data_inicio': '2026-01-05'
+    })
+    assert resposta.status_code == 302
+
+    with cliente.session_transaction() as sessao:
+        categorias = [categoria for categoria, _ in sessao.get('_flashes', [])]
+    assert categorias[-2:] == ['warning', 'success']
+
+    with app.app_context():
+        assert [a.cid for a in Atestado.query.filter_by(prontuario_id=prontuario_id)] == ['S62.6']
+
+
+def test_atestado_com_cid_mal_formado_nao_e_salvo(app, novo_cliente, prontuario_id):
+    cliente = novo_cliente(*USUARIO_MEDICO)
+    resposta = cliente.post(f'/documentos/atestado/{prontuario_id}/salvar', data={
+        'cid': 'XYZ', 'dias_afastamento': '3', 'data_inicio': '2026-01-05'
+    })
+    assert resposta.status_code == 302
+
+    with app.app_context():
+        assert Atestado.query.filter_by(prontuario_id=prontuario_id).count() == 0
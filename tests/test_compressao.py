@@ -0,0 +1,101 @@
+"""
+Testes da compressão das respostas e do GET condicional das APIs JSON:
+negociação brotli/gzip pelo Accept-Encoding, respostas que ficam de fora
+(pequenas, em streaming, arquivos e anexos) e 304 pelo ETag
+"""
+
+import gzip
+import io
+import brotli
+from flask import Flask, Response, jsonify, send_file
+import pytest
+from utils.compressao_helpers import configurar_compressao
+
+TAMANHO_MINIMO = 1024
+ITENS = [{'id': n, 'descricao': f'Consulta Médica {n}'} for n in range(200)]
+HTML = '<html><body>' + '<p>Agenda do dia</p>' * 200 + '</body></html>'
+
+
+@pytest.fixture
+def cliente():
+    aplicacao = Flask(__name__)
+    aplicacao.config['COMPRESSAO_TAMANHO_MINIMO'] = TAMANHO_MINIMO
+    configurar_compressao(aplicacao)
+
+    @aplicacao.route('/api/itens', methods=['GET', 'POST'])
+    def itens():
+        return jsonify({'itens': ITENS})
+
+    @aplicacao.route('/api/pequeno')
+    def pequeno():
+        return jsonify({'ok': True})
+
+    @aplicacao.route('/pagina')
+    def pagina():
+        return HTML
+
+    @aplicacao.route('/fluxo')
+    def fluxo():
+        return Response((f'{n}\n' for n in range(2000)), mimetype='text/plain')
+
+    @aplicacao.route('/arquivo')
+    def arquivo():
+        return send_file(io.BytesIO(HTML.encode('utf-8')), mimetype='text/html')
+
+    @aplicacao.route('/exportacao')
+    def exportacao():
+        return Response(HTML, mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=dados.csv'})
+
+    return aplicacao.test_client()
+
+
+@pytest.mark.parametrize('aceita, esperada', [
+    ('gzip, deflate, br', 'br'), ('gzip;q=1.0, br;q=0.5', 'gzip'), ('gzip', 'gzip'), ('identity', None), ('', None)
+])
+def test_negociacao_da_codificacao(cliente, aceita, esperada):
+    resposta = cliente.get('/pagina', headers={'Accept-Encoding': aceita})
+    assert resposta.headers.get('Content-Encoding') == esperada
+    assert 'Accept-Encoding' in resposta.headers['Vary']
+
+    corpo = resposta.get_data()
+    if esperada == 'br':
+        corpo = brotli.decompress(corpo)
+    elif esperada == 'gzip':
+        corpo = gzip.decompress(corpo)
+    assert corpo.decode('utf-8') == HTML
+    assert int(resposta.headers['Content-Length']) == len(resposta.get_data())
+
+
+@pytest.mark.parametrize('rota', ['/api/pequeno', '/fluxo', '/arquivo', '/exportacao'])
+def test_respostas_que_nao_sao_comprimidas(cliente, rota):
+    resposta = cliente.get(rota, headers={'Accept-Encoding': 'gzip, br'})
+    assert resposta.status_code == 200
+    assert 'Content-Encoding' not in resposta.headers
+
+
+def test_etag_do_json_responde_304_sem_corpo(cliente):
+    primeira = cliente.get('/api/itens', headers={'Accept-Encoding': 'gzip'})
+    etag = primeira.headers['ETag']
+    assert etag.startswith('W/')
+    assert gzip.decompress(primeira.get_data()).startswith(b'{')
+
+    # A ETag é a do conteúdo, não da codificação: vale para qualquer Accept-Encoding
+    assert cliente.get('/api/itens', headers={'Accept-Encoding': 'br'}).headers['ETag'] == etag
+
+    repetida = cliente.get('/api/itens', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+    assert repetida.status_code == 304
+    assert repetida.get_data() == b''
+    assert 'Content-Encoding' not in repetida.headers
+
+
+def test_etag_so_nas_leituras(cliente):
+    resposta = cliente.post('/api/itens', headers={'Accept-Encoding': 'gzip'})
+    assert 'ETag' not in resposta.headers
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+
+
+def test_paginas_da_aplicacao_comprimidas(app):
+    resposta = app.test_client().get('/auth/login', headers={'Accept-Encoding': 'gzip'})
+    assert resposta.status_code == 200
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    assert b'</html>' in gzip.decompress(resposta.get_data())
@@ -0,0 +1,152 @@
+"""
+Testes dos PDFs dos documentos médicos: geração no pool de processos, cache
+pelo hash do conteúdo (refeito quando o registro ou o paciente mudam),
+respostas condicionais pelo ETag e recibos do dia gerados em lote
+"""
+
+import glob
+import io
+import itertools
+import json
+import os
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+import pytest
+from pypdf import PdfReader
+from config import Config
+from models.models import db, Agendamento, ContaReceber, Paciente, Profissional, Receituario, Recibo
+from utils import documentos_helpers
+
+USUARIO_MEDICO = ('darlan@clined.com.br', 'medico123')
+
+
+@pytest.fixture(scope='module', autouse=True)
+def pool_documentos():
+    yield
+    documentos_helpers._descartar_pool()
+
+
+@pytest.fixture
+def receituario_id(app):
+    with app.app_context():
+        paciente = Paciente(nome='Paciente PDF', telefone='(11) 97777-0000')
+        db.session.add(paciente)
+        db.session.flush()
+        receituario = Receituario(paciente_id=paciente.id, medicamentos='Losartana 50mg')
+        db.session.add(receituario)
+        db.session.commit()
+        return receituario.id
+
+
+def _arquivos(receituario_id) -> list:
+    return glob.glob(os.path.join(Config.PDF_CACHE_DIR, f'receituario-{receituario_id}-*.pdf'))
+
+
+def _sem_renderizacao():
+    raise AssertionError('PDF em cache não deveria ser renderizado de novo')
+
+
+def test_pdf_gerado_uma_vez_e_reaproveitado(app, novo_cliente, receituario_id, monkeypatch):
+    cliente = novo_cliente(*USUARIO_MEDICO)
+    primeira = cliente.get(f'/documentos/pdf/receituario/{receituario_id}')
+    assert primeira.status_code == 200
+    assert primeira.mimetype == 'application/pdf'
+    assert primeira.get_data().startswith(b'%PDF')
+    assert len(_arquivos(receituario_id)) == 1
+
+    monkeypatch.setattr(documentos_helpers, '_pool_documentos', _sem_renderizacao)
+    segunda = cliente.get(f'/documentos/pdf/receituario/{receituario_id}')
+    assert segunda.get_data() == primeira.get_data()
+    assert segunda.headers['ETag'] == primeira.headers['ETag']
+
+    assert cliente.get(f'/documentos/pdf/receituario/{receituario_id}',
+                       headers={'If-None-Match': primeira.headers['ETag']}).status_code == 304
+
+
+def test_alteracao_do_registro_ou_do_paciente_refaz_o_pdf(app, novo_cliente, receituario_id):
+    cliente = novo_cliente(*USUARIO_MEDICO)
+    etags = [cliente.get(f'/documentos/pdf/receituario/{receituario_id}').headers['ETag']]
+    arquivo_original = _arquivos(receituario_id)
+
+    with app.app_context():
+        receituario = db.session.get(Receituario, receituario_id)
+        receituario.posologia = '1 comprimido ao dia'
+        db.session.commit()
+    etags.append(cliente.get(f'/documentos/pdf/receituario/{receituario_id}').headers['ETag'])
+
+    with app.app_context():
+        receituario = db.session.get(Receituario, receituario_id)
+        db.session.get(Paciente, receituario.paciente_id).nome = 'Paciente PDF Renomeado'
+        db.session.commit()
+    etags.append(cliente.get(f'/documentos/pdf/receituario/{receituario_id}').headers['ETag'])
+
+    assert len(set(etags)) == 3
+    # Só a versão atual fica em disco
+    arquivos = _arquivos(receituario_id)
+    assert len(arquivos) == 1 and arquivos != arquivo_original
+
+
+
+_dias_recibos = itertools.count()
+
+
+@pytest.fixture
+def atendimentos_do_dia(app):
+    """Três atendimentos finalizados em um dia exclusivo: dois pagos e um ainda sem pagamento"""
+    dia = date(2020, 11, 9) + timedelta(days=next(_dias_recibos))
+    with app.app_context():
+        paciente_id = Paciente.query.first().id
+        profissional_id = Profissional.query.first().id
+        ids = []
+        for hora, pago in ((9, True), (10, False), (11, True)):
+            agendamento = Agendamento(paciente_id=paciente_id, profissional_id=profissional_id,
+                                      data_agendamento=datetime.combine(dia, time(hora)),
+                                      servico='Consulta Médica', status='finalizado')
+            db.session.add(agendamento)
+            db.session.flush()
+            if pago:
+                db.session.add(ContaReceber(paciente_id=paciente_id, agendamento_id=agendamento.id,
+                                            descricao='Consulta', valor=Decimal('200.00'), data_vencimento=dia,
+                                            status='pago', forma_pagamento='PIX'))
+            ids.append(agendamento.id)
+        db.session.commit()
+        return dia, ids
+
+
+def _gerar_recibos(cliente, dia) -> list:
+    resposta = cliente.post('/documentos/recibos-do-dia', data={'data': dia.isoformat()})
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'application/x-ndjson'
+    return [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+
+
+def test_recibos_do_dia_criados_e_combinados_em_um_pdf(app, novo_cliente, atendimentos_do_dia):
+    dia, ids = atendimentos_do_dia
+    cliente = novo_cliente()
+    etapas = _gerar_recibos(cliente, dia)
+
+    assert etapas[1] == {'etapa': 'criados', 'criados': 2, 'sem_pagamento': [ids[1]]}
+    assert etapas[-1]['etapa'] == 'concluido' and etapas[-1]['total'] == 2
+    assert [e['concluidos'] for e in etapas if e['etapa'] == 'renderizando'] == [0, 1, 2]
+
+    pdf = cliente.get(etapas[-1]['url'])
+    assert pdf.status_code == 200
+    assert len(PdfReader(io.BytesIO(pdf.get_data())).pages) == 2
+
+    with app.app_context():
+        recibos = Recibo.query.filter(Recibo.agendamento_id.in_(ids)).all()
+        assert sorted(r.agendamento_id for r in recibos) == [ids[0], ids[2]]
+        assert len({r.numero_recibo for r in recibos}) == 2
+
+
+def test_nova_geracao_do_dia_reaproveita_recibos_e_pdfs(app, novo_cliente, atendimentos_do_dia, monkeypatch):
+    dia, ids = atendimentos_do_dia
+    cliente = novo_cliente()
+    _gerar_recibos(cliente, dia)
+
+    monkeypatch.setattr(documentos_helpers, '_pool_documentos', _sem_renderizacao)
+    etapas = _gerar_recibos(cliente, dia)
+    assert etapas[1]['criados'] == 0
+    assert [e['etapa'] for e in etapas] == ['criando', 'criados', 'renderizando', 'concluido']
+    with app.app_context():
+        assert Recibo.query.filter(Recibo.agendamento_id.in_(ids)).count() == 2
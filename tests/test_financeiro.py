@@ -0,0 +1,270 @@
+"""
+Testes do financeiro: contas vencidas (rotina diária e totais entre as
+execuções), paginação por cursor das listagens, exportações, cache da
+projeção de caixa e liquidação em lote
+"""
+
+import base64
+import csv
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import Session
+from models.models import db, ContaPagar, FluxoCaixa
+from utils import financeiro_helpers
+from utils.financeiro_helpers import (marcar_contas_vencidas, filtro_vencidas, filtrar_contas, projetar_fluxo_caixa,
+                                      liquidar_contas_em_lote)
+
+LIQUIDACOES_SIMULTANEAS = 4
+
+
+def _conta_pagar(fornecedor: str, valor, vencimento: date, status: str = 'pendente') -> ContaPagar:
+    conta = ContaPagar(fornecedor=fornecedor, descricao='Teste', valor=Decimal(valor),
+                       data_vencimento=vencimento, status=status)
+    db.session.add(conta)
+    db.session.commit()
+    return conta
+
+
+def test_pendente_vencida_conta_antes_da_rotina_diaria(app):
+    hoje = date.today()
+    with app.app_context():
+        ontem = _conta_pagar('Fornecedor Vencida', '10.00', hoje - timedelta(days=1))
+        _conta_pagar('Fornecedor Vencida', '20.00', hoje)
+        _conta_pagar('Fornecedor Vencida', '40.00', hoje - timedelta(days=5), status='pago')
+
+        def total_vencido():
+            return db.session.query(func.sum(ContaPagar.valor)).filter(
+                ContaPagar.fornecedor == 'Fornecedor Vencida', filtro_vencidas(ContaPagar, hoje)
+            ).scalar()
+
+        assert total_vencido() == Decimal('10.00')
+        assert [c.id for c in filtrar_contas(ContaPagar, status='vencido').filter_by(
+            fornecedor='Fornecedor Vencida')] == [ontem.id]
+
+        marcar_contas_vencidas(hoje)
+        db.session.refresh(ontem)
+        assert ontem.status == 'vencido'
+        assert total_vencido() == Decimal('10.00')
+
+
+def test_falha_na_rotina_encerra_o_comando_com_erro(app, monkeypatch, caplog):
+    def falhar():
+        raise RuntimeError('banco indisponível')
+
+    with app.app_context():
+        monkeypatch.setattr(db.session, 'commit', falhar)
+        resultado = app.test_cli_runner().invoke(args=['marcar-vencidas'])
+
+    assert resultado.exit_code != 0
+    assert 'banco indisponível' in resultado.output
+    assert 'Erro ao marcar contas vencidas' in caplog.text
+
+
+def _cursor(*partes) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(partes)).encode('utf-8')).decode('ascii')
+
+
+@pytest.fixture
+def contas_paginacao(app):
+    """Contas com valores repetidos em um período exclusivo; ids na ordem valor desc, id desc"""
+    vencimento = date(2031, 1, 15)
+    with app.app_context():
+        contas = [_conta_pagar('Fornecedor Paginação', valor, vencimento) for valor in ('10', '20', '20', '20', '30')]
+        ordem = sorted(contas, key=lambda c: (c.valor, c.id), reverse=True)
+        ids = [c.id for c in ordem]
+    yield ids
+    with app.app_context():
+        ContaPagar.query.filter(ContaPagar.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def _pagina(cliente, **parametros) -> dict:
+    parametros = dict({'data_inicio': '2031-01-01', 'data_fim': '2031-01-31', 'ordenar': 'valor',
+                       'direcao': 'desc', 'limite': 2}, **parametros)
+    resposta = cliente.get('/financeiro/api/contas-pagar', query_string=parametros)
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def test_paginacao_por_cursor_percorre_empates_sem_repetir(novo_cliente, contas_paginacao):
+    cliente = novo_cliente()
+    ids, cursor = [], None
+    while True:
+        pagina = _pagina(cliente, **({'cursor': cursor} if cursor else {}))
+        ids += [conta['id'] for conta in pagina['contas']]
+        cursor = pagina['proximo_cursor']
+        if not cursor:
+            break
+    assert ids == contas_paginacao
+
+
+@pytest.mark.parametrize('cursor', [
+    'nao-e-base64!!',
+    _cursor('abc', 1),
+    _cursor('NaN', 1),
+    _cursor('20', 'x'),
+    _cursor(1),
+    base64.urlsafe_b64encode(b'{"a": 1}').decode('ascii'),
+])
+def test_cursor_invalido_recomeca_da_primeira_pagina(novo_cliente, contas_paginacao, cursor):
+    pagina = _pagina(novo_cliente(), cursor=cursor)
+    assert [conta['id'] for conta in pagina['contas']] == contas_paginacao[:2]
+
+
+def _saida_no_dia(projecao: dict, dia: date) -> float:
+    return next(item['saidas'] for item in projecao['projecao'] if item['data'] == dia.strftime('%Y-%m-%d'))
+
+
+def test_projecao_em_cache_ate_alteracao_em_outro_worker(app):
+    hoje = date.today()
+    dia = hoje + timedelta(days=20)
+    with app.app_context():
+        primeira = projetar_fluxo_caixa(30, hoje)
+        assert projetar_fluxo_caixa(30, hoje) is primeira
+
+        # Outro worker: engine e sessão próprios, sem acesso ao cache deste processo
+        engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+        with Session(engine) as outra_sessao:
+            outra_sessao.add(ContaPagar(fornecedor='Fornecedor Projeção', descricao='Teste',
+                                        valor=Decimal('123.00'), data_vencimento=dia))
+            outra_sessao.commit()
+        engine.dispose()
+        db.session.commit()  # encerra a transação de leitura atual
+
+        segunda = projetar_fluxo_caixa(30, hoje)
+        assert segunda is not primeira
+        assert _saida_no_dia(segunda, dia) == _saida_no_dia(primeira, dia) + 123.0
+
+        # Liquidação em lote (UPDATE direto, sem flush do ORM) também invalida
+        conta = ContaPagar.query.filter_by(fornecedor='Fornecedor Projeção').one()
+        liquidar_contas_em_lote(ContaPagar, [conta.id])
+        assert _saida_no_dia(projetar_fluxo_caixa(30, hoje), dia) == _saida_no_dia(primeira, dia)
+
+
+def test_cache_da_projecao_guarda_so_a_data_base_mais_recente(app):
+    hoje = date.today()
+    with app.app_context():
+        for deslocamento in range(5):
+            for dias in (30, 60):
+                projetar_fluxo_caixa(dias, hoje + timedelta(days=deslocamento))
+
+        ultimo_dia = hoje + timedelta(days=4)
+        assert {dias: em_cache[0] for dias, em_cache in financeiro_helpers._cache_projecao.items()
+                if dias in (30, 60)} == {30: ultimo_dia, 60: ultimo_dia}
+        assert projetar_fluxo_caixa(30, ultimo_dia) is financeiro_helpers._cache_projecao[30][2]
+        assert projetar_fluxo_caixa(30, hoje)['data_base'] == hoje.strftime('%Y-%m-%d')
+
+
+@pytest.fixture
+def contas_exportacao(app):
+    """Contas a pagar em um período exclusivo, para conferir o conteúdo exportado"""
+    with app.app_context():
+        contas = [_conta_pagar('Fornecedor Exportação', valor, date(2032, 3, dia))
+                  for valor, dia in (('1500.50', 10), ('89.90', 20))]
+        ids = [c.id for c in contas]
+    yield ids
+    with app.app_context():
+        ContaPagar.query.filter(ContaPagar.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def test_exportacao_csv_transmitida_com_filtro_de_periodo(novo_cliente, contas_exportacao):
+    resposta = novo_cliente().get('/financeiro/export/contas_pagar.csv',
+                                  query_string={'data_inicio': '2032-03-01', 'data_fim': '2032-03-15'})
+    assert resposta.status_code == 200
+    assert resposta.is_streamed
+    assert 'attachment' in resposta.headers['Content-Disposition']
+
+    linhas = list(csv.reader(io.StringIO(resposta.get_data(as_text=True).lstrip('﻿')), delimiter=';'))
+    assert linhas[0][:2] == ['ID', 'Fornecedor']
+    assert [linha[0] for linha in linhas[1:]] == [str(contas_exportacao[0])]
+    assert '1500,50' in linhas[1] and '10/03/2032' in linhas[1]
+
+
+def test_exportacao_xlsx_tem_as_mesmas_linhas(novo_cliente, contas_exportacao):
+    resposta = novo_cliente().get('/financeiro/export/contas_pagar.xlsx',
+                                  query_string={'data_inicio': '2032-03-01', 'data_fim': '2032-03-31'})
+    assert resposta.status_code == 200
+
+    aba = load_workbook(io.BytesIO(resposta.get_data())).active
+    linhas = list(aba.iter_rows(values_only=True))
+    assert linhas[0][:2] == ('ID', 'Fornecedor')
+    assert [linha[0] for linha in linhas[1:]] == contas_exportacao
+    assert 89.9 in linhas[2]
+
+
+def _movimentos_de(ids: list) -> dict:
+    contagem = dict(db.session.query(FluxoCaixa.conta_pagar_id, func.count(FluxoCaixa.id)).filter(
+        FluxoCaixa.conta_pagar_id.in_(ids)
+    ).group_by(FluxoCaixa.conta_pagar_id).all())
+    return {conta_id: contagem.get(conta_id, 0) for conta_id in ids}
+
+
+def test_liquidacao_em_lote_idempotente(app, novo_cliente):
+    with app.app_context():
+        ids = [_conta_pagar('Fornecedor Liquidação', '50.00', date.today()).id for _ in range(3)]
+
+    cliente = novo_cliente()
+    primeira = cliente.post('/financeiro/api/liquidar-lote/pagar',
+                            json={'ids': ids + [999999], 'forma_pagamento': 'PIX'})
+    segunda = cliente.post('/financeiro/api/liquidar-lote/pagar', json={'ids': ids})
+
+    assert primeira.get_json()['liquidadas'] == 3
+    assert primeira.get_json()['resultados'][-1] == {'id': 999999, 'resultado': 'nao_encontrada'}
+    assert segunda.get_json()['liquidadas'] == 0
+    assert {r['resultado'] for r in segunda.get_json()['resultados']} == {'ja_pago'}
+    with app.app_context():
+        assert _movimentos_de(ids) == {conta_id: 1 for conta_id in ids}
+
+
+def test_liquidacoes_simultaneas_geram_um_movimento_por_conta(app, novo_cliente):
+    with app.app_context():
+        ids = [_conta_pagar('Fornecedor Liquidação Concorrente', '75.00', date.today()).id for _ in range(5)]
+
+    clientes = [novo_cliente() for _ in range(LIQUIDACOES_SIMULTANEAS)]
+    largada = threading.Barrier(LIQUIDACOES_SIMULTANEAS)
+
+    def liquidar(cliente):
+        largada.wait()
+        resposta = cliente.post('/financeiro/api/liquidar-lote/pagar', json={'ids': ids})
+        assert resposta.status_code == 200
+        return resposta.get_json()['resultados']
+
+    with ThreadPoolExecutor(max_workers=LIQUIDACOES_SIMULTANEAS) as executor:
+        resultados = [r for lote in executor.map(liquidar, clientes) for r in lote]
+
+    # Quem perdeu a corrida recebe o mesmo formato de quem chegou depois: ja_pago com a data
+    hoje = date.today().strftime('%Y-%m-%d')
+    assert sorted(r['id'] for r in resultados if r['resultado'] == 'liquidada') == ids
+    assert all(r == {'id': r['id'], 'resultado': 'ja_pago', 'data_pagamento': hoje}
+               for r in resultados if r['resultado'] != 'liquidada')
+    with app.app_context():
+        assert _movimentos_de(ids) == {conta_id: 1 for conta_id in ids}
+        assert {c.status for c in ContaPagar.query.filter(ContaPagar.id.in_(ids))} == {'pago'}
+
+
+def test_conta_paga_por_outra_liquidacao_volta_com_a_data_dela(app):
+    with app.app_context():
+        conta = _conta_pagar('Fornecedor Liquidação Perdida', '30.00', date.today())
+        assert conta.status == 'pendente'  # fica no mapa de identidade da sessão com o status antigo
+
+        # Outro worker liquida a conta entre a leitura e o UPDATE desta liquidação
+        engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+        with Session(engine) as outra_sessao:
+            paga_antes = outra_sessao.get(ContaPagar, conta.id)
+            paga_antes.status = 'pago'
+            paga_antes.data_pagamento = date(2030, 1, 2)
+            outra_sessao.commit()
+        engine.dispose()
+
+        assert liquidar_contas_em_lote(ContaPagar, [conta.id]) == [
+            {'id': conta.id, 'resultado': 'ja_pago', 'data_pagamento': '2030-01-02'}
+        ]
+        assert _movimentos_de([conta.id]) == {conta.id: 0}
@@ -0,0 +1,62 @@
+"""
+Benchmark da inicialização: import do app e create_app() em um interpretador
+novo, com o banco inacessível (o worker não pode depender dele para subir)
+Também pode ser executado direto: python tests/test_inicializacao.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BANCO_INACESSIVEL = 'sqlite:////pasta-inexistente-clined/banco.db'
+
+# Limites folgados para máquinas de CI; os valores medidos são impressos
+LIMITE_IMPORTACAO = 3.0
+LIMITE_CREATE_APP = 0.3
+
+_MEDICAO = """
+import json, time
+inicio = time.perf_counter()
+import app
+importacao = time.perf_counter() - inicio
+inicio = time.perf_counter()
+app.create_app()
+criacao = time.perf_counter() - inicio
+resposta = app.app.test_client().get('/saude')
+print(json.dumps({'importacao': importacao, 'create_app': criacao,
+                  'saude_status': resposta.status_code, 'saude': resposta.get_json()}))
+"""
+
+
+def medir_inicializacao() -> dict:
+    with tempfile.TemporaryDirectory() as pasta:
+        ambiente = dict(os.environ, DATABASE_URL=BANCO_INACESSIVEL, JINJA_CACHE_DIR=os.path.join(pasta, 'jinja'))
+        processo = subprocess.run([sys.executable, '-c', _MEDICAO], cwd=RAIZ, env=ambiente,
+                                  capture_output=True, text=True, timeout=60)
+    assert processo.returncode == 0, processo.stderr
+    return json.loads(processo.stdout.strip().splitlines()[-1])
+
+
+def test_inicializacao_sem_acesso_ao_banco():
+    medicao = medir_inicializacao()
+    print(f"\nimport app: {medicao['importacao']:.3f}s  create_app(): {medicao['create_app']:.3f}s")
+
+    assert medicao['importacao'] < LIMITE_IMPORTACAO
+    assert medicao['create_app'] < LIMITE_CREATE_APP
+
+    # Prontidão: 503 com motivo genérico, sem detalhes do banco
+    assert medicao['saude_status'] == 503
+    assert 'pasta-inexistente' not in json.dumps(medicao['saude'])
+
+
+def test_saude_com_banco_pronto(app):
+    assert app.test_client().get('/saude').get_json() == {'status': 'ok'}
+
+
+if __name__ == '__main__':
+    resultado = medir_inicializacao()
+    print(f"import app: {resultado['importacao']:.3f}s")
+    print(f"create_app(): {resultado['create_app']:.3f}s")
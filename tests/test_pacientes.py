@@ -0,0 +1,130 @@
+"""
+Testes do cadastro de pacientes: CPF e telefone normalizados na gravação,
+detecção de duplicados por chaves de bloqueio e mesclagem que transfere os
+registros para o cadastro mantido
+"""
+
+import itertools
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import pytest
+from sqlalchemy import insert
+from models.models import (db, Agendamento, ContaReceber, FatoReceita, LogAuditoria, Paciente, Profissional,
+                           Prontuario)
+from utils.pacientes_helpers import encontrar_duplicados, normalizar_identificadores_em_lote
+from utils.prontuario_helpers import indice_prontuarios
+
+USUARIO_ADMIN = ('admin@clined.com.br', 'admin123')
+SEQUENCIA = itertools.count()
+
+
+def test_identificadores_normalizados_na_gravacao(app):
+    with app.app_context():
+        paciente = Paciente(nome='Paciente Identificadores', cpf=' 390.533.447-05 ', telefone='11 3333 4444')
+        db.session.add(paciente)
+        db.session.commit()
+        assert (paciente.cpf, paciente.cpf_digitos) == ('390.533.447-05', '39053344705')
+        assert (paciente.telefone, paciente.telefone_digitos) == ('(11) 3333-4444', '1133334444')
+
+        paciente.telefone = '11987650000'
+        paciente.cpf = ''
+        db.session.commit()
+        assert (paciente.telefone, paciente.telefone_digitos) == ('(11) 98765-0000', '11987650000')
+        assert (paciente.cpf, paciente.cpf_digitos) == (None, None)
+
+
+def test_busca_por_cpf_em_qualquer_formatacao(app, novo_cliente):
+    with app.app_context():
+        db.session.add(Paciente(nome='Paciente Busca CPF', cpf='86288366757', telefone='(11) 92222-0000'))
+        db.session.commit()
+
+    cliente = novo_cliente()
+    for termo in ('862883', '862.883.667'):
+        pacientes = cliente.get('/agendamento/buscar-paciente', query_string={'termo': termo}).get_json()['pacientes']
+        assert [p['cpf'] for p in pacientes] == ['862.883.667-57']
+
+
+def test_normalizacao_em_lote_preserva_cpfs_duplicados_antigos(app):
+    with app.app_context():
+        # Cadastros antigos, gravados sem passar pelos eventos do mapeamento
+        ids = [db.session.execute(insert(Paciente).values(nome='Paciente Legado', cpf=cpf, telefone='1191111-0000')
+                                  .returning(Paciente.id)).scalar_one()
+               for cpf in ('714.602.380-01', '71460238001')]
+        db.session.commit()
+
+        assert normalizar_identificadores_em_lote(lote=1) >= 2
+        legados = [db.session.get(Paciente, paciente_id) for paciente_id in ids]
+        assert [p.cpf for p in legados] == ['714.602.380-01', '71460238001']
+        assert {p.cpf_digitos for p in legados} == {'71460238001'}
+        assert {p.telefone for p in legados} == {'(11) 91111-0000'}
+
+
+@pytest.fixture
+def duplicados(app):
+    """Mesmo paciente cadastrado duas vezes; o segundo cadastro tem CPF, e-mail e atendimentos"""
+    n = next(SEQUENCIA)
+    with app.app_context():
+        mantido = Paciente(nome='Joaquim Mesclagem Souza', telefone='(11) 94444-1234')
+        removido = Paciente(nome='Joaquím  Mesclagem Souza', telefone='11944441234', cpf=f'529982{n:05d}',
+                            email='joaquim@exemplo.com.br')
+        db.session.add_all([mantido, removido])
+        db.session.flush()
+
+        agendamento = Agendamento(paciente_id=removido.id, profissional_id=Profissional.query.first().id,
+                                  data_agendamento=datetime(2021, 8, 2, 9, 0) + timedelta(days=n),
+                                  servico='Consulta Médica', status='finalizado')
+        db.session.add(agendamento)
+        db.session.flush()
+        db.session.add_all([
+            Prontuario(paciente_id=removido.id, agendamento_id=agendamento.id, especialidade='Cardiologia'),
+            ContaReceber(paciente_id=removido.id, agendamento_id=agendamento.id, descricao='Consulta',
+                         valor=Decimal('150.00'), data_vencimento=date(2021, 8, 2))
+        ])
+        db.session.commit()
+        return mantido.id, removido.id
+
+
+def test_duplicado_encontrado_por_nome_e_telefone(app, duplicados):
+    with app.app_context():
+        pares = {(c['paciente_a']['id'], c['paciente_b']['id']): c['pontuacao'] for c in encontrar_duplicados()}
+    assert pares[duplicados] >= 0.75
+
+
+def test_cpfs_diferentes_nao_sao_duplicados(app):
+    with app.app_context():
+        db.session.add_all([Paciente(nome='Maria Homônima Lima', telefone='(11) 93333-0001', cpf='11144477735'),
+                            Paciente(nome='Maria Homônima Lima', telefone='(11) 93333-0001', cpf='52998224726')])
+        db.session.commit()
+        nomes = {c['paciente_a']['nome'] for c in encontrar_duplicados()}
+    assert 'Maria Homônima Lima' not in nomes
+
+
+def test_mesclagem_transfere_registros_e_completa_cadastro(app, novo_cliente, duplicados):
+    manter_id, remover_id = duplicados
+    with app.app_context():
+        removido_cpf = db.session.get(Paciente, remover_id).cpf_digitos
+        assert indice_prontuarios(manter_id)['total'] == 0
+
+    resposta = novo_cliente(*USUARIO_ADMIN).post('/admin/pacientes-duplicados/mesclar',
+                                                 data={'manter_id': manter_id, 'remover_id': remover_id})
+    assert resposta.status_code == 302
+
+    with app.app_context():
+        assert db.session.get(Paciente, remover_id) is None
+        mantido = db.session.get(Paciente, manter_id)
+        assert (mantido.cpf_digitos, mantido.email) == (removido_cpf, 'joaquim@exemplo.com.br')
+
+        for modelo in (Agendamento, Prontuario, ContaReceber, FatoReceita):
+            assert modelo.query.filter_by(paciente_id=remover_id).count() == 0
+            assert modelo.query.filter_by(paciente_id=manter_id).count() == 1
+        assert indice_prontuarios(manter_id)['total'] == 1
+
+        log = LogAuditoria.query.filter_by(acao='mesclar_pacientes', registro_id=manter_id).one()
+        assert str(remover_id) in log.dados_anteriores
+
+
+def test_mesclagem_exige_admin(app, novo_cliente, duplicados):
+    manter_id, remover_id = duplicados
+    novo_cliente().post('/admin/pacientes-duplicados/mesclar', data={'manter_id': manter_id, 'remover_id': remover_id})
+    with app.app_context():
+        assert db.session.get(Paciente, remover_id) is not None
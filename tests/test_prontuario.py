@@ -0,0 +1,124 @@
+"""
+Testes do prontuário: a tela carrega só o índice dos atendimentos e busca o
+conteúdo de cada um na API de detalhe; o índice em cache acompanha inclusões
+feitas em outros workers; a linha do tempo pagina por cursor com uma consulta
+por página
+"""
+
+from datetime import date, datetime
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+import pytest
+from models.models import db, Atestado, Paciente, Prontuario, Receituario, SolicitacaoExame
+from utils.prontuario_helpers import indice_prontuarios, linha_do_tempo
+
+QUEIXA = 'Queixa completa que só aparece no detalhe'
+
+
+@pytest.fixture
+def paciente_id(app):
+    with app.app_context():
+        paciente = Paciente(nome='Paciente Índice Prontuário', telefone='(11) 95555-0000')
+        db.session.add(paciente)
+        db.session.flush()
+        db.session.add(Prontuario(paciente_id=paciente.id, especialidade='Cardiologia', queixa_principal=QUEIXA,
+                                  diagnostico='Hipertensão essencial', profissional_nome='Dr. Teste'))
+        db.session.commit()
+        return paciente.id
+
+
+def test_tela_carrega_indice_e_detalhe_sob_demanda(app, novo_cliente, paciente_id):
+    cliente = novo_cliente()
+    pagina = cliente.get(f'/prontuario/ver/{paciente_id}').get_data(as_text=True)
+
+    with app.app_context():
+        prontuario_id = Prontuario.query.filter_by(paciente_id=paciente_id).one().id
+    assert f'data-prontuario-id="{prontuario_id}"' in pagina
+    assert 'Cardiologia' in pagina and 'Dr. Teste' in pagina
+    assert QUEIXA not in pagina
+
+    detalhe = cliente.get(f'/prontuario/api/prontuario/{prontuario_id}').get_json()
+    assert detalhe['queixa_principal'] == QUEIXA
+
+
+def test_indice_em_cache_acompanha_inclusao_em_outro_worker(app, paciente_id):
+    with app.app_context():
+        primeiro = indice_prontuarios(paciente_id)
+        assert primeiro['total'] == 1
+
+        engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+        with Session(engine) as outra_sessao:
+            outra_sessao.add(Prontuario(paciente_id=paciente_id, especialidade='Clínica Geral'))
+            outra_sessao.commit()
+        engine.dispose()
+        db.session.commit()
+
+        indice = indice_prontuarios(paciente_id)
+        assert indice['total'] == 2
+        assert [p['especialidade'] for p in indice['prontuarios']] == ['Clínica Geral', 'Cardiologia']
+
+
+@pytest.fixture
+def eventos_clinicos(app):
+    """Paciente com um evento de cada tipo; dois no mesmo instante para exercitar o desempate"""
+    with app.app_context():
+        paciente = Paciente(nome='Paciente Linha do Tempo', telefone='(11) 95555-1111')
+        db.session.add(paciente)
+        db.session.flush()
+        prontuario = Prontuario(paciente_id=paciente.id, especialidade='Cardiologia', diagnostico='D' * 500,
+                                data_atendimento=datetime(2022, 5, 10, 9, 0))
+        db.session.add(prontuario)
+        db.session.flush()
+        db.session.add_all([
+            Receituario(paciente_id=paciente.id, prontuario_id=prontuario.id, medicamentos='Losartana 50mg',
+                        data_emissao=datetime(2022, 5, 10, 9, 0)),
+            SolicitacaoExame(paciente_id=paciente.id, prontuario_id=prontuario.id, tipo_exame='Ecocardiograma',
+                             data_solicitacao=datetime(2022, 5, 11, 8, 0)),
+            Atestado(paciente_id=paciente.id, prontuario_id=prontuario.id, cid='I10', data_inicio=date(2022, 5, 12),
+                     data_emissao=datetime(2022, 5, 12, 8, 0))
+        ])
+        db.session.commit()
+        return paciente.id
+
+
+def test_linha_do_tempo_percorre_as_paginas_sem_repetir(app, novo_cliente, eventos_clinicos):
+    cliente = novo_cliente()
+    eventos, cursor = [], None
+    while True:
+        pagina = cliente.get(f'/prontuario/api/linha-do-tempo/{eventos_clinicos}',
+                             query_string={'limite': 1, **({'cursor': cursor} if cursor else {})}).get_json()
+        eventos += pagina['eventos']
+        cursor = pagina['proximo_cursor']
+        if not cursor:
+            break
+
+    assert [(e['tipo'], e['data']) for e in eventos] == [
+        ('atestado', '2022-05-12 08:00'), ('exame', '2022-05-11 08:00'),
+        ('receituario', '2022-05-10 09:00'), ('atendimento', '2022-05-10 09:00')
+    ]
+    assert len(eventos[-1]['resumo']) == 300
+
+
+def test_linha_do_tempo_usa_uma_consulta_por_pagina(app, eventos_clinicos):
+    comandos = []
+
+    def registrar(conexao, cursor, sql, parametros, contexto, executemany):
+        comandos.append(sql)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', registrar)
+        try:
+            eventos, cursor = linha_do_tempo(eventos_clinicos, limite=3)
+            linha_do_tempo(eventos_clinicos, limite=3, cursor=cursor)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', registrar)
+
+    assert len(eventos) == 3 and cursor
+    assert len(comandos) == 2
+
+
+def test_linha_do_tempo_com_cursor_invalido_recomeca(novo_cliente, eventos_clinicos):
+    pagina = novo_cliente().get(f'/prontuario/api/linha-do-tempo/{eventos_clinicos}',
+                                query_string={'limite': 2, 'cursor': 'nao-e-base64!!'})
+    assert pagina.status_code == 200
+    assert [e['tipo'] for e in pagina.get_json()['eventos']] == ['atestado', 'exame']
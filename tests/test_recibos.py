@@ -0,0 +1,85 @@
+"""
+Testes dos recibos: reemissão com novo número da sequência, mantendo um
+único recibo vigente por agendamento e sem abrir lacunas na numeração;
+recibo emitido só é corrigido por reemissão
+"""
+
+from datetime import datetime, timedelta
+from itertools import count
+import pytest
+from sqlalchemy.exc import IntegrityError
+from models.models import db, Agendamento, Paciente, Profissional, Recibo
+from utils.numeracao_helpers import auditoria_numeracao_recibos, numero_recibo
+
+USUARIO_ADMIN = ('admin@clined.com.br', 'admin123')
+_horarios = count()
+
+
+@pytest.fixture
+def agendamento_id(app):
+    with app.app_context():
+        agendamento = Agendamento(
+            paciente_id=Paciente.query.first().id,
+            profissional_id=Profissional.query.first().id,
+            data_agendamento=datetime.now().replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=3 + next(_horarios)),
+            servico='Consulta Médica',
+            status='finalizado'
+        )
+        db.session.add(agendamento)
+        db.session.commit()
+        return agendamento.id
+
+
+def test_reemissao_substitui_o_recibo_vigente(app, novo_cliente, agendamento_id):
+    cliente = novo_cliente(*USUARIO_ADMIN)
+    cliente.post(f'/documentos/recibo/{agendamento_id}/salvar', data={'valor': '100', 'forma_pagamento': 'PIX'})
+    for valor in ('120', '130'):
+        resposta = cliente.post(f'/documentos/recibo/{agendamento_id}/reemitir',
+                                data={'valor': valor, 'forma_pagamento': 'Dinheiro'})
+        assert resposta.status_code == 302
+
+    with app.app_context():
+        recibos = Recibo.query.filter_by(agendamento_id=agendamento_id).order_by(Recibo.id).all()
+        assert len(recibos) == 3
+        assert len({recibo.numero_recibo for recibo in recibos}) == 3
+        assert [recibo.substituido_em is None for recibo in recibos] == [False, False, True]
+        assert recibos[2].substitui_id == recibos[1].id and recibos[1].substitui_id == recibos[0].id
+        assert float(recibos[2].valor) == 130
+
+        # Os números substituídos continuam emitidos: nenhuma lacuna entre eles
+        auditoria = auditoria_numeracao_recibos()
+        numeros = sorted(int(recibo.numero_recibo[4:]) for recibo in recibos)
+        lacunas = [numero for bloco in auditoria['blocos'] for inicio, fim in bloco['lacunas']
+                   for numero in range(inicio, fim + 1)]
+        assert not set(numeros) & set(lacunas)
+        assert auditoria['substituidos'] >= 2
+
+        # Um único recibo vigente por agendamento
+        db.session.add(Recibo(paciente_id=recibos[2].paciente_id, agendamento_id=agendamento_id,
+                              descricao_servico='Consulta Médica', valor=1))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+def test_salvar_nao_altera_recibo_ja_emitido(app, novo_cliente, agendamento_id):
+    cliente = novo_cliente(*USUARIO_ADMIN)
+    cliente.post(f'/documentos/recibo/{agendamento_id}/salvar', data={'valor': '100', 'forma_pagamento': 'PIX'})
+    resposta = cliente.post(f'/documentos/recibo/{agendamento_id}/salvar',
+                            data={'valor': '999', 'forma_pagamento': 'Dinheiro'})
+    assert resposta.status_code == 302
+
+    with app.app_context():
+        recibo = Recibo.query.filter_by(agendamento_id=agendamento_id).one()
+        assert (float(recibo.valor), recibo.forma_pagamento) == (100, 'PIX')
+
+
+def test_numeracao_recusa_sessao_com_escrita_pendente_no_sqlite(app):
+    with app.app_context():
+        db.session.add(Paciente(nome='Paciente Trava Numeração', telefone='(11) 90000-0000'))
+        db.session.flush()
+        with pytest.raises(RuntimeError):
+            numero_recibo()
+        db.session.rollback()
+
+        assert numero_recibo().startswith('REC-')
@@ -0,0 +1,51 @@
+"""
+Testes dos relatórios: sincronia da FatoReceita com agendamentos e
+profissionais alterados depois da conta, e acesso aos relatórios operacionais
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+from models.models import db, Agendamento, ContaReceber, FatoReceita, Paciente, Profissional
+
+USUARIO_ADMIN = ('admin@clined.com.br', 'admin123')
+
+
+def test_fato_acompanha_agendamento_e_profissional(app):
+    with app.app_context():
+        original = Profissional.query.first()
+        outro = Profissional(nome='Dra. Teste Fato', especialidade='Cardiologia')
+        db.session.add(outro)
+        agendamento = Agendamento(paciente_id=Paciente.query.first().id, profissional_id=original.id,
+                                  data_agendamento=datetime(2020, 4, 6, 9, 0), servico='Consulta Médica',
+                                  status='finalizado')
+        db.session.add(agendamento)
+        db.session.flush()
+        conta = ContaReceber(paciente_id=agendamento.paciente_id, agendamento_id=agendamento.id,
+                             descricao='Consulta', valor=Decimal('200.00'), data_vencimento=date(2020, 4, 6))
+        db.session.add(conta)
+        db.session.commit()
+
+        fato = FatoReceita.query.filter_by(conta_receber_id=conta.id).one()
+        assert (fato.profissional_id, fato.servico) == (original.id, 'Consulta Médica')
+
+        agendamento.profissional_id = outro.id
+        agendamento.servico = 'Holter 24h'
+        db.session.commit()
+        db.session.refresh(fato)
+        assert (fato.profissional_id, fato.especialidade, fato.servico) == (outro.id, 'Cardiologia', 'Holter 24h')
+
+        outro.especialidade = 'Clínica Geral'
+        db.session.commit()
+        db.session.refresh(fato)
+        assert fato.especialidade == 'Clínica Geral'
+
+
+@pytest.mark.parametrize('rota', [
+    '/relatorios/servicos', '/relatorios/api/servicos', '/relatorios/faltas', '/relatorios/api/faltas',
+    '/relatorios/api/tempos-atendimento'
+])
+def test_relatorios_operacionais_exigem_admin(app, novo_cliente, rota):
+    assert app.test_client().get(rota).status_code == 302
+    assert novo_cliente().get(rota).status_code == 302
+    assert novo_cliente(*USUARIO_ADMIN).get(rota).status_code == 200
@@ -0,0 +1,80 @@
+"""
+Testes das séries de agendamentos recorrentes: datas da série, horários
+ocupados ou fora do expediente devolvidos como conflitos e simulação
+"""
+
+from datetime import datetime
+import pytest
+from models.models import db, Agendamento, Paciente, Profissional, SerieAgendamento
+from utils.agendamento_helpers import datas_da_serie
+
+SERVICO = 'Mapa Holter'
+INICIO = datetime(2034, 6, 5, 10, 0)  # segunda-feira
+
+
+def test_serie_mensal_usa_o_ultimo_dia_dos_meses_curtos():
+    assert datas_da_serie(datetime(2034, 1, 31, 9, 0), 'mensal', 4) == [
+        datetime(2034, 1, 31, 9, 0), datetime(2034, 2, 28, 9, 0),
+        datetime(2034, 3, 31, 9, 0), datetime(2034, 4, 30, 9, 0)
+    ]
+
+
+@pytest.mark.parametrize('frequencia, ocorrencias', [('diaria', 3), ('semanal', 0), ('semanal', 53)])
+def test_serie_invalida_e_recusada(frequencia, ocorrencias):
+    with pytest.raises(ValueError):
+        datas_da_serie(INICIO, frequencia, ocorrencias)
+
+
+@pytest.fixture
+def paciente_id(app):
+    with app.app_context():
+        paciente_id = Paciente.query.first().id
+        ocupado = Agendamento(paciente_id=paciente_id, profissional_id=Profissional.query.first().id,
+                              data_agendamento=datas_da_serie(INICIO, 'semanal', 2)[1], servico=SERVICO)
+        db.session.add(ocupado)
+        db.session.commit()
+    yield paciente_id
+    with app.app_context():
+        Agendamento.query.filter_by(servico=SERVICO).filter(
+            Agendamento.data_agendamento >= INICIO).delete(synchronize_session=False)
+        SerieAgendamento.query.filter_by(servico=SERVICO).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def _serie(cliente, paciente_id, inicio=INICIO, **dados):
+    dados = dict({'paciente_id': paciente_id, 'servico': SERVICO, 'frequencia': 'semanal', 'ocorrencias': 4,
+                  'data_agendamento': inicio.strftime('%Y-%m-%dT%H:%M')}, **dados)
+    return cliente.post('/agendamento/api/serie', json=dados)
+
+
+def test_serie_grava_os_horarios_livres_e_relata_os_ocupados(app, novo_cliente, paciente_id):
+    cliente = novo_cliente()
+    resposta = _serie(cliente, paciente_id)
+    assert resposta.status_code == 201
+
+    resultado = resposta.get_json()
+    assert resultado['agendados'] == ['2034-06-05 10:00', '2034-06-19 10:00', '2034-06-26 10:00']
+    assert resultado['conflitos'] == [{'data_agendamento': '2034-06-12 10:00', 'motivo': 'Horário ocupado'}]
+
+    serie = cliente.get(f"/agendamento/api/serie/{resultado['serie_id']}").get_json()
+    assert [o['data_agendamento'] for o in serie['ocorrencias']] == resultado['agendados']
+    assert {o['status'] for o in serie['ocorrencias']} == {'agendado'}
+
+
+def test_simulacao_e_serie_fora_do_expediente_nao_gravam(app, novo_cliente, paciente_id):
+    cliente = novo_cliente()
+    simulacao = _serie(cliente, paciente_id, simular=True)
+    assert simulacao.status_code == 200
+    assert simulacao.get_json()['serie_id'] is None and len(simulacao.get_json()['agendados']) == 3
+
+    noite = _serie(cliente, paciente_id, inicio=INICIO.replace(hour=21), ocorrencias=2).get_json()
+    assert noite['agendados'] == []
+    assert {c['motivo'] for c in noite['conflitos']} == {'Fora do expediente'}
+
+    with app.app_context():
+        assert SerieAgendamento.query.filter_by(servico=SERVICO).count() == 0
+        assert Agendamento.query.filter_by(servico=SERVICO).filter(Agendamento.data_agendamento >= INICIO).count() == 1
+
+
+def test_serie_com_servico_invalido_e_recusada(novo_cliente, paciente_id):
+    assert _serie(novo_cliente(), paciente_id, servico='Serviço Inexistente').status_code == 400
@@ -0,0 +1,88 @@
+"""
+Testes do histórico de status: as transições só aceitam inclusões, a
+exclusão avulsa respeita o histórico e as medianas de tempo de atendimento
+são calculadas no banco
+"""
+
+from datetime import date, datetime, timedelta
+import pytest
+from models.models import db, Agendamento, Paciente, Profissional, TransicaoStatusAgendamento
+from utils.agendamento_helpers import alterar_status
+from utils.relatorios_helpers import tempos_atendimento
+
+DIA = date(2020, 3, 2)
+
+
+def _agendamento(horario: datetime, status: str = 'agendado') -> Agendamento:
+    agendamento = Agendamento(
+        paciente_id=Paciente.query.first().id,
+        profissional_id=Profissional.query.first().id,
+        data_agendamento=horario,
+        servico='Consulta Médica',
+        status=status
+    )
+    db.session.add(agendamento)
+    db.session.flush()
+    return agendamento
+
+
+def test_exclusao_recusada_com_historico_de_status(app, novo_cliente):
+    with app.app_context():
+        agendamento = _agendamento(datetime.now().replace(microsecond=0) + timedelta(days=70))
+        alterar_status(agendamento, 'em_espera')
+        alterar_status(agendamento, 'agendado')
+        db.session.commit()
+        agendamento_id = agendamento.id
+
+    resposta = novo_cliente().post(f'/agendamento/excluir/{agendamento_id}')
+    assert resposta.status_code == 302
+
+    with app.app_context():
+        assert db.session.get(Agendamento, agendamento_id) is not None
+        assert TransicaoStatusAgendamento.query.filter_by(agendamento_id=agendamento_id).count() == 2
+
+
+def test_exclusao_sem_historico_libera_o_horario(app, novo_cliente):
+    with app.app_context():
+        agendamento_id = _agendamento(datetime.now().replace(microsecond=0) + timedelta(days=71)).id
+        db.session.commit()
+
+    novo_cliente().post(f'/agendamento/excluir/{agendamento_id}')
+
+    with app.app_context():
+        assert db.session.get(Agendamento, agendamento_id) is None
+
+
+def test_transicao_nao_pode_ser_alterada(app):
+    with app.app_context():
+        agendamento = _agendamento(datetime.now().replace(microsecond=0) + timedelta(days=72))
+        alterar_status(agendamento, 'faltou')
+        db.session.commit()
+
+        transicao = TransicaoStatusAgendamento.query.filter_by(agendamento_id=agendamento.id).one()
+        transicao.status_novo = 'finalizado'
+        with pytest.raises(ValueError):
+            db.session.commit()
+        db.session.rollback()
+
+
+def test_medianas_de_espera_e_consulta_por_dia(app):
+    # (espera, duração) em minutos; o último não passou pelo check-in
+    tempos = [(5, 10), (15, 40), (None, 20)]
+
+    with app.app_context():
+        for n, (espera, duracao) in enumerate(tempos):
+            inicio = datetime.combine(DIA, datetime.min.time()) + timedelta(hours=9 + n)
+            agendamento = _agendamento(inicio)
+            if espera is not None:
+                alterar_status(agendamento, 'em_espera', momento=inicio - timedelta(minutes=espera))
+            alterar_status(agendamento, 'em_atendimento', momento=inicio)
+            alterar_status(agendamento, 'finalizado', momento=inicio + timedelta(minutes=duracao))
+        db.session.commit()
+
+        assert tempos_atendimento(DIA, DIA) == [{
+            'dia': DIA.strftime('%Y-%m-%d'),
+            'finalizados': 3,
+            'espera_mediana_minutos': 10.0,
+            'consulta_mediana_minutos': 20.0
+        }]
@@ -0,0 +1,362 @@
+"""
+Rotinas de apoio ao Módulo 1 - Agendamento e Atendimento
+"""
+
+import calendar
+import logging
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import event, select, union, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from config import Config
+from models.models import (db, Agendamento, Paciente, Profissional, SerieAgendamento, TransicaoStatusAgendamento,
+                           Prontuario, ContaReceber, Recibo, SolicitacaoExame, AvaliacaoSatisfacao)
+from utils.pacientes_helpers import somente_digitos
+
+logger = logging.getLogger(__name__)
+
+STATUS_AGENDAMENTO = ('agendado', 'em_espera', 'em_atendimento', 'finalizado', 'faltou')
+
+
+def alterar_status(agendamento, novo_status: str, usuario_id: int = None, momento: datetime = None):
+    """
+    Muda o status do agendamento e registra a transição na mesma sessão,
+    de modo que as duas alterações sejam gravadas no mesmo commit.
+    O check-in (em_espera) também preenche data_checkin.
+    """
+    if novo_status not in STATUS_AGENDAMENTO:
+        raise ValueError(f'Status inválido: {novo_status}')
+
+    momento = momento or datetime.now()
+    status_anterior = agendamento.status
+
+    agendamento.status = novo_status
+    if novo_status == 'em_espera':
+        agendamento.data_checkin = momento
+
+    db.session.add(TransicaoStatusAgendamento(
+        agendamento_id=agendamento.id,
+        status_anterior=status_anterior,
+        status_novo=novo_status,
+        data_transicao=momento,
+        usuario_id=usuario_id
+    ))
+
+
+@event.listens_for(TransicaoStatusAgendamento, 'before_update')
+@event.listens_for(TransicaoStatusAgendamento, 'before_delete')
+def _bloquear_alteracao_transicao(mapper, connection, transicao):
+    # O histórico de transições só aceita inclusões
+    raise ValueError('Transições de status não podem ser alteradas nem excluídas')
+
+
+# ========== OPERAÇÕES EM LOTE NA AGENDA ==========
+
+def _agendamentos_com_vinculos(ids: list) -> set:
+    """Ids (dentre os informados) que já têm prontuário, conta, recibo, exame ou avaliação"""
+    if not ids:
+        return set()
+
+    consultas = [
+        select(modelo.agendamento_id).where(modelo.agendamento_id.in_(ids))
+        for modelo in (Prontuario, ContaReceber, Recibo, SolicitacaoExame, AvaliacaoSatisfacao)
+    ]
+    return set(db.session.execute(union(*consultas)).scalars())
+
+
+def _agendamentos_com_transicoes(ids: list) -> set:
+    """Ids (dentre os informados) com transições de status registradas"""
+    if not ids:
+        return set()
+    return set(db.session.execute(
+        select(TransicaoStatusAgendamento.agendamento_id)
+        .where(TransicaoStatusAgendamento.agendamento_id.in_(ids)).distinct()
+    ).scalars())
+
+
+def operar_agenda_em_lote(acao: str, data_origem: date, hora_inicio: time, hora_fim: time,
+                          servico: str = None, data_destino: date = None, simular: bool = False) -> dict:
+    """
+    Remarca para outro dia (mantendo o horário) ou cancela todos os agendamentos
+    de um intervalo de horário em uma data, opcionalmente de um único serviço.
+
+    Só agendamentos ainda com status 'agendado' são tratados. A ocupação do dia
+    de destino é lida em uma única consulta; os agendamentos sem conflito são
+    alterados em uma única transação e os demais voltam no relatório.
+    A remarcação recusa horários fora do expediente, como nas séries.
+    O cancelamento exclui o agendamento, como em excluir_agendamento, e é
+    recusado para os que já têm prontuário, lançamentos vinculados ou
+    histórico de status (as transições só aceitam inclusões).
+    """
+    if acao not in ('remarcar', 'cancelar'):
+        raise ValueError('Ação inválida')
+    if acao == 'remarcar' and not data_destino:
+        raise ValueError('Informe a data de destino')
+
+    query = Agendamento.query.options(joinedload(Agendamento.paciente_ref)).filter(
+        Agendamento.data_agendamento >= datetime.combine(data_origem, hora_inicio),
+        Agendamento.data_agendamento <= datetime.combine(data_origem, hora_fim)
+    )
+    if servico:
+        query = query.filter(Agendamento.servico == servico)
+    agendamentos = query.order_by(Agendamento.data_agendamento).all()
+
+    relatorio = {'acao': acao, 'processados': [], 'conflitos': [], 'simulacao': simular}
+
+    def conflito(agendamento, motivo):
+        relatorio['conflitos'].append({
+            'id': agendamento.id,
+            'paciente': agendamento.paciente_ref.nome,
+            'data_agendamento': agendamento.data_agendamento.strftime('%Y-%m-%d %H:%M'),
+            'servico': agendamento.servico,
+            'motivo': motivo
+        })
+
+    candidatos = []
+    for agendamento in agendamentos:
+        if agendamento.status != 'agendado':
+            conflito(agendamento, f'Status {agendamento.status}')
+        else:
+            candidatos.append(agendamento)
+
+    if acao == 'remarcar':
+        deslocamento = data_destino - data_origem
+        ids = [a.id for a in candidatos]
+        ocupados = set(db.session.query(Agendamento.data_agendamento, Agendamento.servico).filter(
+            Agendamento.data_agendamento >= datetime.combine(data_destino, datetime.min.time()),
+            Agendamento.data_agendamento < datetime.combine(data_destino + timedelta(days=1), datetime.min.time()),
+            Agendamento.id.notin_(ids),
+            Agendamento.status != 'faltou'
+        ).all())
+
+        alteracoes = []
+        for agendamento in candidatos:
+            novo_horario = agendamento.data_agendamento + deslocamento
+            if (novo_horario, agendamento.servico) in ocupados:
+                conflito(agendamento, f'Horário {novo_horario.strftime("%d/%m/%Y %H:%M")} já ocupado')
+                continue
+            if _fora_do_expediente(novo_horario):
+                conflito(agendamento, f'Horário {novo_horario.strftime("%d/%m/%Y %H:%M")} fora do expediente')
+                continue
+            ocupados.add((novo_horario, agendamento.servico))
+            alteracoes.append({'id': agendamento.id, 'data_agendamento': novo_horario})
+            relatorio['processados'].append({
+                'id': agendamento.id,
+                'paciente': agendamento.paciente_ref.nome,
+                'servico': agendamento.servico,
+                'de': agendamento.data_agendamento.strftime('%Y-%m-%d %H:%M'),
+                'para': novo_horario.strftime('%Y-%m-%d %H:%M')
+            })
+
+        if alteracoes and not simular:
+            try:
+                db.session.execute(update(Agendamento), alteracoes)
+            except IntegrityError:
+                db.session.rollback()
+                raise ValueError('A agenda do dia de destino mudou durante a operação. Tente novamente.')
+    else:
+        vinculados = _agendamentos_com_vinculos([a.id for a in candidatos])
+        com_historico = _agendamentos_com_transicoes([a.id for a in candidatos])
+        excluir = []
+        for agendamento in candidatos:
+            if agendamento.id in vinculados:
+                conflito(agendamento, 'Possui prontuário ou lançamentos vinculados')
+                continue
+            if agendamento.id in com_historico:
+                conflito(agendamento, 'Possui histórico de mudanças de status')
+                continue
+            excluir.append(agendamento.id)
+            relatorio['processados'].append({
+                'id': agendamento.id,
+                'paciente': agendamento.paciente_ref.nome,
+                'servico': agendamento.servico,
+                'de': agendamento.data_agendamento.strftime('%Y-%m-%d %H:%M'),
+                'para': None
+            })
+
+        if excluir and not simular:
+            db.session.execute(
+                delete(Agendamento).where(Agendamento.id.in_(excluir))
+                .execution_options(synchronize_session=False)
+            )
+
+    if not simular:
+        db.session.commit()
+
+    return relatorio
+
+
+# ========== SÉRIES RECORRENTES ==========
+
+FREQUENCIAS_SERIE = ('semanal', 'quinzenal', 'mensal')
+MAXIMO_OCORRENCIAS = 52
+
+
+def datas_da_serie(inicio: datetime, frequencia: str, ocorrencias: int) -> list:
+    """Datas/horários de uma série; na mensal, dias inexistentes viram o último dia do mês"""
+    if frequencia not in FREQUENCIAS_SERIE:
+        raise ValueError(f'Frequência inválida: {frequencia}')
+    if not 1 <= ocorrencias <= MAXIMO_OCORRENCIAS:
+        raise ValueError(f'Número de ocorrências deve estar entre 1 e {MAXIMO_OCORRENCIAS}')
+
+    datas = []
+    for n in range(ocorrencias):
+        if frequencia == 'mensal':
+            mes = inicio.month - 1 + n
+            ano, mes = inicio.year + mes // 12, mes % 12 + 1
+            dia = min(inicio.day, calendar.monthrange(ano, mes)[1])
+            datas.append(inicio.replace(year=ano, month=mes, day=dia))
+        else:
+            datas.append(inicio + timedelta(weeks=n * (1 if frequencia == 'semanal' else 2)))
+    return datas
+
+
+def _fora_do_expediente(horario: datetime) -> bool:
+    abertura = datetime.strptime(Config.HORARIO_ABERTURA, '%H:%M').time()
+    fechamento = datetime.strptime(Config.HORARIO_FECHAMENTO, '%H:%M').time()
+    return (horario.weekday() not in Config.DIAS_FUNCIONAMENTO
+            or not abertura <= horario.time() < fechamento)
+
+
+def criar_serie_agendamentos(paciente_id: int, servico: str, inicio: datetime, frequencia: str,
+                             ocorrencias: int, observacoes: str = '', simular: bool = False) -> dict:
+    """
+    Cria uma série de agendamentos recorrentes para um paciente.
+    Todas as datas são verificadas contra a agenda do serviço em uma única
+    consulta; as livres são gravadas com um único INSERT em lote, na mesma
+    transação da SerieAgendamento, e as demais voltam como conflitos.
+    """
+    datas = datas_da_serie(inicio, frequencia, ocorrencias)
+
+    if not db.session.get(Paciente, paciente_id):
+        raise ValueError('Paciente não encontrado')
+
+    profissional = Profissional.query.filter_by(ativo=True).first()
+    if not profissional:
+        raise ValueError('Profissional não encontrado no sistema')
+
+    ocupados = set(db.session.execute(
+        select(Agendamento.data_agendamento).where(
+            Agendamento.servico == servico,
+            Agendamento.data_agendamento.in_(datas),
+            Agendamento.status != 'faltou'
+        )
+    ).scalars())
+
+    livres, conflitos = [], []
+    for horario in datas:
+        if horario in ocupados:
+            conflitos.append({'data_agendamento': horario.strftime('%Y-%m-%d %H:%M'), 'motivo': 'Horário ocupado'})
+        elif _fora_do_expediente(horario):
+            conflitos.append({'data_agendamento': horario.strftime('%Y-%m-%d %H:%M'), 'motivo': 'Fora do expediente'})
+        else:
+            livres.append(horario)
+
+    resultado = {
+        'serie_id': None,
+        'agendados': [h.strftime('%Y-%m-%d %H:%M') for h in livres],
+        'conflitos': conflitos,
+        'simulacao': simular
+    }
+    if simular or not livres:
+        return resultado
+
+    serie = SerieAgendamento(
+        paciente_id=paciente_id,
+        servico=servico,
+        frequencia=frequencia,
+        ocorrencias=ocorrencias,
+        data_inicio=inicio
+    )
+    db.session.add(serie)
+    db.session.flush()
+
+    agora = datetime.now()
+    try:
+        db.session.execute(insert(Agendamento), [{
+            'paciente_id': paciente_id,
+            'profissional_id': profissional.id,
+            'data_agendamento': horario,
+            'servico': servico,
+            'observacoes': observacoes,
+            'status': 'agendado',
+            'data_criacao': agora,
+            'serie_id': serie.id
+        } for horario in livres])
+        db.session.commit()
+    except IntegrityError:
+        # Algum horário foi ocupado entre a verificação e a gravação
+        db.session.rollback()
+        raise ValueError('A agenda mudou durante a gravação da série. Tente novamente.')
+
+    resultado['serie_id'] = serie.id
+    return resultado
+
+
+# ========== AGENDAMENTO ==========
+
+CAMPOS_PACIENTE_OPCIONAIS = (
+    'email', 'data_nascimento', 'idade', 'naturalidade', 'estado_civil', 'religiao',
+    'profissao', 'filiacao_mae', 'filiacao_pai', 'endereco', 'bairro', 'cidade'
+)
+
+
+def agendar_paciente(dados_paciente: dict, data_agendamento: datetime, servico: str, observacoes: str = ''):
+    """
+    Cria um agendamento, cadastrando o paciente ou atualizando o cadastro existente.
+    Faz uma busca de profissional e uma de paciente (por CPF, ou por nome +
+    telefone quando não há CPF). O conflito de horário é garantido pelo índice
+    único ux_agendamentos_horario_servico: o INSERT é tentado direto e a
+    violação vira ValueError, sem corrida entre duas recepções.
+    Levanta ValueError quando o horário está ocupado ou não há profissional.
+    """
+    # Clínica com um único profissional ativo
+    profissional = Profissional.query.filter_by(ativo=True).first()
+    if not profissional:
+        raise ValueError('Erro: Profissional não encontrado no sistema!')
+
+    cpf = somente_digitos(dados_paciente.get('cpf'))
+    if cpf:
+        paciente = Paciente.query.filter_by(cpf_digitos=cpf).first()
+    else:
+        paciente = Paciente.query.filter_by(
+            nome=dados_paciente['nome'],
+            telefone_digitos=somente_digitos(dados_paciente['telefone'])
+        ).first()
+
+    novo_paciente = paciente is None
+    if novo_paciente:
+        paciente = Paciente(**{campo: valor for campo, valor in dados_paciente.items() if valor not in ('', None)})
+        db.session.add(paciente)
+    else:
+        # Campos obrigatórios sempre atualizados; opcionais só quando informados
+        paciente.nome = dados_paciente['nome']
+        paciente.telefone = dados_paciente['telefone']
+        for campo in CAMPOS_PACIENTE_OPCIONAIS:
+            valor = dados_paciente.get(campo)
+            if valor not in ('', None):
+                setattr(paciente, campo, valor)
+
+    db.session.flush()
+    # Só o id: nome e CPF do paciente não vão para o log
+    logger.debug('%s: id=%s', 'Novo paciente' if novo_paciente else 'Paciente existente atualizado', paciente.id)
+
+    try:
+        agendamento = Agendamento(
+            paciente_id=paciente.id,
+            profissional_id=profissional.id,
+            data_agendamento=data_agendamento,
+            servico=servico,
+            observacoes=observacoes
+        )
+        db.session.add(agendamento)
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        raise ValueError(f'Já existe um agendamento de {servico} para este horário!')
+
+    agendamento_id = agendamento.id
+    db.session.commit()
+
+    logger.info('Agendamento %s criado: %s em %s', agendamento_id, servico, data_agendamento)
+    return agendamento_id
@@ -0,0 +1,115 @@
+"""
+Arquivos estáticos versionados e templates pré-compilados
+No build (flask --app app construir-assets) CSS e JS são minificados e todos
+os arquivos de static/ são copiados para static/dist com o hash do conteúdo
+no nome, junto com um manifesto. Em produção o url_for('static') aponta para
+as cópias versionadas, servidas com cache imutável de longo prazo.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from flask import request
+from jinja2 import FileSystemBytecodeCache, TemplateError
+
+PASTA_VERSIONADA = 'dist'
+ARQUIVO_MANIFESTO = 'manifest.json'
+TAMANHO_HASH = 12
+CACHE_IMUTAVEL = 60 * 60 * 24 * 365  # 1 ano
+
+
+def _minificar(caminho: str, conteudo: bytes) -> bytes:
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao == '.css':
+        from rcssmin import cssmin
+        return cssmin(conteudo.decode('utf-8')).encode('utf-8')
+    if extensao == '.js':
+        from rjsmin import jsmin
+        return jsmin(conteudo.decode('utf-8')).encode('utf-8')
+    return conteudo
+
+
+def construir_assets(pasta_static: str) -> dict:
+    """
+    Recria static/dist a partir de static/ e grava o manifesto
+    (caminho original -> caminho versionado). Devolve, por arquivo, o
+    tamanho original e o gravado.
+    """
+    destino = os.path.join(pasta_static, PASTA_VERSIONADA)
+    shutil.rmtree(destino, ignore_errors=True)
+    os.makedirs(destino)
+
+    manifesto = {}
+    tamanhos = {}
+    for raiz, pastas, arquivos in os.walk(pasta_static):
+        pastas[:] = sorted(p for p in pastas if os.path.join(raiz, p) != destino)
+        for nome in sorted(arquivos):
+            origem = os.path.join(raiz, nome)
+            relativo = os.path.relpath(origem, pasta_static).replace(os.sep, '/')
+            with open(origem, 'rb') as arquivo:
+                original = arquivo.read()
+            conteudo = _minificar(relativo, original)
+
+            base, extensao = os.path.splitext(relativo)
+            versionado = f'{base}.{hashlib.sha256(conteudo).hexdigest()[:TAMANHO_HASH]}{extensao}'
+            caminho = os.path.join(destino, versionado)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, 'wb') as arquivo:
+                arquivo.write(conteudo)
+
+            manifesto[relativo] = f'{PASTA_VERSIONADA}/{versionado}'
+            tamanhos[relativo] = (len(original), len(conteudo))
+
+    with open(os.path.join(destino, ARQUIVO_MANIFESTO), 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, indent=2, sort_keys=True)
+    return tamanhos
+
+
+def configurar_assets(app):
+    """
+    Usa o manifesto do build, se existir, para versionar os links gerados por
+    url_for('static'). Em modo DEBUG os arquivos originais continuam sendo
+    servidos, para que alterações apareçam sem refazer o build.
+    """
+    manifesto = {}
+    caminho = os.path.join(app.static_folder, PASTA_VERSIONADA, ARQUIVO_MANIFESTO)
+    if not app.debug and os.path.exists(caminho):
+        with open(caminho, encoding='utf-8') as arquivo:
+            manifesto = json.load(arquivo)
+    app.extensions['assets_manifesto'] = manifesto
+
+    @app.url_defaults
+    def versionar_static(endpoint, valores):
+        if endpoint == 'static' and 'filename' in valores:
+            valores['filename'] = manifesto.get(valores['filename'], valores['filename'])
+
+    @app.after_request
+    def cache_static_versionado(resposta):
+        # O nome muda junto com o conteúdo: o navegador nunca precisa revalidar
+        if request.endpoint == 'static' and resposta.status_code == 200 and \
+                (request.view_args or {}).get('filename', '').startswith(PASTA_VERSIONADA + '/'):
+            resposta.cache_control.no_cache = None
+            resposta.cache_control.public = True
+            resposta.cache_control.max_age = CACHE_IMUTAVEL
+            resposta.cache_control.immutable = True
+        return resposta
+
+
+def aquecer_templates(app, pasta_cache: str) -> int:
+    """
+    Liga o cache de bytecode do Jinja em disco e compila todos os templates.
+    Com o cache já preenchido (pelo build ou por outro processo) cada template
+    é só carregado, sem nova compilação. Devolve quantos foram carregados.
+    """
+    os.makedirs(pasta_cache, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(pasta_cache)
+
+    carregados = 0
+    for nome in app.jinja_env.list_templates(extensions=('html',)):
+        try:
+            app.jinja_env.get_template(nome)
+            carregados += 1
+        except TemplateError as e:
+            print(f"⚠️  Erro ao compilar o template {nome}: {str(e)}")
+    return carregados
@@ -3,7 +3,7 @@ import secrets
 import json
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import session, redirect, url_for, flash, request
+from flask import session, redirect, url_for, flash, request, g
 from models.models import db, Usuario, SessaoUsuario, LogAcesso
 
 def hash_senha(senha: str) -> str:
@@ -93,7 +93,14 @@ def get_usuario_atual():
     token_sessao = session.get('token_sessao')
     if not token_sessao:
         return None
-    return validar_sessao(token_sessao)
+    # Valida uma vez por requisição: cada validação grava o último acesso e
+    # o commit expiraria os objetos já carregados pela view
+    cache = g.get('usuario_atual')
+    if cache and cache[0] == token_sessao:
+        return cache[1]
+    usuario = validar_sessao(token_sessao)
+    g.usuario_atual = (token_sessao, usuario)
+    return usuario
 
 def login_required(f):
     @wraps(f)
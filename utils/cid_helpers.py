@@ -0,0 +1,234 @@
+"""
+Rotinas de apoio ao catálogo CID-10
+Índice em memória (listas ordenadas + bisect) para autocompletar e
+reconhecer códigos citados nos diagnósticos. O catálogo do sistema é um
+recorte dos códigos mais usados: na gravação dos atestados só o formato é
+obrigatório, e a ausência no catálogo gera apenas um aviso.
+"""
+
+import csv
+import re
+from bisect import bisect_left
+from datetime import date, datetime, time
+from sqlalchemy import func
+from config import Config
+from models.models import db, Atestado, Prontuario
+from utils.pacientes_helpers import normalizar_nome
+
+LIMITE_AUTOCOMPLETAR = 10
+LIMITE_MAXIMO_AUTOCOMPLETAR = 50
+
+# Letra + 2 dígitos, com ou sem ponto antes da subcategoria (F32, F32.1, f321)
+_FORMATO_CID = re.compile(r'^([A-Z])(\d{2})\.?(\d)?$')
+_CID_NO_TEXTO = re.compile(r'\b([A-Z]\d{2}(?:\.?\d)?)\b')
+
+# Índice do catálogo, montado uma vez por processo:
+#   _codigos:  códigos compactos ordenados ("F32", "F320"...), para busca por prefixo
+#   _palavras: (palavra normalizada, código compacto) ordenados, para busca pela descrição
+#   _catalogo: código compacto -> (código formatado, descrição, descrição normalizada)
+_codigos = []
+_palavras = []
+_catalogo = {}
+
+
+def compactar_cid(valor) -> str:
+    """Código em maiúsculas, sem ponto nem espaços ('f32.1 ' -> 'F321')"""
+    return re.sub(r'[\s.]', '', (valor or '').upper())
+
+
+def formatar_cid(compacto: str) -> str:
+    """'F321' -> 'F32.1'; categorias ficam como estão"""
+    return f'{compacto[:3]}.{compacto[3:]}' if len(compacto) > 3 else compacto
+
+
+def carregar_catalogo_cid(caminho: str = None) -> int:
+    """
+    Lê o catálogo CID-10 e monta o índice em memória. Aceita o arquivo do
+    sistema (codigo;descricao) ou o CSV de subcategorias do DATASUS
+    (SUBCAT;...;DESCRICAO;..., em latin-1). Retorna a quantidade de códigos.
+    """
+    global _codigos, _palavras, _catalogo
+
+    caminho = caminho or Config.CID10_ARQUIVO
+    catalogo = {}
+    for codificacao in ('utf-8', 'latin-1'):
+        try:
+            with open(caminho, encoding=codificacao, newline='') as arquivo:
+                for linha in csv.DictReader(arquivo, delimiter=';'):
+                    compacto = compactar_cid(linha.get('codigo') or linha.get('SUBCAT'))
+                    descricao = (linha.get('descricao') or linha.get('DESCRICAO') or '').strip()
+                    if _FORMATO_CID.match(compacto) and descricao:
+                        catalogo[compacto] = (formatar_cid(compacto), descricao, normalizar_nome(descricao))
+            break
+        except UnicodeDecodeError:
+            catalogo = {}
+
+    _catalogo = catalogo
+    _codigos = sorted(catalogo)
+    _palavras = sorted(
+        (palavra, compacto)
+        for compacto, (_, _, normalizada) in catalogo.items()
+        for palavra in set(re.findall(r'\w+', normalizada))
+    )
+    return len(_catalogo)
+
+
+def _garantir_catalogo():
+    if not _catalogo:
+        try:
+            carregar_catalogo_cid()
+        except OSError as e:
+            print(f"⚠️  Catálogo CID-10 não carregado: {e}")
+
+
+def _item(compacto: str) -> dict:
+    codigo, descricao, _ = _catalogo[compacto]
+    return {'codigo': codigo, 'descricao': descricao}
+
+
+def _faixa_por_prefixo(lista: list, prefixo, fim_prefixo):
+    """Posições [inicio, fim) da lista ordenada cujos itens começam com o prefixo"""
+    return bisect_left(lista, prefixo), bisect_left(lista, fim_prefixo)
+
+
+def buscar_cid(termo: str, limite: int = LIMITE_AUTOCOMPLETAR) -> list:
+    """
+    Autocompletar: por prefixo do código ('F3', 'f32.1') ou por palavras da
+    descrição ('depress grave'), todas elas como prefixo. Códigos em ordem.
+    """
+    _garantir_catalogo()
+    termo = (termo or '').strip()
+    if not termo:
+        return []
+
+    compacto = compactar_cid(termo)
+    if re.match(r'^[A-Z]\d{0,3}$', compacto):
+        inicio, fim = _faixa_por_prefixo(_codigos, compacto, compacto + '\uffff')
+        return [_item(c) for c in _codigos[inicio:min(fim, inicio + limite)]]
+
+    palavras = re.findall(r'\w+', normalizar_nome(termo))
+    if not palavras:
+        return []
+
+    # A palavra mais longa costuma ser a mais seletiva: é ela que vai ao índice
+    principal = max(palavras, key=len)
+    inicio, fim = _faixa_por_prefixo(_palavras, (principal,), (principal + '\uffff',))
+    candidatos = sorted({compacto for _, compacto in _palavras[inicio:fim]})
+
+    resultado = []
+    for candidato in candidatos:
+        palavras_descricao = re.findall(r'\w+', _catalogo[candidato][2])
+        if all(any(p.startswith(palavra) for p in palavras_descricao) for palavra in palavras):
+            resultado.append(_item(candidato))
+            if len(resultado) >= limite:
+                break
+    return resultado
+
+
+def descricao_cid(codigo) -> str:
+    """Descrição do código; subcategorias ausentes do catálogo usam a da categoria"""
+    _garantir_catalogo()
+    compacto = compactar_cid(codigo)
+    registro = _catalogo.get(compacto) or _catalogo.get(compacto[:3])
+    return registro[1] if registro else None
+
+
+def validar_cid(valor) -> str:
+    """
+    Valida o formato e formata o CID informado ('f321' -> 'F32.1'). Vazio é
+    aceito (o CID no atestado é opcional). Lança ValueError para formato
+    inválido; a presença no catálogo é conferida à parte (cid_catalogado).
+    """
+    compacto = compactar_cid(valor)
+    if not compacto:
+        return ''
+    if not _FORMATO_CID.match(compacto):
+        raise ValueError(f'CID inválido: {valor.strip()}. Use o formato letra + 2 dígitos (ex.: F32 ou F32.1)')
+    return formatar_cid(compacto)
+
+
+def cid_catalogado(valor) -> bool:
+    """
+    O código exato está no catálogo? Sem recorrer à categoria: 'I10.9' não é
+    aceito só porque 'I10' existe. Sem catálogo carregado, nada é conferido.
+    """
+    _garantir_catalogo()
+    return not _catalogo or compactar_cid(valor) in _catalogo
+
+
+def cids_no_texto(texto) -> set:
+    """Códigos do catálogo citados em um texto livre (ex.: diagnóstico 'TAG - F41.1')"""
+    encontrados = set()
+    for trecho in _CID_NO_TEXTO.findall((texto or '').upper()):
+        compacto = compactar_cid(trecho)
+        if compacto in _catalogo:
+            encontrados.add(compacto)
+        elif compacto[:3] in _catalogo:
+            encontrados.add(compacto[:3])
+    return encontrados
+
+
+def estatisticas_cid(data_inicio: date, data_fim: date) -> dict:
+    """
+    Por CID no período: atestados emitidos, pacientes distintos, dias de
+    afastamento (total e média) e prontuários cujo diagnóstico cita o código.
+    Os CIDs gravados antes da validação são normalizados ao agrupar.
+    """
+    _garantir_catalogo()
+    inicio = datetime.combine(data_inicio, time.min)
+    fim = datetime.combine(data_fim, time.max)
+
+    por_cid = {}
+
+    def acumulador(compacto):
+        return por_cid.setdefault(compacto, {
+            'atestados': 0, 'pacientes': set(), 'dias_afastamento': 0, 'diagnosticos': 0
+        })
+
+    nao_catalogados = 0
+    atestados = db.session.query(
+        Atestado.cid, Atestado.paciente_id,
+        func.count(Atestado.id), func.coalesce(func.sum(Atestado.dias_afastamento), 0)
+    ).filter(
+        Atestado.data_emissao.between(inicio, fim),
+        Atestado.cid.isnot(None), Atestado.cid != ''
+    ).group_by(Atestado.cid, Atestado.paciente_id)
+
+    for cid, paciente_id, quantidade, dias in atestados:
+        compacto = compactar_cid(cid)
+        if compacto not in _catalogo:
+            compacto = compacto[:3] if compacto[:3] in _catalogo else None
+        if not compacto:
+            nao_catalogados += quantidade
+            continue
+        item = acumulador(compacto)
+        item['atestados'] += quantidade
+        item['pacientes'].add(paciente_id)
+        item['dias_afastamento'] += int(dias or 0)
+
+    diagnosticos = db.session.query(Prontuario.diagnostico).filter(
+        Prontuario.data_atendimento.between(inicio, fim),
+        Prontuario.diagnostico.isnot(None)
+    ).execution_options(yield_per=1000)
+
+    for (diagnostico,) in diagnosticos:
+        for compacto in cids_no_texto(diagnostico):
+            acumulador(compacto)['diagnosticos'] += 1
+
+    cids = []
+    for compacto, item in por_cid.items():
+        cids.append({
+            **_item(compacto),
+            'atestados': item['atestados'],
+            'pacientes': len(item['pacientes']),
+            'dias_afastamento': item['dias_afastamento'],
+            'media_dias': round(item['dias_afastamento'] / item['atestados'], 1) if item['atestados'] else 0,
+            'diagnosticos': item['diagnosticos']
+        })
+    cids.sort(key=lambda c: (-(c['atestados'] + c['diagnosticos']), c['codigo']))
+
+    return {
+        'cids': cids,
+        'total_atestados': sum(c['atestados'] for c in cids) + nao_catalogados,
+        'atestados_sem_cid_valido': nao_catalogados
+    }
@@ -0,0 +1,75 @@
+"""
+Compressão das respostas (brotli ou gzip) e GET condicional das APIs JSON
+Registrado em create_app para todos os blueprints. Arquivos enviados com
+send_file (PDFs, anexos, estáticos), respostas em streaming e anexos ficam
+de fora: ou já são comprimidos ou não estão inteiros em memória.
+"""
+
+import gzip
+import hashlib
+from flask import request
+
+TIPOS_COMPRIMIVEIS = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'
+}
+NIVEL_GZIP = 6
+QUALIDADE_BROTLI = 5  # bom equilíbrio entre tamanho e CPU para respostas dinâmicas
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def _comprimivel(resposta, tamanho_minimo: int) -> bool:
+    return (
+        resposta.status_code == 200
+        and request.method != 'HEAD'
+        and not resposta.direct_passthrough
+        and not resposta.is_streamed
+        and 'Content-Encoding' not in resposta.headers
+        and not resposta.headers.get('Content-Disposition', '').lower().startswith('attachment')
+        and resposta.mimetype in TIPOS_COMPRIMIVEIS
+        and (resposta.content_length or 0) >= tamanho_minimo
+    )
+
+
+def configurar_compressao(app):
+    """
+    Registra o after_request que:
+    - adiciona ETag fraca (hash do corpo) às respostas JSON de GET e responde
+      304 quando o If-None-Match confere;
+    - comprime as respostas de texto/JSON a partir de COMPRESSAO_TAMANHO_MINIMO
+      bytes, com brotli quando o cliente aceita e o pacote está instalado.
+    """
+    tamanho_minimo = app.config['COMPRESSAO_TAMANHO_MINIMO']
+    brotli = _brotli()
+    codificacoes = ['br', 'gzip'] if brotli else ['gzip']
+
+    @app.after_request
+    def comprimir_resposta(resposta):
+        if resposta.direct_passthrough or resposta.is_streamed:
+            return resposta
+
+        if resposta.is_json and request.method == 'GET' and resposta.status_code == 200 \
+                and 'ETag' not in resposta.headers:
+            resposta.set_etag(hashlib.sha1(resposta.get_data()).hexdigest(), weak=True)
+            resposta = resposta.make_conditional(request)
+
+        if not _comprimivel(resposta, tamanho_minimo):
+            return resposta
+
+        resposta.vary.add('Accept-Encoding')
+        codificacao = request.accept_encodings.best_match(codificacoes)
+        if codificacao == 'br':
+            resposta.set_data(brotli.compress(resposta.get_data(), quality=QUALIDADE_BROTLI))
+        elif codificacao == 'gzip':
+            resposta.set_data(gzip.compress(resposta.get_data(), compresslevel=NIVEL_GZIP))
+        else:
+            return resposta
+        resposta.headers['Content-Encoding'] = codificacao
+        return resposta
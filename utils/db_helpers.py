@@ -0,0 +1,236 @@
+"""
+Utilitários de manutenção do esquema do banco de dados
+"""
+
+import logging
+from sqlalchemy import inspect, text, select, func
+from sqlalchemy.exc import SQLAlchemyError
+from models.models import db, Usuario, Agendamento
+
+logger = logging.getLogger(__name__)
+
+# Colunas de texto indexadas para a busca textual nos registros clínicos
+CAMPOS_BUSCA_TEXTUAL = {
+    'prontuarios': ('queixa_principal', 'diagnostico', 'prescricao', 'historia_doenca'),
+    'receituarios': ('medicamentos',)
+}
+# Cópia da configuração portuguese que remove acentos antes do radical, como o
+# tokenize 'remove_diacritics' do FTS5: "pressao" encontra "pressão"
+CONFIGURACAO_BUSCA_POSTGRES = 'pt_unaccent'
+
+# Índices que saíram dos modelos e precisam ser removidos dos bancos existentes
+INDICES_REMOVIDOS = ('ix_recibos_agendamento',)  # trocado por ux_recibos_agendamento_vigente
+
+
+def verificar_banco_pronto() -> tuple:
+    """
+    Verificação leve de prontidão usada em /saude: uma única consulta
+    confirma a conexão e que o init-db já criou as tabelas.
+    Devolve (pronto, motivo); o motivo é genérico, pois /saude é público.
+    """
+    try:
+        with db.engine.connect() as conexao:
+            conexao.execute(select(Usuario.id).limit(1))
+        return True, ''
+    except SQLAlchemyError as e:
+        # O erro do driver pode trazer host e porta do banco: só vai para o log
+        logger.warning('Banco de dados não está pronto: %s', e)
+        return False, 'banco de dados indisponível ou não inicializado'
+
+
+def criar_colunas_faltantes():
+    """
+    Adiciona às tabelas existentes as colunas opcionais declaradas nos modelos
+    que ainda não existem no banco (ALTER TABLE ... ADD COLUMN). Colunas
+    obrigatórias precisam de migração própria e só geram um aviso.
+    """
+    inspetor = inspect(db.engine)
+    tabelas_existentes = set(inspetor.get_table_names())
+
+    for tabela in db.metadata.sorted_tables:
+        if tabela.name not in tabelas_existentes:
+            continue
+
+        colunas_existentes = {coluna['name'] for coluna in inspetor.get_columns(tabela.name)}
+        for coluna in tabela.columns:
+            if coluna.name in colunas_existentes:
+                continue
+            if not coluna.nullable:
+                print(f"⚠️  Coluna obrigatória {tabela.name}.{coluna.name} precisa de migração manual")
+                continue
+            try:
+                tipo = coluna.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as conexao:
+                    conexao.execute(text(f'ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}'))
+                print(f"✅ Coluna {tabela.name}.{coluna.name} adicionada")
+            except Exception as e:
+                print(f"⚠️  Erro ao adicionar coluna {tabela.name}.{coluna.name}: {str(e)}")
+
+
+def criar_indices_faltantes():
+    """
+    Cria os índices declarados nos modelos que ainda não existem no banco.
+    O db.create_all() só cria índices junto com tabelas novas; bancos já em
+    produção precisam recebê-los separadamente. Antes, remove os índices
+    listados em INDICES_REMOVIDOS.
+    Índices únicos são a única proteção contra duplicidade (ex.: dois
+    agendamentos no mesmo horário): se um deles não puder ser criado, lança
+    RuntimeError em vez de seguir só com um aviso.
+    """
+    for nome in INDICES_REMOVIDOS:
+        try:
+            with db.engine.begin() as conexao:
+                conexao.execute(text(f'DROP INDEX IF EXISTS {nome}'))
+        except Exception as e:
+            print(f"⚠️  Erro ao remover índice {nome}: {str(e)}")
+
+    falhas = []
+    for tabela in db.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            try:
+                indice.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                if not indice.unique:
+                    print(f"⚠️  Erro ao criar índice {indice.name}: {str(e)}")
+                    continue
+                logger.error('Índice único %s não foi criado: %s', indice.name, e)
+                falhas.append(indice.name)
+
+    if 'ux_agendamentos_horario_servico' in falhas:
+        duplicados = horarios_duplicados()
+        if duplicados:
+            linhas = '\n'.join(
+                f"  {data_agendamento} {servico}: agendamentos {', '.join(map(str, ids))}"
+                for data_agendamento, servico, ids in duplicados
+            )
+            raise RuntimeError(
+                'Há agendamentos no mesmo horário e serviço; remarque ou exclua os excedentes '
+                f'e rode init-db novamente:\n{linhas}'
+            )
+    if falhas:
+        raise RuntimeError(f"Índices únicos não criados: {', '.join(falhas)}")
+
+
+def horarios_duplicados() -> list:
+    """
+    Horários com mais de um agendamento ativo no mesmo serviço (os que impedem
+    a criação de ux_agendamentos_horario_servico): (data, serviço, [ids])
+    """
+    ativos = Agendamento.status != 'faltou'
+    horarios = db.session.query(Agendamento.data_agendamento, Agendamento.servico).filter(ativos).group_by(
+        Agendamento.data_agendamento, Agendamento.servico
+    ).having(func.count(Agendamento.id) > 1).all()
+
+    duplicados = []
+    for data_agendamento, servico in horarios:
+        ids = db.session.execute(select(Agendamento.id).where(
+            ativos, Agendamento.data_agendamento == data_agendamento, Agendamento.servico == servico
+        ).order_by(Agendamento.id)).scalars().all()
+        duplicados.append((data_agendamento, servico, ids))
+    return duplicados
+
+
+def documento_busca_postgres(tabela: str, apelido: str = None) -> str:
+    """
+    Expressão tsvector da tabela no PostgreSQL. A consulta precisa usar
+    exatamente a mesma expressão do índice GIN para que ele seja aproveitado.
+    """
+    prefixo = f'{apelido}.' if apelido else ''
+    texto = " || ' ' || ".join(f"coalesce({prefixo}{campo}, '')" for campo in CAMPOS_BUSCA_TEXTUAL[tabela])
+    return f"to_tsvector('{CONFIGURACAO_BUSCA_POSTGRES}', {texto})"
+
+
+def _criar_busca_textual_sqlite(conexao, tabela: str, campos: tuple):
+    virtual = f'busca_{tabela}'
+    existia = conexao.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"), {'nome': virtual}
+    ).first() is not None
+
+    colunas = ', '.join(campos)
+    novos = ', '.join(f'new.{campo}' for campo in campos)
+    antigos = ', '.join(f'old.{campo}' for campo in campos)
+
+    # Tabela FTS5 de conteúdo externo: guarda só o índice, o texto continua na tabela original
+    conexao.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {virtual} USING fts5({colunas}, content='{tabela}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    ))
+    conexao.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {virtual}_ai AFTER INSERT ON {tabela} BEGIN "
+        f"INSERT INTO {virtual}(rowid, {colunas}) VALUES (new.id, {novos}); END"
+    ))
+    conexao.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {virtual}_ad AFTER DELETE ON {tabela} BEGIN "
+        f"INSERT INTO {virtual}({virtual}, rowid, {colunas}) VALUES ('delete', old.id, {antigos}); END"
+    ))
+    conexao.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {virtual}_au AFTER UPDATE OF {colunas} ON {tabela} BEGIN "
+        f"INSERT INTO {virtual}({virtual}, rowid, {colunas}) VALUES ('delete', old.id, {antigos}); "
+        f"INSERT INTO {virtual}(rowid, {colunas}) VALUES (new.id, {novos}); END"
+    ))
+    if not existia:
+        conexao.execute(text(f"INSERT INTO {virtual}({virtual}) VALUES ('rebuild')"))
+        print(f"✅ Índice de busca textual {virtual} criado")
+
+
+def _criar_configuracao_busca_postgres():
+    """
+    Cria a extensão unaccent e a configuração CONFIGURACAO_BUSCA_POSTGRES.
+    Sem ela as consultas da busca falhariam: lança RuntimeError.
+    """
+    try:
+        with db.engine.begin() as conexao:
+            conexao.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+            existe = conexao.execute(
+                text("SELECT 1 FROM pg_ts_config WHERE cfgname = :nome"), {'nome': CONFIGURACAO_BUSCA_POSTGRES}
+            ).first() is not None
+            if not existe:
+                conexao.execute(text(
+                    f"CREATE TEXT SEARCH CONFIGURATION {CONFIGURACAO_BUSCA_POSTGRES} (COPY = portuguese)"
+                ))
+                conexao.execute(text(
+                    f"ALTER TEXT SEARCH CONFIGURATION {CONFIGURACAO_BUSCA_POSTGRES} "
+                    f"ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem"
+                ))
+                print(f"✅ Configuração de busca textual {CONFIGURACAO_BUSCA_POSTGRES} criada")
+    except SQLAlchemyError as e:
+        raise RuntimeError(
+            f'Configuração de busca textual {CONFIGURACAO_BUSCA_POSTGRES} não criada (a extensão unaccent '
+            f'precisa estar disponível para o usuário do banco): {e}'
+        )
+
+
+def _criar_indice_busca_postgres(conexao, tabela: str):
+    # Índices criados com outra configuração não atendem às consultas: são refeitos
+    nome = f'ix_{tabela}_busca'
+    definicao = conexao.execute(
+        text("SELECT indexdef FROM pg_indexes WHERE indexname = :nome"), {'nome': nome}
+    ).scalar()
+    if definicao is not None and CONFIGURACAO_BUSCA_POSTGRES not in definicao:
+        conexao.execute(text(f"DROP INDEX {nome}"))
+        print(f"🔄 Índice {nome} refeito com a configuração {CONFIGURACAO_BUSCA_POSTGRES}")
+    conexao.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {nome} ON {tabela} USING gin ({documento_busca_postgres(tabela)})"
+    ))
+
+
+def criar_busca_textual():
+    """
+    Prepara a busca textual nos registros clínicos, mantida pelo próprio banco
+    a cada gravação: tabelas FTS5 com triggers no SQLite e índices GIN sobre
+    to_tsvector no PostgreSQL. Registros já existentes são indexados na criação.
+    Nos dois bancos a busca ignora acentos.
+    """
+    dialeto = db.engine.dialect.name
+    if dialeto == 'postgresql':
+        _criar_configuracao_busca_postgres()
+
+    for tabela, campos in CAMPOS_BUSCA_TEXTUAL.items():
+        try:
+            with db.engine.begin() as conexao:
+                if dialeto == 'sqlite':
+                    _criar_busca_textual_sqlite(conexao, tabela, campos)
+                elif dialeto == 'postgresql':
+                    _criar_indice_busca_postgres(conexao, tabela)
+        except Exception as e:
+            print(f"⚠️  Erro ao criar busca textual em {tabela}: {str(e)}")
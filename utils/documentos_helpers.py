@@ -0,0 +1,359 @@
+"""
+Rotinas de apoio aos documentos médicos
+Montagem dos dados de cada documento, cache dos PDFs pelo hash do conteúdo,
+pool de processos para a renderização e recibos do dia em lote
+"""
+
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, time
+from sqlalchemy import and_, func, insert
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from models.models import db, Paciente, Prontuario, Receituario, Laudo, Atestado, Recibo, Agendamento, ContaReceber
+from utils.numeracao_helpers import numeros_recibo
+from utils.pdf_helpers import renderizar_documento, VERSAO_LAYOUT
+
+TIPOS_DOCUMENTO = ('receituario', 'laudo', 'atestado', 'recibo', 'pedido_exame')
+TEMPO_MAXIMO_RENDERIZACAO = 60
+
+# Um pool por processo do gunicorn, criado no primeiro PDF pedido. Os processos
+# do pool são iniciados com spawn: não herdam conexões do banco nem threads.
+_pool = None
+_trava_pool = threading.Lock()
+
+
+def _pool_documentos() -> ProcessPoolExecutor:
+    global _pool
+    with _trava_pool:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.PDF_PROCESSOS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _trava_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _data(valor) -> str:
+    return valor.strftime('%d/%m/%Y') if valor else ''
+
+
+def _cabecalho_medico() -> list:
+    return [Config.CLINIC_NAME, f'CNPJ: {Config.CLINIC_CNPJ}',
+            f'{Config.MEDICO_NOME} - {Config.MEDICO_CRM}', Config.MEDICO_ESPECIALIDADE]
+
+
+def _assinatura_medico() -> list:
+    return [Config.MEDICO_NOME, Config.MEDICO_CRM, Config.MEDICO_ESPECIALIDADE]
+
+
+def _campos_paciente(paciente: Paciente, data) -> list:
+    return [('Paciente', paciente.nome), ('CPF', paciente.cpf), ('Data', _data(data))]
+
+
+def _secoes_preenchidas(*secoes) -> list:
+    return [(titulo, texto) for titulo, texto in secoes if texto]
+
+
+def montar_documento(tipo: str, registro_id: int) -> dict:
+    """
+    Dados do documento em estruturas simples (cabeçalho, título, campos,
+    seções e assinatura), prontos para o renderizador. Retorna None quando
+    o registro não existe.
+    """
+    if tipo == 'pedido_exame':
+        registro = db.session.get(Prontuario, registro_id)
+    else:
+        modelo = {'receituario': Receituario, 'laudo': Laudo, 'atestado': Atestado, 'recibo': Recibo}[tipo]
+        registro = db.session.get(modelo, registro_id)
+    if not registro:
+        return None
+    paciente = db.session.get(Paciente, registro.paciente_id)
+
+    if tipo == 'receituario':
+        return {
+            'titulo': 'RECEITUÁRIO',
+            'cabecalho': _cabecalho_medico(),
+            'campos': _campos_paciente(paciente, registro.data_emissao) + [('Validade', _data(registro.validade))],
+            'secoes': _secoes_preenchidas(('Medicamentos', registro.medicamentos),
+                                          ('Posologia', registro.posologia),
+                                          ('Observações', registro.observacoes)),
+            'assinatura': _assinatura_medico()
+        }
+
+    if tipo == 'laudo':
+        return {
+            'titulo': 'LAUDO MÉDICO',
+            'cabecalho': _cabecalho_medico(),
+            'campos': _campos_paciente(paciente, registro.data_emissao) + [('Exame', registro.tipo_exame)],
+            'secoes': _secoes_preenchidas((registro.titulo, registro.conteudo),
+                                          ('Conclusão', registro.conclusao)),
+            'assinatura': _assinatura_medico()
+        }
+
+    if tipo == 'atestado':
+        texto = registro.observacoes or (
+            f'Atesto para os devidos fins que o(a) paciente {paciente.nome}, portador(a) do CPF '
+            f'{paciente.cpf or "-"}, esteve sob meus cuidados médicos em {_data(registro.data_inicio)}.'
+        )
+        if registro.dias_afastamento:
+            periodo = f' a {_data(registro.data_fim)}' if registro.data_fim else ''
+            texto += (f'\nNecessita de {registro.dias_afastamento} dia(s) de afastamento de suas atividades, '
+                      f'a partir de {_data(registro.data_inicio)}{periodo}.')
+        return {
+            'titulo': 'ATESTADO MÉDICO',
+            'cabecalho': _cabecalho_medico(),
+            'campos': _campos_paciente(paciente, registro.data_emissao),
+            'secoes': _secoes_preenchidas(('', texto), ('', f'CID-10: {registro.cid}' if registro.cid else '')),
+            'assinatura': _assinatura_medico()
+        }
+
+    if tipo == 'recibo':
+        valor = f'R$ {registro.valor:.2f}'
+        campos = [('Nº do Recibo', registro.numero_recibo), ('Data de Emissão', _data(registro.data_emissao))]
+        if registro.recibo_substituido:
+            campos.append(('Substitui o Recibo', registro.recibo_substituido.numero_recibo))
+        return {
+            'titulo': 'RECIBO DE PAGAMENTO',
+            'cabecalho': [Config.CLINIC_NAME, f'CNPJ: {Config.CLINIC_CNPJ}'],
+            'campos': campos + [('Paciente', paciente.nome), ('CPF', paciente.cpf), ('Telefone', paciente.telefone)],
+            'secoes': _secoes_preenchidas(
+                ('Descrição do Serviço', registro.descricao_servico),
+                ('Forma de Pagamento', registro.forma_pagamento),
+                ('Valor Total', valor),
+                ('', f'Recebi de {paciente.nome}, CPF {paciente.cpf or "-"}, a quantia de {valor} '
+                     f'referente ao(s) serviço(s) acima descrito(s).')
+            ),
+            'assinatura': [Config.CLINIC_NAME]
+        }
+
+    return {
+        'titulo': 'SOLICITAÇÃO DE EXAME',
+        'cabecalho': _cabecalho_medico(),
+        'campos': _campos_paciente(paciente, registro.data_atendimento),
+        'secoes': _secoes_preenchidas(('Exames Solicitados', registro.exames_solicitados),
+                                      ('Indicação Clínica', registro.indicacao_clinica)),
+        'assinatura': _assinatura_medico()
+    }
+
+
+def hash_documento(documento: dict) -> str:
+    """Hash do conteúdo do documento: muda sempre que o registro, o paciente ou o layout mudam"""
+    bruto = json.dumps({'layout': VERSAO_LAYOUT, 'documento': documento}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
+
+def _preparar_pdf(tipo: str, registro_id: int) -> dict:
+    """Dados, hash e caminho em cache do PDF do documento (None se o registro não existe)"""
+    if tipo not in TIPOS_DOCUMENTO:
+        raise ValueError(f'Tipo de documento inválido: {tipo}')
+
+    documento = montar_documento(tipo, registro_id)
+    if documento is None:
+        return None
+
+    hash_conteudo = hash_documento(documento)
+    prefixo = os.path.join(Config.PDF_CACHE_DIR, f'{tipo}-{registro_id}-')
+    return {
+        'documento': documento,
+        'hash': hash_conteudo,
+        'prefixo': prefixo,
+        'caminho': f'{prefixo}{hash_conteudo[:20]}.pdf',
+        'nome': f'{tipo}_{registro_id}.pdf'
+    }
+
+
+def _apagar_versoes_antigas(prefixo: str, atual: str):
+    for antigo in glob.glob(f'{glob.escape(prefixo)}*.pdf'):
+        if antigo != atual:
+            try:
+                os.remove(antigo)
+            except OSError:
+                pass
+
+
+def _gravar_pdf(caminho: str, conteudo: bytes, prefixo: str):
+    """Grava o arquivo de forma atômica e apaga as versões antigas do mesmo documento"""
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    os.replace(temporario, caminho)
+    _apagar_versoes_antigas(prefixo, caminho)
+
+
+def pdf_documento(tipo: str, registro_id: int) -> dict:
+    """
+    Caminho do PDF do documento, gerando-o no pool de processos apenas quando
+    o conteúdo mudou desde a última geração. Os arquivos ficam em
+    Config.PDF_CACHE_DIR, nomeados por tipo, id e hash, e as versões antigas
+    do mesmo documento são apagadas. Retorna None quando o registro não existe.
+    """
+    pdf = _preparar_pdf(tipo, registro_id)
+    if pdf is None:
+        return None
+
+    if not os.path.exists(pdf['caminho']):
+        try:
+            conteudo = _pool_documentos().submit(renderizar_documento, pdf['documento'])\
+                                         .result(timeout=TEMPO_MAXIMO_RENDERIZACAO)
+        except BrokenProcessPool:
+            _descartar_pool()
+            raise
+        _gravar_pdf(pdf['caminho'], conteudo, pdf['prefixo'])
+
+    return pdf
+
+
+# ========== RECIBOS EM LOTE ==========
+
+def agendamentos_finalizados_do_dia(dia):
+    """Consulta dos agendamentos finalizados no dia"""
+    return Agendamento.query.filter(
+        Agendamento.status == 'finalizado',
+        Agendamento.data_agendamento.between(datetime.combine(dia, time.min), datetime.combine(dia, time.max))
+    )
+
+
+def recibos_do_dia(dia) -> list:
+    """Recibos vigentes dos agendamentos finalizados no dia, na ordem dos horários"""
+    return db.session.query(Recibo.id).join(Agendamento, Agendamento.id == Recibo.agendamento_id).filter(
+        Agendamento.id.in_(agendamentos_finalizados_do_dia(dia).with_entities(Agendamento.id)),
+        Recibo.substituido_em.is_(None)
+    ).order_by(Agendamento.data_agendamento, Recibo.id).all()
+
+
+def criar_recibos_do_dia(dia) -> dict:
+    """
+    Cria, com um único INSERT em lote, os recibos que faltam para os
+    agendamentos finalizados no dia. Valor e forma de pagamento vêm das contas
+    a receber pagas do agendamento; agendamentos sem pagamento registrado
+    ficam de fora e são devolvidos em sem_pagamento.
+    """
+    pendentes = agendamentos_finalizados_do_dia(dia).outerjoin(
+        Recibo, and_(Recibo.agendamento_id == Agendamento.id, Recibo.substituido_em.is_(None))
+    ).filter(Recibo.id.is_(None)).with_entities(
+        Agendamento.id, Agendamento.paciente_id, Agendamento.servico
+    ).all()
+
+    pagamentos = {}
+    if pendentes:
+        pagamentos = {
+            agendamento_id: (valor, forma)
+            for agendamento_id, valor, forma in db.session.query(
+                ContaReceber.agendamento_id, func.sum(ContaReceber.valor), func.max(ContaReceber.forma_pagamento)
+            ).filter(
+                ContaReceber.agendamento_id.in_([p.id for p in pendentes]),
+                ContaReceber.status == 'pago'
+            ).group_by(ContaReceber.agendamento_id)
+        }
+
+    emissao = datetime.now()
+    novos = []
+    sem_pagamento = []
+    for agendamento_id, paciente_id, servico in pendentes:
+        if agendamento_id not in pagamentos:
+            sem_pagamento.append(agendamento_id)
+            continue
+        valor, forma = pagamentos[agendamento_id]
+        novos.append({
+            'paciente_id': paciente_id,
+            'agendamento_id': agendamento_id,
+            'descricao_servico': servico,
+            'valor': valor,
+            'forma_pagamento': forma,
+            'data_emissao': emissao
+        })
+
+    # Números reservados de uma vez; os que sobrarem por conflito ficam como lacuna auditável
+    for novo, numero in zip(novos, numeros_recibo(len(novos)) if novos else []):
+        novo['numero_recibo'] = numero
+
+    criados = len(novos)
+    if novos:
+        try:
+            db.session.execute(insert(Recibo), novos)
+            db.session.commit()
+        except IntegrityError:
+            # Outro usuário gerou parte dos recibos ao mesmo tempo: grava o restante um a um
+            db.session.rollback()
+            criados = 0
+            for novo in novos:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(Recibo), [novo])
+                    criados += 1
+                except IntegrityError:
+                    pass
+            db.session.commit()
+
+    return {'criados': criados, 'sem_pagamento': sem_pagamento}
+
+
+def _combinar_pdfs(caminhos: list, destino: str):
+    from pypdf import PdfWriter
+
+    escritor = PdfWriter()
+    for caminho in caminhos:
+        escritor.append(caminho)
+    temporario = f'{destino}.{os.getpid()}.tmp'
+    with open(temporario, 'wb') as arquivo:
+        escritor.write(arquivo)
+    escritor.close()
+    os.replace(temporario, destino)
+
+
+def pdf_recibos_do_dia(dia):
+    """
+    Gera o PDF único com os recibos do dia, informando o andamento: cada
+    recibo é renderizado em paralelo no pool (os que já estão em cache são
+    reaproveitados) e depois os arquivos são unidos. Produz dicionários de
+    progresso; o último traz o caminho do arquivo combinado.
+    """
+    pdfs = [pdf for pdf in (_preparar_pdf('recibo', recibo_id) for recibo_id, in recibos_do_dia(dia)) if pdf]
+    total = len(pdfs)
+    if not total:
+        yield {'etapa': 'concluido', 'total': 0, 'caminho': None}
+        return
+
+    faltando = [pdf for pdf in pdfs if not os.path.exists(pdf['caminho'])]
+    concluidos = total - len(faltando)
+    yield {'etapa': 'renderizando', 'concluidos': concluidos, 'total': total}
+
+    if faltando:
+        pool = _pool_documentos()
+        try:
+            futuros = {pool.submit(renderizar_documento, pdf['documento']): pdf for pdf in faltando}
+            for futuro in as_completed(futuros, timeout=TEMPO_MAXIMO_RENDERIZACAO * len(faltando)):
+                pdf = futuros[futuro]
+                _gravar_pdf(pdf['caminho'], futuro.result(), pdf['prefixo'])
+                concluidos += 1
+                yield {'etapa': 'renderizando', 'concluidos': concluidos, 'total': total}
+        except BrokenProcessPool:
+            _descartar_pool()
+            raise
+
+    # O arquivo combinado também fica em cache, identificado pelas versões que o compõem
+    assinatura = hashlib.sha256('|'.join(pdf['hash'] for pdf in pdfs).encode('ascii')).hexdigest()
+    prefixo = os.path.join(Config.PDF_CACHE_DIR, f"recibos_dia-{dia.strftime('%Y%m%d')}-")
+    destino = f'{prefixo}{assinatura[:20]}.pdf'
+    if not os.path.exists(destino):
+        yield {'etapa': 'combinando', 'concluidos': total, 'total': total}
+        _combinar_pdfs([pdf['caminho'] for pdf in pdfs], destino)
+        _apagar_versoes_antigas(prefixo, destino)
+
+    yield {'etapa': 'concluido', 'total': total, 'caminho': destino, 'hash': assinatura}
@@ -0,0 +1,600 @@
+"""
+Rotinas de apoio ao Módulo 3 - Financeiro
+Concentra consultas e processamentos em lote usados pelas rotas financeiras
+"""
+
+import io
+import csv
+import json
+import logging
+import base64
+import tempfile
+from itertools import chain
+from decimal import Decimal, InvalidOperation
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, or_, func, case, event, insert, select, update
+from sqlalchemy.orm import joinedload, Session
+from models.models import db, ContaReceber, ContaPagar, FluxoCaixa, Paciente, LogAuditoria, VersaoDados
+
+logger = logging.getLogger(__name__)
+
+# Status considerados "em aberto" (ainda não quitados)
+STATUS_EM_ABERTO = ('pendente', 'vencido')
+
+# Chaves de ordenação aceitas pelas listagens paginadas -> coluna do modelo
+CAMPOS_ORDENACAO = {
+    'vencimento': 'data_vencimento',
+    'valor': 'valor',
+    'criacao': 'data_criacao',
+    'id': 'id'
+}
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+
+def marcar_contas_vencidas(hoje: date = None) -> dict:
+    """
+    Marca como 'vencido' as contas pendentes com vencimento anterior a hoje.
+    Executa um único UPDATE em lote por tabela e registra no log de auditoria
+    quantas linhas foram alteradas.
+    """
+    hoje = hoje or date.today()
+    resultado = {}
+
+    try:
+        for modelo in (ContaReceber, ContaPagar):
+            atualizadas = db.session.query(modelo).filter(
+                modelo.status == 'pendente',
+                modelo.data_vencimento < hoje
+            ).update({modelo.status: 'vencido'}, synchronize_session=False)
+
+            resultado[modelo.__tablename__] = atualizadas
+
+            db.session.add(LogAuditoria(
+                usuario='sistema',
+                acao='marcar_contas_vencidas',
+                tabela=modelo.__tablename__,
+                dados_novos=json.dumps({'data_referencia': hoje.isoformat(),
+                                        'atualizadas': atualizadas})
+            ))
+
+        db.session.commit()
+    except Exception:
+        logger.exception('Erro ao marcar contas vencidas')
+        db.session.rollback()
+        raise
+
+    return resultado
+
+
+def filtro_vencidas(modelo, hoje: date = None):
+    """
+    Condição das contas vencidas: as já marcadas pela rotina diária e as
+    pendentes que venceram depois da última execução (ex.: entre a meia-noite
+    e o horário do cron), para os totais não dependerem do horário da rotina.
+    """
+    hoje = hoje or date.today()
+    return or_(
+        modelo.status == 'vencido',
+        and_(modelo.status == 'pendente', modelo.data_vencimento < hoje)
+    )
+
+
+def ler_filtros_contas(args) -> dict:
+    """
+    Lê da query string os filtros e parâmetros de paginação das listagens
+    de contas. Valores inválidos são ignorados e substituídos pelo padrão.
+    """
+    def ler_data(nome):
+        try:
+            return datetime.strptime(args.get(nome, ''), '%Y-%m-%d').date()
+        except ValueError:
+            return None
+
+    try:
+        limite = int(args.get('limite', LIMITE_PADRAO))
+    except ValueError:
+        limite = LIMITE_PADRAO
+
+    ordenar = args.get('ordenar', 'vencimento')
+
+    return {
+        'status': args.get('status', 'todas'),
+        'data_inicio': ler_data('data_inicio'),
+        'data_fim': ler_data('data_fim'),
+        'ordenar': ordenar if ordenar in CAMPOS_ORDENACAO else 'vencimento',
+        'direcao': 'desc' if args.get('direcao') == 'desc' else 'asc',
+        'limite': max(1, min(limite, LIMITE_MAXIMO)),
+        'cursor': args.get('cursor') or None
+    }
+
+
+def filtrar_contas(modelo, status='todas', data_inicio=None, data_fim=None):
+    """
+    Monta a consulta de ContaReceber/ContaPagar com filtros de status e de
+    período de vencimento. O status 'em_aberto' agrupa pendentes e vencidas;
+    'vencido' inclui as pendentes que a rotina diária ainda não marcou.
+    """
+    query = modelo.query
+
+    if status == 'em_aberto':
+        query = query.filter(modelo.status.in_(STATUS_EM_ABERTO))
+    elif status == 'vencido':
+        query = query.filter(filtro_vencidas(modelo))
+    elif status and status != 'todas':
+        query = query.filter(modelo.status == status)
+
+    if data_inicio:
+        query = query.filter(modelo.data_vencimento >= data_inicio)
+    if data_fim:
+        query = query.filter(modelo.data_vencimento <= data_fim)
+
+    return query
+
+
+def _codificar_cursor(valor, ultimo_id) -> str:
+    bruto = json.dumps([str(valor) if valor is not None else None, ultimo_id])
+    return base64.urlsafe_b64encode(bruto.encode('utf-8')).decode('ascii')
+
+
+def _decodificar_cursor(cursor: str, coluna):
+    valor, ultimo_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    tipo = coluna.type.python_type
+    if valor is not None:
+        if tipo is date:
+            valor = date.fromisoformat(valor)
+        elif tipo is datetime:
+            valor = datetime.fromisoformat(valor)
+        else:
+            valor = tipo(valor)
+            if isinstance(valor, Decimal) and not valor.is_finite():
+                raise ValueError('Valor não finito no cursor')
+    return valor, int(ultimo_id)
+
+
+def paginar_contas(query, modelo, ordenar='vencimento', direcao='asc',
+                   limite=LIMITE_PADRAO, cursor=None):
+    """
+    Pagina a consulta por cursor (keyset) sobre (coluna de ordenação, id),
+    com os nulos da coluna de ordenação no fim. Retorna a lista da página e o cursor da próxima página (ou None).
+    """
+    coluna = getattr(modelo, CAMPOS_ORDENACAO.get(ordenar, 'data_vencimento'))
+    decrescente = direcao == 'desc'
+
+    if cursor:
+        try:
+            valor, ultimo_id = _decodificar_cursor(cursor, coluna)
+        except (ValueError, TypeError, InvalidOperation):
+            valor, ultimo_id = None, None
+
+        # Valores nulos (ex.: data_criacao) ficam sempre no fim, nas duas direções
+        if ultimo_id is not None:
+            proximo_id = modelo.id < ultimo_id if decrescente else modelo.id > ultimo_id
+            if valor is None:
+                query = query.filter(coluna.is_(None), proximo_id)
+            else:
+                query = query.filter(or_(coluna < valor if decrescente else coluna > valor,
+                                         and_(coluna == valor, proximo_id),
+                                         coluna.is_(None)))
+
+    if decrescente:
+        query = query.order_by(coluna.desc().nulls_last(), modelo.id.desc())
+    else:
+        query = query.order_by(coluna.asc().nulls_last(), modelo.id.asc())
+
+    itens = query.limit(limite + 1).all()
+
+    proximo_cursor = None
+    if len(itens) > limite:
+        itens = itens[:limite]
+        ultimo = itens[-1]
+        proximo_cursor = _codificar_cursor(getattr(ultimo, coluna.key), ultimo.id)
+
+    return itens, proximo_cursor
+
+
+def gerar_json_em_lotes(query, serializar, lote: int = 500):
+    """
+    Gera um array JSON item a item, lendo o banco em lotes com yield_per,
+    para que exportações grandes não sejam montadas inteiras em memória.
+    """
+    yield '['
+    for indice, item in enumerate(query.yield_per(lote)):
+        if indice:
+            yield ','
+        yield json.dumps(serializar(item), ensure_ascii=False)
+    yield ']'
+
+
+def serializar_conta_receber(conta) -> dict:
+    return {
+        'id': conta.id,
+        'paciente_nome': conta.paciente_conta.nome,
+        'descricao': conta.descricao,
+        'valor': float(conta.valor),
+        'data_vencimento': conta.data_vencimento.strftime('%Y-%m-%d'),
+        'status': conta.status,
+        'data_pagamento': conta.data_pagamento.strftime('%Y-%m-%d') if conta.data_pagamento else None
+    }
+
+
+def serializar_conta_pagar(conta) -> dict:
+    return {
+        'id': conta.id,
+        'fornecedor': conta.fornecedor,
+        'descricao': conta.descricao,
+        'valor': float(conta.valor),
+        'data_vencimento': conta.data_vencimento.strftime('%Y-%m-%d'),
+        'status': conta.status,
+        'categoria': conta.categoria
+    }
+
+
+def _formatar_data(valor):
+    return valor.strftime('%d/%m/%Y') if valor else ''
+
+
+def _formatar_valor(valor):
+    return f"{valor:.2f}".replace('.', ',') if valor is not None else ''
+
+
+# Tabelas exportáveis: modelo, coluna de data usada no filtro de período e colunas do arquivo
+TABELAS_EXPORTACAO = {
+    'contas_receber': {
+        'modelo': ContaReceber,
+        'coluna_data': 'data_vencimento',
+        'colunas': [
+            ('ID', lambda c: c.id),
+            ('Paciente', lambda c: c.paciente_conta.nome if c.paciente_conta else ''),
+            ('Descrição', lambda c: c.descricao),
+            ('Valor', lambda c: c.valor),
+            ('Vencimento', lambda c: c.data_vencimento),
+            ('Pagamento', lambda c: c.data_pagamento),
+            ('Status', lambda c: c.status),
+            ('Forma de Pagamento', lambda c: c.forma_pagamento or '')
+        ]
+    },
+    'contas_pagar': {
+        'modelo': ContaPagar,
+        'coluna_data': 'data_vencimento',
+        'colunas': [
+            ('ID', lambda c: c.id),
+            ('Fornecedor', lambda c: c.fornecedor),
+            ('Descrição', lambda c: c.descricao),
+            ('Categoria', lambda c: c.categoria or ''),
+            ('Centro de Custo', lambda c: c.centro_custo or ''),
+            ('Valor', lambda c: c.valor),
+            ('Vencimento', lambda c: c.data_vencimento),
+            ('Pagamento', lambda c: c.data_pagamento),
+            ('Status', lambda c: c.status),
+            ('Forma de Pagamento', lambda c: c.forma_pagamento or '')
+        ]
+    },
+    'fluxo_caixa': {
+        'modelo': FluxoCaixa,
+        'coluna_data': 'data_movimento',
+        'colunas': [
+            ('ID', lambda m: m.id),
+            ('Data', lambda m: m.data_movimento),
+            ('Tipo', lambda m: m.tipo),
+            ('Categoria', lambda m: m.categoria),
+            ('Descrição', lambda m: m.descricao),
+            ('Valor', lambda m: m.valor),
+            ('Forma de Pagamento', lambda m: m.forma_pagamento or ''),
+            ('Responsável', lambda m: m.recepcionista or '')
+        ]
+    }
+}
+
+
+def consultar_exportacao(tabela: str, data_inicio=None, data_fim=None, categoria=None, status=None):
+    """
+    Monta a consulta ordenada usada na exportação de uma tabela financeira.
+    O filtro de categoria vale para contas a pagar e fluxo de caixa.
+    """
+    definicao = TABELAS_EXPORTACAO[tabela]
+    modelo = definicao['modelo']
+    coluna_data = getattr(modelo, definicao['coluna_data'])
+
+    query = modelo.query
+    if modelo is ContaReceber:
+        query = query.options(joinedload(ContaReceber.paciente_conta).load_only(Paciente.nome))
+
+    if data_inicio:
+        query = query.filter(coluna_data >= data_inicio)
+    if data_fim:
+        query = query.filter(coluna_data <= data_fim)
+    if categoria and hasattr(modelo, 'categoria'):
+        query = query.filter(modelo.categoria == categoria)
+    if status and status != 'todas' and hasattr(modelo, 'status'):
+        if status == 'em_aberto':
+            query = query.filter(modelo.status.in_(STATUS_EM_ABERTO))
+        else:
+            query = query.filter(modelo.status == status)
+
+    return query.order_by(coluna_data, modelo.id)
+
+
+def gerar_csv_em_lotes(query, colunas, lote: int = 1000):
+    """
+    Gera o CSV linha a linha (separador ';', padrão do Excel em português),
+    lendo o banco em lotes com yield_per para manter o uso de memória constante.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+
+    def descarregar():
+        conteudo = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return conteudo
+
+    # BOM para o Excel reconhecer o UTF-8
+    yield '\ufeff'
+    escritor.writerow([titulo for titulo, _ in colunas])
+    yield descarregar()
+
+    for item in query.yield_per(lote):
+        linha = []
+        for _, obter in colunas:
+            valor = obter(item)
+            if isinstance(valor, date):
+                valor = _formatar_data(valor)
+            elif valor is not None and not isinstance(valor, (str, int)):
+                valor = _formatar_valor(valor)
+            linha.append(valor)
+        escritor.writerow(linha)
+        yield descarregar()
+
+
+def gerar_xlsx_em_lotes(query, colunas, titulo: str, lote: int = 1000):
+    """
+    Grava a planilha com o openpyxl em modo write-only (as linhas vão direto
+    para o disco) e devolve um arquivo temporário posicionado no início.
+    """
+    from openpyxl import Workbook
+
+    planilha = Workbook(write_only=True)
+    aba = planilha.create_sheet(title=titulo[:31])
+    aba.append([nome for nome, _ in colunas])
+
+    for item in query.yield_per(lote):
+        linha = []
+        for _, obter in colunas:
+            valor = obter(item)
+            if valor is not None and not isinstance(valor, (str, int, date)):
+                valor = float(valor)
+            linha.append(valor)
+        aba.append(linha)
+
+    arquivo = tempfile.TemporaryFile()
+    planilha.save(arquivo)
+    arquivo.seek(0)
+    return arquivo
+
+
+# ========== PROJEÇÃO DE FLUXO DE CAIXA ==========
+
+HORIZONTES_PROJECAO = (30, 60, 90)
+
+# Cache por processo: {dias: (data base, versão dos dados financeiros, resultado)}.
+# Só a projeção da data base mais recente de cada horizonte fica guardada: a
+# virada do dia substitui a entrada em vez de acumular projeções antigas.
+# A versão fica no banco (VersaoDados) e é incrementada na mesma transação de
+# cada gravação em contas ou movimentos, em qualquer worker do gunicorn; o
+# resultado em cache vale enquanto a versão lida for a mesma.
+_cache_projecao = {}
+VERSAO_FINANCEIRO = 'financeiro'
+
+
+def garantir_versao_financeiro():
+    """Cria o contador de versão dos dados financeiros (comando init-db)"""
+    if db.session.get(VersaoDados, VERSAO_FINANCEIRO) is None:
+        db.session.add(VersaoDados(nome=VERSAO_FINANCEIRO, versao=0))
+        db.session.commit()
+
+
+def versao_financeiro():
+    """Versão atual dos dados financeiros (None se o init-db ainda não criou o contador)"""
+    return db.session.query(VersaoDados.versao).filter(VersaoDados.nome == VERSAO_FINANCEIRO).scalar()
+
+
+def registrar_alteracao_financeira(conexao):
+    """
+    Incrementa a versão dos dados financeiros na transação da conexão informada.
+    Chamado automaticamente nos flushes; gravações em lote (UPDATE/INSERT direto)
+    precisam chamá-lo explicitamente.
+    """
+    conexao.execute(
+        update(VersaoDados).where(VersaoDados.nome == VERSAO_FINANCEIRO)
+        .values(versao=VersaoDados.versao + 1)
+    )
+
+
+@event.listens_for(Session, 'after_flush')
+def _marcar_alteracao_financeira(session, contexto):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (ContaReceber, ContaPagar, FluxoCaixa)):
+            registrar_alteracao_financeira(session.connection())
+            return
+
+
+def projetar_fluxo_caixa(dias: int = 30, hoje: date = None) -> dict:
+    """
+    Projeta o saldo de caixa dia a dia para os próximos `dias` dias.
+    O saldo inicial é o acumulado do FluxoCaixa até hoje; a ele somam-se as
+    contas a receber e subtraem-se as contas a pagar em aberto, por data de
+    vencimento (contas já vencidas entram no dia de hoje).
+    São três consultas agregadas e uma única passada ordenada pelos dias.
+    O resultado fica em cache até a próxima alteração financeira, em qualquer
+    worker: cada leitura confere apenas a versão dos dados no banco.
+    """
+    hoje = hoje or date.today()
+
+    versao = versao_financeiro()
+    em_cache = _cache_projecao.get(dias)
+    if em_cache and versao is not None and em_cache[:2] == (hoje, versao):
+        return em_cache[2]
+
+    fim = hoje + timedelta(days=dias)
+
+    saldo_inicial = db.session.query(
+        func.coalesce(func.sum(case((FluxoCaixa.tipo == 'entrada', FluxoCaixa.valor),
+                                    else_=-FluxoCaixa.valor)), 0)
+    ).filter(FluxoCaixa.data_movimento <= hoje).scalar()
+
+    def totais_por_dia(modelo):
+        linhas = db.session.query(
+            modelo.data_vencimento, func.sum(modelo.valor)
+        ).filter(
+            modelo.status.in_(STATUS_EM_ABERTO),
+            modelo.data_vencimento <= fim
+        ).group_by(modelo.data_vencimento).all()
+
+        totais = {}
+        for vencimento, total in linhas:
+            dia = max(vencimento, hoje)
+            totais[dia] = totais.get(dia, Decimal('0')) + Decimal(total or 0)
+        return totais
+
+    entradas = totais_por_dia(ContaReceber)
+    saidas = totais_por_dia(ContaPagar)
+
+    saldo = Decimal(saldo_inicial or 0)
+    menor_saldo = saldo
+    projecao = []
+    for deslocamento in range(dias + 1):
+        dia = hoje + timedelta(days=deslocamento)
+        entrada = entradas.get(dia, Decimal('0'))
+        saida = saidas.get(dia, Decimal('0'))
+        saldo += entrada - saida
+        menor_saldo = min(menor_saldo, saldo)
+        projecao.append({
+            'data': dia.strftime('%Y-%m-%d'),
+            'entradas': float(entrada),
+            'saidas': float(saida),
+            'saldo': float(saldo)
+        })
+
+    resultado = {
+        'data_base': hoje.strftime('%Y-%m-%d'),
+        'dias': dias,
+        'saldo_inicial': float(saldo_inicial or 0),
+        'saldo_final': float(saldo),
+        'menor_saldo': float(menor_saldo),
+        'projecao': projecao
+    }
+
+    if versao is not None:
+        _cache_projecao[dias] = (hoje, versao, resultado)
+    return resultado
+
+
+# ========== LIQUIDAÇÃO EM LOTE ==========
+
+def _resultado_nao_liquidada(conta_id: int, status: str, data_pagamento) -> dict:
+    if status == 'pago':
+        return {'id': conta_id, 'resultado': 'ja_pago',
+                'data_pagamento': data_pagamento.strftime('%Y-%m-%d') if data_pagamento else None}
+    return {'id': conta_id, 'resultado': 'nao_liquidada', 'status': status}
+
+
+def liquidar_contas_em_lote(modelo, ids, data_pagamento: date = None, forma_pagamento: str = None) -> list:
+    """
+    Marca como pagas várias contas (ContaReceber ou ContaPagar) em uma única
+    transação, com UPDATE e INSERT em lote no FluxoCaixa.
+    É idempotente: contas já pagas são reportadas como 'ja_pago', com a data
+    em que foram pagas, e não geram novo movimento de caixa. Retorna o
+    resultado de cada id solicitado.
+    """
+    data_pagamento = data_pagamento or date.today()
+    ids = list(dict.fromkeys(int(i) for i in ids))
+
+    query = modelo.query.filter(modelo.id.in_(ids))
+    if modelo is ContaReceber:
+        query = query.options(joinedload(ContaReceber.paciente_conta).load_only(Paciente.nome))
+    # FOR UPDATE só na tabela da conta: o PostgreSQL não aceita travar o lado
+    # opcional do LEFT OUTER JOIN do paciente
+    contas = {conta.id: conta for conta in query.with_for_update(of=modelo).all()}
+
+    resultados = []
+    movimentos = {}
+    ids_liquidar = []
+
+    for conta_id in ids:
+        conta = contas.get(conta_id)
+        if not conta:
+            resultados.append({'id': conta_id, 'resultado': 'nao_encontrada'})
+            continue
+        if conta.status == 'pago':
+            resultados.append(_resultado_nao_liquidada(conta_id, conta.status, conta.data_pagamento))
+            continue
+
+        forma = forma_pagamento or conta.forma_pagamento
+        if modelo is ContaReceber:
+            movimentos[conta_id] = {
+                'data_movimento': data_pagamento,
+                'tipo': 'entrada',
+                'categoria': 'Cortesia' if forma == 'Cortesia' else 'Receita de Serviços',
+                'descricao': f'Recebimento: {conta.descricao}',
+                'valor': conta.valor,
+                'conta_receber_id': conta.id,
+                'recepcionista': conta.paciente_conta.nome if conta.paciente_conta else '',
+                'forma_pagamento': forma
+            }
+        else:
+            movimentos[conta_id] = {
+                'data_movimento': data_pagamento,
+                'tipo': 'saida',
+                'categoria': conta.categoria or 'Geral',
+                'descricao': f'Pagamento: {conta.descricao}',
+                'valor': conta.valor,
+                'conta_pagar_id': conta.id,
+                'recepcionista': conta.fornecedor,
+                'forma_pagamento': forma
+            }
+
+        ids_liquidar.append(conta_id)
+        resultados.append({'id': conta_id, 'resultado': 'liquidada',
+                           'data_pagamento': data_pagamento.strftime('%Y-%m-%d')})
+
+    try:
+        if ids_liquidar:
+            valores = {'status': 'pago', 'data_pagamento': data_pagamento}
+            if forma_pagamento:
+                valores['forma_pagamento'] = forma_pagamento
+
+            # Só gera movimento de caixa para as contas que este UPDATE de fato
+            # mudou: no SQLite o FOR UPDATE não trava nada e outra liquidação
+            # simultânea pode ter pago parte delas
+            liquidadas = set(db.session.execute(
+                update(modelo)
+                .where(modelo.id.in_(ids_liquidar), modelo.status.in_(STATUS_EM_ABERTO))
+                .values(**valores)
+                .returning(modelo.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+            if liquidadas:
+                db.session.execute(insert(FluxoCaixa), [movimentos[i] for i in ids_liquidar if i in liquidadas])
+                registrar_alteracao_financeira(db.session.connection())
+
+            # As que outra liquidação pagou antes deste UPDATE voltam como as
+            # já pagas antes da chamada, com a data gravada por ela
+            perdidas = [i for i in ids_liquidar if i not in liquidadas]
+            if perdidas:
+                atuais = {linha.id: linha for linha in db.session.execute(
+                    select(modelo.id, modelo.status, modelo.data_pagamento).where(modelo.id.in_(perdidas))
+                )}
+                for posicao, resultado in enumerate(resultados):
+                    atual = atuais.get(resultado['id']) if resultado['id'] in perdidas else None
+                    if atual:
+                        resultados[posicao] = _resultado_nao_liquidada(atual.id, atual.status, atual.data_pagamento)
+            ids_liquidar = list(liquidadas)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return resultados
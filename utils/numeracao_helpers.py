@@ -0,0 +1,170 @@
+"""
+Numeração sequencial de documentos (recibos)
+Cada processo do gunicorn reserva um bloco de números com um único UPDATE na
+tabela de sequências e vai consumindo o bloco em memória. Todo bloco
+reservado fica registrado, de modo que as lacunas (números reservados e não
+usados, por reinício do processo ou gravação desfeita) podem ser auditadas.
+"""
+
+import os
+import re
+import socket
+import threading
+from sqlalchemy import update, insert, select
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from models.models import db, SequenciaDocumento, BlocoNumeracao, Recibo
+
+SEQUENCIA_RECIBOS = 'recibo'
+FORMATO_RECIBO = 'REC-{:08d}'
+_PADRAO_RECIBO = re.compile(r'^REC-(\d{8})$')
+
+# Blocos em uso neste processo: sequencia -> [pid, proximo, fim]
+_blocos = {}
+_trava_blocos = threading.Lock()
+
+
+def _reservar_bloco(sequencia: str, tamanho: int) -> tuple:
+    """
+    Reserva os próximos `tamanho` números da sequência e registra o bloco.
+    Usa uma conexão própria, confirmada na hora: o bloco continua reservado
+    mesmo que a transação da requisição seja desfeita. O UPDATE trava a linha
+    da sequência até o fim da transação, serializando os processos.
+    """
+    processo = f'{socket.gethostname()}:{os.getpid()}'[:100]
+    with db.engine.begin() as conexao:
+        fim = conexao.execute(
+            update(SequenciaDocumento).where(SequenciaDocumento.nome == sequencia)
+            .values(proximo=SequenciaDocumento.proximo + tamanho)
+            .returning(SequenciaDocumento.proximo)
+        ).scalar()
+        if fim is None:
+            # Primeira reserva da sequência (outro processo pode criá-la ao mesmo tempo)
+            try:
+                with conexao.begin_nested():
+                    conexao.execute(insert(SequenciaDocumento).values(nome=sequencia, proximo=1 + tamanho))
+                fim = 1 + tamanho
+            except IntegrityError:
+                fim = conexao.execute(
+                    update(SequenciaDocumento).where(SequenciaDocumento.nome == sequencia)
+                    .values(proximo=SequenciaDocumento.proximo + tamanho)
+                    .returning(SequenciaDocumento.proximo)
+                ).scalar()
+        inicio, fim = fim - tamanho, fim - 1
+        conexao.execute(insert(BlocoNumeracao).values(
+            sequencia=sequencia, inicio=inicio, fim=fim, processo=processo
+        ))
+    return inicio, fim
+
+
+def _sessao_tem_escrita_sqlite() -> bool:
+    """
+    A sessão da requisição já gravou algo no SQLite? Nesse caso ela detém a
+    trava de escrita do banco e a conexão própria de _reservar_bloco esperaria
+    por ela até estourar o tempo limite ("database is locked").
+    """
+    sessao = db.session()
+    if db.engine.dialect.name != 'sqlite' or not sessao.in_transaction():
+        return False
+    # O driver sqlite3 só abre a transação (BEGIN) no primeiro comando de escrita
+    return sessao.connection().connection.dbapi_connection.in_transaction
+
+
+def proximos_numeros(sequencia: str, quantidade: int = 1) -> list:
+    """
+    Próximos números da sequência para este processo. Só vai ao banco quando
+    o bloco em memória acaba; pedidos grandes reservam um bloco do tamanho
+    necessário. Precisa ser chamado antes de gravar na sessão da requisição:
+    no SQLite a reserva precisa da trava de escrita do banco, e a chamada fora
+    de ordem lança RuntimeError em vez de travar.
+    """
+    if _sessao_tem_escrita_sqlite():
+        raise RuntimeError('Reserve a numeração antes de gravar na sessão (SQLite: trava de escrita em uso)')
+
+    numeros = []
+    with _trava_blocos:
+        bloco = _blocos.get(sequencia)
+        # Processo filho (fork) não reaproveita o bloco do pai
+        if bloco and bloco[0] != os.getpid():
+            bloco = None
+        while len(numeros) < quantidade:
+            if bloco is None or bloco[1] > bloco[2]:
+                inicio, fim = _reservar_bloco(sequencia, max(Config.NUMERACAO_TAMANHO_BLOCO,
+                                                             quantidade - len(numeros)))
+                bloco = [os.getpid(), inicio, fim]
+            usar = min(quantidade - len(numeros), bloco[2] - bloco[1] + 1)
+            numeros.extend(range(bloco[1], bloco[1] + usar))
+            bloco[1] += usar
+        _blocos[sequencia] = bloco
+    return numeros
+
+
+def numeros_recibo(quantidade: int) -> list:
+    """Números para `quantidade` recibos novos (REC-00000001, ...)"""
+    return [FORMATO_RECIBO.format(numero) for numero in proximos_numeros(SEQUENCIA_RECIBOS, quantidade)]
+
+
+def numero_recibo() -> str:
+    """Número para um recibo novo"""
+    return numeros_recibo(1)[0]
+
+
+def _intervalos(numeros: list) -> list:
+    """[1, 2, 3, 7, 9, 10] -> [[1, 3], [7, 7], [9, 10]]"""
+    intervalos = []
+    for numero in numeros:
+        if intervalos and numero == intervalos[-1][1] + 1:
+            intervalos[-1][1] = numero
+        else:
+            intervalos.append([numero, numero])
+    return intervalos
+
+
+def auditoria_numeracao_recibos() -> dict:
+    """
+    Confronta os blocos reservados com os recibos emitidos: para cada bloco,
+    quantos números foram usados e quais ficaram sem recibo (lacunas). Números
+    emitidos fora de qualquer bloco ou repetidos entre blocos indicam erro.
+    Recibos substituídos por reemissão continuam contando como usados.
+    Recibos no formato antigo (anterior à sequência) não entram na conferência.
+    """
+    usados = set()
+    substituidos = 0
+    for numero, substituido_em in db.session.execute(
+        select(Recibo.numero_recibo, Recibo.substituido_em).where(Recibo.numero_recibo.like('REC-%'))
+    ):
+        encontrado = _PADRAO_RECIBO.match(numero or '')
+        if encontrado:
+            usados.add(int(encontrado.group(1)))
+            substituidos += substituido_em is not None
+
+    blocos = []
+    reservados = set()
+    sobrepostos = []
+    for bloco in BlocoNumeracao.query.filter_by(sequencia=SEQUENCIA_RECIBOS).order_by(BlocoNumeracao.inicio):
+        faixa = range(bloco.inicio, bloco.fim + 1)
+        if reservados.intersection(faixa):
+            sobrepostos.append(bloco.id)
+        reservados.update(faixa)
+        nao_usados = [numero for numero in faixa if numero not in usados]
+        blocos.append({
+            'id': bloco.id,
+            'inicio': bloco.inicio,
+            'fim': bloco.fim,
+            'processo': bloco.processo,
+            'data_alocacao': bloco.data_alocacao.isoformat(),
+            'usados': len(faixa) - len(nao_usados),
+            'lacunas': _intervalos(nao_usados)
+        })
+
+    sequencia = db.session.get(SequenciaDocumento, SEQUENCIA_RECIBOS)
+    return {
+        'proximo': sequencia.proximo if sequencia else 1,
+        'emitidos': len(usados),
+        'substituidos': substituidos,
+        'reservados': len(reservados),
+        'nao_usados': len(reservados - usados),
+        'blocos': blocos,
+        'fora_de_bloco': _intervalos(sorted(usados - reservados)),
+        'blocos_sobrepostos': sobrepostos
+    }
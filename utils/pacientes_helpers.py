@@ -0,0 +1,282 @@
+"""
+Rotinas de apoio ao cadastro de pacientes
+Detecção de cadastros duplicados (com chaves de bloqueio) e mesclagem
+"""
+
+import json
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from itertools import combinations
+from sqlalchemy import event, inspect, update, delete
+from sqlalchemy.exc import IntegrityError
+from models.models import (db, Paciente, Agendamento, SerieAgendamento, Prontuario, SolicitacaoExame,
+                           Receituario, Laudo, Atestado, Recibo, ContaReceber, AvaliacaoSatisfacao,
+                           FatoReceita, AnexoProntuario, LogAuditoria)
+from utils.prontuario_helpers import invalidar_indice_prontuarios
+
+# Tabelas com paciente_id que acompanham o paciente na mesclagem
+MODELOS_COM_PACIENTE = (
+    Agendamento, SerieAgendamento, Prontuario, SolicitacaoExame, Receituario, Laudo,
+    Atestado, Recibo, ContaReceber, AvaliacaoSatisfacao, FatoReceita, AnexoProntuario
+)
+
+CAMPOS_MESCLAVEIS = (
+    'cpf', 'email', 'data_nascimento', 'idade', 'naturalidade', 'estado_civil', 'religiao',
+    'profissao', 'filiacao_pai', 'filiacao_mae', 'endereco', 'bairro', 'cidade'
+)
+
+TAMANHO_PREFIXO_NOME = 8
+LIMIAR_PADRAO = 0.75
+# Blocos muito grandes (ex.: telefone genérico) não ajudam e voltariam ao O(n²)
+TAMANHO_MAXIMO_BLOCO = 50
+
+
+def somente_digitos(valor) -> str:
+    return re.sub(r'\D', '', valor or '')
+
+
+def formatar_cpf(valor) -> str:
+    """000.000.000-00 quando há 11 dígitos; caso contrário, o valor como veio"""
+    numeros = somente_digitos(valor)
+    if len(numeros) == 11:
+        return f"{numeros[:3]}.{numeros[3:6]}.{numeros[6:9]}-{numeros[9:]}"
+    return valor
+
+
+def formatar_telefone(valor) -> str:
+    """(00) 00000-0000 ou (00) 0000-0000; caso contrário, o valor como veio"""
+    numeros = somente_digitos(valor)
+    if len(numeros) == 11:
+        return f"({numeros[:2]}) {numeros[2:7]}-{numeros[7:]}"
+    elif len(numeros) == 10:
+        return f"({numeros[:2]}) {numeros[2:6]}-{numeros[6:]}"
+    return valor
+
+
+def identificadores_normalizados(cpf, telefone) -> dict:
+    """CPF e telefone formatados para exibição e suas versões só com dígitos"""
+    cpf = (cpf or '').strip() or None
+    telefone = (telefone or '').strip()
+    return {
+        'cpf': formatar_cpf(cpf) if cpf else None,
+        'cpf_digitos': somente_digitos(cpf) or None,
+        'telefone': formatar_telefone(telefone),
+        'telefone_digitos': somente_digitos(telefone)
+    }
+
+
+@event.listens_for(Paciente, 'before_insert')
+def _normalizar_identificadores_novo(mapper, connection, paciente):
+    for campo, valor in identificadores_normalizados(paciente.cpf, paciente.telefone).items():
+        setattr(paciente, campo, valor)
+
+
+@event.listens_for(Paciente, 'before_update')
+def _normalizar_identificadores_alterados(mapper, connection, paciente):
+    # Só reformata o que foi alterado, para não esbarrar em CPFs duplicados antigos
+    estado = inspect(paciente)
+    normalizados = identificadores_normalizados(paciente.cpf, paciente.telefone)
+    for origem in ('cpf', 'telefone'):
+        if estado.attrs[origem].history.has_changes():
+            setattr(paciente, origem, normalizados[origem])
+            setattr(paciente, f'{origem}_digitos', normalizados[f'{origem}_digitos'])
+
+
+def normalizar_identificadores_em_lote(lote: int = 500) -> int:
+    """
+    Preenche cpf_digitos/telefone_digitos e formata CPF e telefone dos cadastros
+    antigos, em lotes (um UPDATE por lote, paginando pelo id). Quando dois
+    cadastros só diferem na formatação do CPF (duplicados), o CPF do segundo
+    fica como está e apenas as colunas de dígitos são preenchidas.
+    """
+    total = 0
+    ultimo_id = 0
+    while True:
+        linhas = db.session.query(Paciente.id, Paciente.cpf, Paciente.telefone).filter(
+            Paciente.id > ultimo_id,
+            Paciente.telefone_digitos.is_(None)
+        ).order_by(Paciente.id).limit(lote).all()
+        if not linhas:
+            return total
+
+        ultimo_id = linhas[-1].id
+        alteracoes = [{'id': id_, **identificadores_normalizados(cpf, telefone)} for id_, cpf, telefone in linhas]
+        try:
+            db.session.execute(update(Paciente), alteracoes)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            for alteracao in alteracoes:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(update(Paciente), [alteracao])
+                except IntegrityError:
+                    sem_cpf = {campo: valor for campo, valor in alteracao.items() if campo != 'cpf'}
+                    db.session.execute(update(Paciente), [sem_cpf])
+            db.session.commit()
+        total += len(alteracoes)
+
+
+def garantir_identificadores_normalizados():
+    """Normaliza os cadastros antigos na primeira inicialização após a migração"""
+    if db.session.query(Paciente.id).filter(Paciente.telefone_digitos.is_(None)).first() is not None:
+        total = normalizar_identificadores_em_lote()
+        print(f"✅ Identificadores normalizados: {total} paciente(s)")
+
+
+def normalizar_nome(nome) -> str:
+    """Minúsculas, sem acentos e com espaços simples"""
+    sem_acento = unicodedata.normalize('NFKD', nome or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sem_acento.lower().split())
+
+
+def cpf_valido_para_comparacao(cpf) -> str:
+    """Dígitos do CPF, ou '' quando ausente ou fictício (ex.: 000.000.000-00)"""
+    digitos = somente_digitos(cpf)
+    if len(digitos) != 11 or len(set(digitos)) == 1:
+        return ''
+    return digitos
+
+
+def chaves_bloqueio(paciente: dict) -> set:
+    """Chaves que agrupam cadastros candidatos; só pares que dividem uma chave são comparados"""
+    chaves = set()
+    nome = paciente['nome_normalizado']
+    if len(nome) >= 4:
+        chaves.add('n:' + nome[:TAMANHO_PREFIXO_NOME])
+    if len(paciente['telefone']) >= 8:
+        chaves.add('t:' + paciente['telefone'][-8:])
+    if paciente['data_nascimento']:
+        chaves.add('d:' + paciente['data_nascimento'].isoformat())
+    if paciente['cpf']:
+        chaves.add('c:' + paciente['cpf'])
+    return chaves
+
+
+def pontuar_par(a: dict, b: dict) -> float:
+    """Semelhança entre dois cadastros, de 0 a 1"""
+    if a['cpf'] and b['cpf']:
+        if a['cpf'] == b['cpf']:
+            return 1.0
+        # CPFs diferentes e válidos: pessoas diferentes
+        return 0.0
+
+    pontos = 0.5 * SequenceMatcher(None, a['nome_normalizado'], b['nome_normalizado']).ratio()
+    if a['telefone'] and a['telefone'][-8:] == b['telefone'][-8:]:
+        pontos += 0.25
+    if a['data_nascimento'] and a['data_nascimento'] == b['data_nascimento']:
+        pontos += 0.15
+    if a['email'] and a['email'] == b['email']:
+        pontos += 0.1
+    return round(pontos, 3)
+
+
+def encontrar_duplicados(limiar: float = LIMIAR_PADRAO) -> list:
+    """
+    Lista pares de cadastros prováveis de serem a mesma pessoa, do mais para o
+    menos provável. Os pacientes são lidos uma vez (só as colunas usadas) e
+    agrupados por chaves de bloqueio: nome normalizado, telefone, nascimento e CPF.
+    """
+    pacientes = {}
+    blocos = {}
+
+    consulta = db.session.query(
+        Paciente.id, Paciente.nome, Paciente.cpf_digitos, Paciente.telefone_digitos,
+        Paciente.data_nascimento, Paciente.email
+    ).execution_options(yield_per=2000)
+
+    for id_, nome, cpf, telefone, data_nascimento, email in consulta:
+        paciente = {
+            'id': id_,
+            'nome': nome,
+            'nome_normalizado': normalizar_nome(nome),
+            'cpf': cpf_valido_para_comparacao(cpf),
+            'telefone': telefone or '',
+            'data_nascimento': data_nascimento,
+            'email': (email or '').strip().lower()
+        }
+        pacientes[id_] = paciente
+        for chave in chaves_bloqueio(paciente):
+            blocos.setdefault(chave, []).append(id_)
+
+    pares = {}
+    for ids in blocos.values():
+        if len(ids) < 2 or len(ids) > TAMANHO_MAXIMO_BLOCO:
+            continue
+        for id_a, id_b in combinations(sorted(ids), 2):
+            if (id_a, id_b) in pares:
+                continue
+            pares[(id_a, id_b)] = pontuar_par(pacientes[id_a], pacientes[id_b])
+
+    candidatos = [
+        {'paciente_a': pacientes[a], 'paciente_b': pacientes[b], 'pontuacao': pontos}
+        for (a, b), pontos in pares.items() if pontos >= limiar
+    ]
+    return sorted(candidatos, key=lambda c: c['pontuacao'], reverse=True)
+
+
+def mesclar_pacientes(manter_id: int, remover_ids: list, usuario: str = 'sistema') -> dict:
+    """
+    Move todos os registros dos pacientes removidos para o paciente mantido
+    (um UPDATE por tabela), completa os campos vazios do mantido com os dados
+    dos removidos e exclui os duplicados, tudo em uma transação.
+    Retorna a quantidade de registros movidos por tabela.
+    """
+    remover_ids = [i for i in set(remover_ids) if i != manter_id]
+    if not remover_ids:
+        raise ValueError('Informe ao menos um cadastro para mesclar')
+
+    mantido = db.session.get(Paciente, manter_id)
+    removidos = Paciente.query.filter(Paciente.id.in_(remover_ids)).order_by(Paciente.data_cadastro.desc()).all()
+    if not mantido or len(removidos) != len(remover_ids):
+        raise ValueError('Paciente não encontrado')
+
+    try:
+        movidos = {}
+        for modelo in MODELOS_COM_PACIENTE:
+            resultado = db.session.execute(
+                update(modelo).where(modelo.paciente_id.in_(remover_ids))
+                .values(paciente_id=manter_id)
+                .execution_options(synchronize_session=False)
+            )
+            movidos[modelo.__tablename__] = resultado.rowcount
+
+        # Campos vazios do cadastro mantido são completados pelo mais recente
+        complementos = {}
+        for campo in CAMPOS_MESCLAVEIS:
+            if getattr(mantido, campo) in (None, ''):
+                for removido in removidos:
+                    valor = getattr(removido, campo)
+                    if valor not in (None, ''):
+                        complementos[campo] = valor
+                        break
+
+        dados_removidos = [{'id': p.id, 'nome': p.nome, 'cpf': p.cpf, 'telefone': p.telefone} for p in removidos]
+
+        # O CPF é único: os duplicados saem antes de o mantido herdar o CPF deles
+        db.session.execute(
+            delete(Paciente).where(Paciente.id.in_(remover_ids))
+            .execution_options(synchronize_session=False)
+        )
+        for removido in removidos:
+            db.session.expunge(removido)
+
+        for campo, valor in complementos.items():
+            setattr(mantido, campo, valor)
+
+        db.session.add(LogAuditoria(
+            usuario=usuario,
+            acao='mesclar_pacientes',
+            tabela='pacientes',
+            registro_id=manter_id,
+            dados_anteriores=json.dumps(dados_removidos, ensure_ascii=False),
+            dados_novos=json.dumps(movidos)
+        ))
+        db.session.commit()
+        invalidar_indice_prontuarios(manter_id, *remover_ids)
+        return movidos
+    except Exception as e:
+        print(f"Erro ao mesclar pacientes: {e}")
+        db.session.rollback()
+        raise
@@ -0,0 +1,68 @@
+"""
+Renderização em PDF dos documentos médicos (reportlab)
+Roda nos processos do pool de documentos: recebe apenas dados simples
+(dicionários e textos) e não depende do Flask nem do banco
+"""
+
+import io
+from xml.sax.saxutils import escape
+
+# Alterar quando o layout mudar, para que os PDFs já gerados sejam refeitos
+VERSAO_LAYOUT = 1
+
+
+def renderizar_documento(documento: dict) -> bytes:
+    """
+    Gera o PDF (A4) de um documento no formato montado por
+    utils.documentos_helpers: cabeçalho da clínica, título, campos do
+    paciente, seções de texto e, quando houver, a assinatura do médico.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, HRFlowable, KeepTogether
+
+    estilos = getSampleStyleSheet()
+    centro = ParagraphStyle('centro', parent=estilos['Normal'], alignment=TA_CENTER, fontSize=10, leading=13)
+    clinica = ParagraphStyle('clinica', parent=estilos['Title'], fontSize=15, spaceAfter=4)
+    titulo = ParagraphStyle('titulo', parent=estilos['Heading2'], alignment=TA_CENTER, spaceBefore=18, spaceAfter=14)
+    secao = ParagraphStyle('secao', parent=estilos['Heading4'], spaceBefore=10, spaceAfter=4)
+    texto = ParagraphStyle('texto', parent=estilos['Normal'], alignment=TA_JUSTIFY, fontSize=11, leading=16)
+
+    buffer = io.BytesIO()
+    pdf = SimpleDocTemplate(
+        buffer, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm, topMargin=2 * cm, bottomMargin=2 * cm,
+        title=documento['titulo'], author=documento.get('autor', '')
+    )
+
+    cabecalho = documento.get('cabecalho') or []
+    elementos = []
+    if cabecalho:
+        elementos.append(Paragraph(escape(cabecalho[0]), clinica))
+        elementos.extend(Paragraph(escape(linha), centro) for linha in cabecalho[1:])
+        elementos.append(HRFlowable(width='100%', thickness=0.5, spaceBefore=8))
+
+    elementos.append(Paragraph(escape(documento['titulo']), titulo))
+
+    for rotulo, valor in documento.get('campos', []):
+        elementos.append(Paragraph(f'<b>{escape(rotulo)}:</b> {escape(str(valor or "-"))}', texto))
+
+    for titulo_secao, conteudo in documento.get('secoes', []):
+        if titulo_secao:
+            elementos.append(Paragraph(escape(titulo_secao), secao))
+        else:
+            elementos.append(Spacer(1, 10))
+        # Um parágrafo por linha, preservando as quebras digitadas
+        elementos.extend(Paragraph(escape(linha) or '&nbsp;', texto) for linha in (conteudo or '').splitlines())
+
+    assinatura = documento.get('assinatura')
+    if assinatura:
+        elementos.append(KeepTogether([
+            Spacer(1, 2.5 * cm),
+            HRFlowable(width='50%', thickness=0.5, spaceAfter=4),
+            *(Paragraph(escape(linha), centro) for linha in assinatura)
+        ]))
+
+    pdf.build(elementos)
+    return buffer.getvalue()
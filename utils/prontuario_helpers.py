@@ -0,0 +1,339 @@
+"""
+Rotinas de apoio ao Módulo 2 - Prontuário Eletrônico
+Linha do tempo clínica do paciente, índice de prontuários anteriores e busca textual
+"""
+
+import base64
+import json
+import re
+from itertools import chain
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select, union_all, literal, func, and_, or_, type_coerce, event, text, String, DateTime
+from sqlalchemy.orm import Session
+from models.models import (db, Prontuario, AtendimentoHistorico, SolicitacaoExame, Receituario,
+                           Laudo, Atestado, AnexoProntuario)
+from utils.db_helpers import CAMPOS_BUSCA_TEXTUAL, CONFIGURACAO_BUSCA_POSTGRES, documento_busca_postgres
+
+LIMITE_LINHA_DO_TEMPO = 30
+LIMITE_MAXIMO_LINHA_DO_TEMPO = 200
+TAMANHO_RESUMO = 300
+
+LIMITE_INDICE_PRONTUARIOS = 20
+LIMITE_MAXIMO_INDICE_PRONTUARIOS = 200
+TAMANHO_TRECHO_DIAGNOSTICO = 120
+
+
+def _resumo(coluna):
+    return func.substr(coluna, 1, TAMANHO_RESUMO)
+
+
+def _eventos_do_paciente(paciente_id: int):
+    """
+    UNION ALL com um SELECT por tipo de evento clínico, todos com as colunas
+    (tipo, id, data, titulo, resumo, prontuario_id). Textos longos vêm
+    truncados e o conteúdo binário dos anexos não é lido.
+    """
+    def evento(tipo, modelo, data, titulo, resumo, prontuario_id):
+        return select(
+            literal(tipo, String).label('tipo'),
+            modelo.id.label('id'),
+            type_coerce(data, DateTime).label('data'),
+            type_coerce(titulo, String).label('titulo'),
+            type_coerce(resumo, String).label('resumo'),
+            prontuario_id.label('prontuario_id')
+        )
+
+    return union_all(
+        evento('atendimento', Prontuario, Prontuario.data_atendimento,
+               func.coalesce(Prontuario.especialidade, 'Atendimento'), _resumo(Prontuario.diagnostico),
+               Prontuario.id).where(Prontuario.paciente_id == paciente_id),
+        evento('historico', AtendimentoHistorico, AtendimentoHistorico.data_atendimento,
+               func.coalesce(AtendimentoHistorico.tipo_atendimento, 'Histórico'), _resumo(AtendimentoHistorico.descricao),
+               AtendimentoHistorico.prontuario_id).join(
+            Prontuario, Prontuario.id == AtendimentoHistorico.prontuario_id
+        ).where(Prontuario.paciente_id == paciente_id),
+        evento('exame', SolicitacaoExame, SolicitacaoExame.data_solicitacao,
+               SolicitacaoExame.tipo_exame, _resumo(SolicitacaoExame.indicacao_clinica),
+               SolicitacaoExame.prontuario_id).where(SolicitacaoExame.paciente_id == paciente_id),
+        evento('receituario', Receituario, Receituario.data_emissao,
+               literal('Receituário'), _resumo(Receituario.medicamentos),
+               Receituario.prontuario_id).where(Receituario.paciente_id == paciente_id),
+        evento('laudo', Laudo, Laudo.data_emissao,
+               Laudo.titulo, _resumo(Laudo.conclusao),
+               Laudo.prontuario_id).where(Laudo.paciente_id == paciente_id),
+        evento('atestado', Atestado, Atestado.data_emissao,
+               literal('Atestado'), Atestado.cid,
+               Atestado.prontuario_id).where(Atestado.paciente_id == paciente_id),
+        evento('anexo', AnexoProntuario, AnexoProntuario.data_upload,
+               AnexoProntuario.nome_original, _resumo(AnexoProntuario.descricao),
+               AnexoProntuario.prontuario_id).where(AnexoProntuario.paciente_id == paciente_id)
+    ).subquery()
+
+
+def _codificar_cursor(data, tipo, id_) -> str:
+    bruto = json.dumps([data.isoformat() if data else None, tipo, id_])
+    return base64.urlsafe_b64encode(bruto.encode('utf-8')).decode('ascii')
+
+
+def _decodificar_cursor(cursor: str):
+    data, tipo, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return datetime.fromisoformat(data) if data else None, tipo, int(id_)
+
+
+def linha_do_tempo(paciente_id: int, limite: int = LIMITE_LINHA_DO_TEMPO, cursor: str = None):
+    """
+    Eventos clínicos do paciente do mais recente para o mais antigo, em uma
+    única consulta por página (keyset sobre data, tipo e id).
+    Retorna a lista de eventos e o cursor da próxima página (ou None).
+    """
+    eventos = _eventos_do_paciente(paciente_id)
+    query = select(eventos).where(eventos.c.data.isnot(None))
+
+    if cursor:
+        try:
+            data, tipo, id_ = _decodificar_cursor(cursor)
+        except (ValueError, TypeError, json.JSONDecodeError):
+            data = None
+        if data:
+            query = query.where(or_(
+                eventos.c.data < data,
+                and_(eventos.c.data == data, or_(
+                    eventos.c.tipo < tipo,
+                    and_(eventos.c.tipo == tipo, eventos.c.id < id_)
+                ))
+            ))
+
+    linhas = db.session.execute(
+        query.order_by(eventos.c.data.desc(), eventos.c.tipo.desc(), eventos.c.id.desc()).limit(limite + 1)
+    ).all()
+
+    proximo_cursor = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        ultima = linhas[-1]
+        proximo_cursor = _codificar_cursor(ultima.data, ultima.tipo, ultima.id)
+
+    return [{
+        'tipo': linha.tipo,
+        'id': linha.id,
+        'data': linha.data.strftime('%Y-%m-%d %H:%M') if linha.data else None,
+        'titulo': linha.titulo,
+        'resumo': linha.resumo,
+        'prontuario_id': linha.prontuario_id
+    } for linha in linhas], proximo_cursor
+
+
+# ========== ÍNDICE DE PRONTUÁRIOS ANTERIORES ==========
+
+# Cache por processo: {paciente_id: (marca, índice)}, com os pacientes usados
+# há mais tempo descartados primeiro. Os prontuários só recebem inclusões
+# (novos atendimentos e mesclagens de pacientes), então a marca (quantidade,
+# maior id) do paciente, lida pelo índice ix_prontuarios_paciente_data, muda a
+# cada gravação feita em qualquer worker. Os commits deste processo também
+# descartam a entrada do paciente.
+_cache_indice_prontuarios = OrderedDict()
+MAXIMO_PACIENTES_EM_CACHE = 1000
+
+
+def invalidar_indice_prontuarios(*paciente_ids):
+    """Descarta o índice em cache dos pacientes informados (ou de todos)"""
+    if not paciente_ids:
+        _cache_indice_prontuarios.clear()
+    for paciente_id in paciente_ids:
+        _cache_indice_prontuarios.pop(paciente_id, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _marcar_prontuarios_alterados(session, contexto):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Prontuario):
+            session.info.setdefault('prontuarios_alterados', set()).add(obj.paciente_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_indice_apos_commit(session):
+    paciente_ids = session.info.pop('prontuarios_alterados', None)
+    if paciente_ids:
+        invalidar_indice_prontuarios(*paciente_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_prontuarios_alterados(session):
+    session.info.pop('prontuarios_alterados', None)
+
+
+def indice_prontuarios(paciente_id: int, limite: int = LIMITE_INDICE_PRONTUARIOS) -> dict:
+    """
+    Índice leve dos prontuários do paciente, do mais recente para o mais
+    antigo: id, data, especialidade, profissional e um trecho do diagnóstico.
+    Os textos completos ficam para detalhe_prontuario, pedido um a um (a tela
+    do prontuário carrega cada atendimento ao ser aberto).
+    """
+    marca = tuple(db.session.query(func.count(Prontuario.id), func.max(Prontuario.id))
+                  .filter(Prontuario.paciente_id == paciente_id).one())
+    em_cache = _cache_indice_prontuarios.get(paciente_id)
+    if em_cache and em_cache[0] == marca:
+        _cache_indice_prontuarios.move_to_end(paciente_id)
+        indice = em_cache[1]
+    else:
+        linhas = db.session.query(
+            Prontuario.id, Prontuario.data_atendimento, Prontuario.especialidade, Prontuario.profissional_nome,
+            func.substr(Prontuario.diagnostico, 1, TAMANHO_TRECHO_DIAGNOSTICO)
+        ).filter(Prontuario.paciente_id == paciente_id)\
+         .order_by(Prontuario.data_atendimento.desc(), Prontuario.id.desc())\
+         .limit(LIMITE_MAXIMO_INDICE_PRONTUARIOS + 1).all()
+
+        indice = {
+            'prontuarios': [{
+                'id': id_,
+                'data_atendimento': data.strftime('%d/%m/%Y') if data else '',
+                'data_hora': data.strftime('%d/%m/%Y às %H:%M') if data else '',
+                'especialidade': especialidade or '',
+                'profissional_nome': profissional or '',
+                'diagnostico': trecho or ''
+            } for id_, data, especialidade, profissional, trecho in linhas[:LIMITE_MAXIMO_INDICE_PRONTUARIOS]],
+            'ha_mais': len(linhas) > LIMITE_MAXIMO_INDICE_PRONTUARIOS
+        }
+        _cache_indice_prontuarios[paciente_id] = (marca, indice)
+        _cache_indice_prontuarios.move_to_end(paciente_id)
+        while len(_cache_indice_prontuarios) > MAXIMO_PACIENTES_EM_CACHE:
+            _cache_indice_prontuarios.popitem(last=False)
+
+    prontuarios = indice['prontuarios']
+    return {
+        'prontuarios': prontuarios[:limite],
+        'ha_mais': indice['ha_mais'] or len(prontuarios) > limite,
+        'total': marca[0]
+    }
+
+
+def detalhe_prontuario(prontuario: Prontuario) -> dict:
+    """Campos completos de um prontuário, para copiar nos documentos"""
+    return {
+        'id': prontuario.id,
+        'paciente_id': prontuario.paciente_id,
+        'data_atendimento': prontuario.data_atendimento.strftime('%d/%m/%Y') if prontuario.data_atendimento else '',
+        'especialidade': prontuario.especialidade or '',
+        'queixa_principal': prontuario.queixa_principal or '',
+        'historia_doenca': prontuario.historia_doenca or '',
+        'exame_fisico': prontuario.exame_fisico or '',
+        'diagnostico': prontuario.diagnostico or '',
+        'prescricao': prontuario.prescricao or '',
+        'observacoes': prontuario.observacoes or ''
+    }
+
+
+# ========== BUSCA TEXTUAL ==========
+
+RESULTADOS_POR_PAGINA = 20
+MAXIMO_RESULTADOS_POR_PAGINA = 100
+MAXIMO_TERMOS_BUSCA = 8
+
+_BUSCA_SQLITE = """
+    SELECT 'prontuario' AS tipo, p.id AS id, p.paciente_id AS paciente_id, pa.nome AS paciente_nome,
+           p.data_atendimento AS data, snippet(busca_prontuarios, -1, '', '', '…', 16) AS trecho,
+           -bm25(busca_prontuarios) AS relevancia
+      FROM busca_prontuarios
+      JOIN prontuarios p ON p.id = busca_prontuarios.rowid
+      JOIN pacientes pa ON pa.id = p.paciente_id
+     WHERE busca_prontuarios MATCH :consulta
+    UNION ALL
+    SELECT 'receituario', r.id, r.paciente_id, pa.nome,
+           r.data_emissao, snippet(busca_receituarios, -1, '', '', '…', 16),
+           -bm25(busca_receituarios)
+      FROM busca_receituarios
+      JOIN receituarios r ON r.id = busca_receituarios.rowid
+      JOIN pacientes pa ON pa.id = r.paciente_id
+     WHERE busca_receituarios MATCH :consulta
+    ORDER BY relevancia DESC, data DESC, id DESC
+    LIMIT :limite OFFSET :inicio
+"""
+
+
+def _texto_busca_postgres(tabela: str, apelido: str) -> str:
+    return " || ' ' || ".join(f"coalesce({apelido}.{campo}, '')" for campo in CAMPOS_BUSCA_TEXTUAL[tabela])
+
+
+def _busca_postgres() -> str:
+    # O trecho (ts_headline, custoso) só é calculado para as linhas da página
+    return f"""
+        SELECT r.tipo, r.id, r.paciente_id, r.paciente_nome, r.data, r.relevancia,
+               ts_headline('{CONFIGURACAO_BUSCA_POSTGRES}', r.texto, to_tsquery('{CONFIGURACAO_BUSCA_POSTGRES}', :consulta),
+                           'StartSel="", StopSel="", MaxWords=25, MinWords=10') AS trecho
+          FROM (
+            SELECT 'prontuario' AS tipo, p.id AS id, p.paciente_id AS paciente_id, pa.nome AS paciente_nome,
+                   p.data_atendimento AS data, {_texto_busca_postgres('prontuarios', 'p')} AS texto,
+                   ts_rank({documento_busca_postgres('prontuarios', 'p')}, q.consulta) AS relevancia
+              FROM prontuarios p
+              JOIN pacientes pa ON pa.id = p.paciente_id,
+                   to_tsquery('{CONFIGURACAO_BUSCA_POSTGRES}', :consulta) AS q(consulta)
+             WHERE {documento_busca_postgres('prontuarios', 'p')} @@ q.consulta
+            UNION ALL
+            SELECT 'receituario', rc.id, rc.paciente_id, pa.nome,
+                   rc.data_emissao, {_texto_busca_postgres('receituarios', 'rc')},
+                   ts_rank({documento_busca_postgres('receituarios', 'rc')}, q.consulta)
+              FROM receituarios rc
+              JOIN pacientes pa ON pa.id = rc.paciente_id,
+                   to_tsquery('{CONFIGURACAO_BUSCA_POSTGRES}', :consulta) AS q(consulta)
+             WHERE {documento_busca_postgres('receituarios', 'rc')} @@ q.consulta
+            ORDER BY relevancia DESC, data DESC, id DESC
+            LIMIT :limite OFFSET :inicio
+          ) r
+         ORDER BY r.relevancia DESC, r.data DESC, r.id DESC
+    """
+
+
+def termos_da_busca(busca: str) -> list:
+    """Palavras da busca, sem operadores: nada do texto digitado chega cru ao MATCH/tsquery"""
+    return re.findall(r'\w+', (busca or '').lower())[:MAXIMO_TERMOS_BUSCA]
+
+
+def buscar_registros_clinicos(busca: str, pagina: int = 1, por_pagina: int = RESULTADOS_POR_PAGINA) -> dict:
+    """
+    Busca textual em prontuários (queixa, diagnóstico, prescrição e história)
+    e receituários (medicamentos), ordenada por relevância. Todos os termos
+    precisam aparecer; cada termo casa também como prefixo ("amox" encontra
+    "amoxicilina").
+    """
+    termos = termos_da_busca(busca)
+    if not termos:
+        raise ValueError('Informe ao menos uma palavra para a busca')
+
+    dialeto = db.engine.dialect.name
+    if dialeto == 'sqlite':
+        sql = _BUSCA_SQLITE
+        consulta = ' '.join(f'"{termo}"*' for termo in termos)
+    elif dialeto == 'postgresql':
+        sql = _busca_postgres()
+        consulta = ' & '.join(f'{termo}:*' for termo in termos)
+    else:
+        raise ValueError(f'Busca textual não disponível para o banco {dialeto}')
+
+    linhas = db.session.execute(text(sql), {
+        'consulta': consulta,
+        'limite': por_pagina + 1,
+        'inicio': (pagina - 1) * por_pagina
+    }).mappings().all()
+
+    resultados = []
+    for linha in linhas[:por_pagina]:
+        data = linha['data']
+        if isinstance(data, str):
+            data = datetime.fromisoformat(data)
+        resultados.append({
+            'tipo': linha['tipo'],
+            'id': linha['id'],
+            'paciente_id': linha['paciente_id'],
+            'paciente_nome': linha['paciente_nome'],
+            'data': data.strftime('%d/%m/%Y') if data else '',
+            'trecho': linha['trecho'] or '',
+            'relevancia': float(linha['relevancia'] or 0)
+        })
+
+    return {
+        'resultados': resultados,
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'ha_mais': len(linhas) > por_pagina
+    }
@@ -0,0 +1,522 @@
+"""
+Rotinas de apoio ao Módulo 4 - Relatórios e Indicadores
+Mantém a tabela desnormalizada de receitas (FatoReceita) e as consultas
+agregadas usadas pelos relatórios de faturamento
+"""
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import event, inspect, select, insert, update, delete, func, case
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from models.models import (db, ContaReceber, Agendamento, Profissional, FatoReceita, ResumoSemanalServico,
+                           TransicaoStatusAgendamento)
+
+
+def _dados_fato(connection, conta) -> dict:
+    """Monta a linha de FatoReceita correspondente a uma conta a receber"""
+    profissional_id = especialidade = servico = None
+
+    if conta.agendamento_id:
+        linha = connection.execute(
+            select(Agendamento.profissional_id, Agendamento.servico, Profissional.especialidade)
+            .select_from(Agendamento)
+            .outerjoin(Profissional, Profissional.id == Agendamento.profissional_id)
+            .where(Agendamento.id == conta.agendamento_id)
+        ).first()
+        if linha:
+            profissional_id, servico, especialidade = linha
+
+    criacao = conta.data_criacao or datetime.now()
+
+    return {
+        'paciente_id': conta.paciente_id,
+        'agendamento_id': conta.agendamento_id,
+        'profissional_id': profissional_id,
+        'especialidade': especialidade,
+        'servico': servico,
+        'dia': criacao.date() if isinstance(criacao, datetime) else criacao,
+        'valor': conta.valor
+    }
+
+
+@event.listens_for(ContaReceber, 'after_insert')
+def _inserir_fato(mapper, connection, conta):
+    connection.execute(insert(FatoReceita).values(conta_receber_id=conta.id, **_dados_fato(connection, conta)))
+
+
+@event.listens_for(ContaReceber, 'after_update')
+def _atualizar_fato(mapper, connection, conta):
+    dados = _dados_fato(connection, conta)
+    resultado = connection.execute(
+        update(FatoReceita).where(FatoReceita.conta_receber_id == conta.id).values(**dados)
+    )
+    if resultado.rowcount == 0:
+        connection.execute(insert(FatoReceita).values(conta_receber_id=conta.id, **dados))
+
+
+@event.listens_for(ContaReceber, 'before_delete')
+def _remover_fato(mapper, connection, conta):
+    connection.execute(delete(FatoReceita).where(FatoReceita.conta_receber_id == conta.id))
+
+
+@event.listens_for(Agendamento, 'after_update')
+def _atualizar_fatos_do_agendamento(mapper, connection, agendamento):
+    # Profissional ou serviço trocados depois da conta: os fatos acompanham
+    estado = inspect(agendamento)
+    if not (estado.attrs.profissional_id.history.has_changes() or estado.attrs.servico.history.has_changes()):
+        return
+
+    especialidade = connection.execute(
+        select(Profissional.especialidade).where(Profissional.id == agendamento.profissional_id)
+    ).scalar()
+    connection.execute(
+        update(FatoReceita).where(FatoReceita.agendamento_id == agendamento.id).values(
+            profissional_id=agendamento.profissional_id,
+            servico=agendamento.servico,
+            especialidade=especialidade
+        )
+    )
+
+
+@event.listens_for(Profissional, 'after_update')
+def _atualizar_fatos_do_profissional(mapper, connection, profissional):
+    if inspect(profissional).attrs.especialidade.history.has_changes():
+        connection.execute(
+            update(FatoReceita).where(FatoReceita.profissional_id == profissional.id)
+            .values(especialidade=profissional.especialidade)
+        )
+
+
+def reconstruir_fato_receitas() -> int:
+    """
+    Recria toda a tabela FatoReceita a partir de ContaReceber com um único
+    INSERT ... SELECT. Usado na carga inicial e para corrigir divergências
+    (ex.: alterações feitas por UPDATE em lote, fora dos eventos do ORM).
+    """
+    origem = select(
+        ContaReceber.id,
+        ContaReceber.paciente_id,
+        ContaReceber.agendamento_id,
+        Agendamento.profissional_id,
+        Profissional.especialidade,
+        Agendamento.servico,
+        func.coalesce(func.date(ContaReceber.data_criacao), func.current_date()),
+        ContaReceber.valor
+    ).select_from(ContaReceber).outerjoin(
+        Agendamento, Agendamento.id == ContaReceber.agendamento_id
+    ).outerjoin(
+        Profissional, Profissional.id == Agendamento.profissional_id
+    )
+
+    try:
+        db.session.execute(delete(FatoReceita))
+        resultado = db.session.execute(
+            insert(FatoReceita).from_select(
+                ['conta_receber_id', 'paciente_id', 'agendamento_id', 'profissional_id',
+                 'especialidade', 'servico', 'dia', 'valor'],
+                origem
+            )
+        )
+        db.session.commit()
+        return resultado.rowcount
+    except Exception as e:
+        print(f"Erro ao reconstruir fato de receitas: {e}")
+        db.session.rollback()
+        raise
+
+
+def garantir_fato_receitas():
+    """Faz a carga inicial da FatoReceita quando ela está vazia e já existem contas"""
+    fato_vazio = db.session.query(FatoReceita.id).first() is None
+    if fato_vazio and db.session.query(ContaReceber.id).first() is not None:
+        total = reconstruir_fato_receitas()
+        print(f"✅ Fato de receitas carregado: {total} conta(s)")
+
+
+def ler_periodo(args, padrao_inicio: date, padrao_fim: date):
+    """Lê data_inicio/data_fim (YYYY-MM-DD) da query string, com valores padrão"""
+    def ler(nome, padrao):
+        try:
+            return datetime.strptime(args.get(nome, ''), '%Y-%m-%d').date()
+        except ValueError:
+            return padrao
+
+    return ler('data_inicio', padrao_inicio), ler('data_fim', padrao_fim)
+
+
+def faturamento_por_profissional(data_inicio: date, data_fim: date):
+    """(nome, especialidade, total_atendimentos, faturamento_total, ticket_medio) por profissional"""
+    total = func.count(FatoReceita.id)
+    soma = func.sum(FatoReceita.valor)
+
+    return db.session.query(
+        func.coalesce(Profissional.nome, 'Sem agendamento vinculado').label('nome'),
+        func.coalesce(FatoReceita.especialidade, 'Não informada').label('especialidade'),
+        total.label('total_atendimentos'),
+        soma.label('faturamento_total'),
+        (soma / total).label('ticket_medio')
+    ).outerjoin(
+        Profissional, Profissional.id == FatoReceita.profissional_id
+    ).filter(
+        FatoReceita.dia.between(data_inicio, data_fim)
+    ).group_by(
+        FatoReceita.profissional_id, Profissional.nome, FatoReceita.especialidade
+    ).all()
+
+
+def faturamento_por_especialidade(data_inicio: date, data_fim: date = None):
+    """(especialidade, total_atendimentos, faturamento_total) por especialidade"""
+    query = db.session.query(
+        func.coalesce(FatoReceita.especialidade, 'Não informada').label('especialidade'),
+        func.count(FatoReceita.id).label('total_atendimentos'),
+        func.sum(FatoReceita.valor).label('faturamento_total')
+    ).filter(FatoReceita.dia >= data_inicio)
+
+    if data_fim:
+        query = query.filter(FatoReceita.dia <= data_fim)
+
+    return query.group_by(FatoReceita.especialidade).all()
+
+
+# ========== ANÁLISE POR SERVIÇO ==========
+
+def inicio_semana(dia: date) -> date:
+    """Segunda-feira da semana do dia informado"""
+    return dia - timedelta(days=dia.weekday())
+
+
+def _como_data(valor):
+    # func.date() devolve texto no SQLite e date no PostgreSQL
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def horarios_por_semana() -> int:
+    """Capacidade semanal de um serviço na grade de agendamento"""
+    abertura = datetime.strptime(Config.HORARIO_ABERTURA, '%H:%M')
+    fechamento = datetime.strptime(Config.HORARIO_FECHAMENTO, '%H:%M')
+    por_dia = int((fechamento - abertura).total_seconds() // 60 // Config.INTERVALO_AGENDA_MINUTOS)
+    return por_dia * len(Config.DIAS_FUNCIONAMENTO)
+
+
+def _calcular_semanas_servicos(primeira_semana: date, ultima_semana: date) -> dict:
+    """
+    Consolida agendamentos e receita por (semana, serviço) entre duas semanas.
+    Duas consultas agrupadas por dia; a soma por semana é feita em Python.
+    """
+    inicio = datetime.combine(primeira_semana, datetime.min.time())
+    fim = datetime.combine(ultima_semana + timedelta(days=7), datetime.min.time())
+    capacidade = horarios_por_semana()
+
+    resumo = {}
+
+    def linha(semana, servico):
+        chave = (semana, servico)
+        if chave not in resumo:
+            resumo[chave] = {'agendamentos': 0, 'finalizados': 0, 'faltas': 0,
+                             'horarios_disponiveis': capacidade, 'receita': Decimal('0')}
+        return resumo[chave]
+
+    semana = primeira_semana
+    while semana <= ultima_semana:
+        for servico in Config.SERVICOS_DISPONIVEIS:
+            linha(semana, servico)
+        semana += timedelta(days=7)
+
+    agendamentos = db.session.query(
+        func.date(Agendamento.data_agendamento), Agendamento.servico, Agendamento.status,
+        func.count(Agendamento.id)
+    ).filter(
+        Agendamento.data_agendamento >= inicio,
+        Agendamento.data_agendamento < fim
+    ).group_by(
+        func.date(Agendamento.data_agendamento), Agendamento.servico, Agendamento.status
+    ).all()
+
+    for dia, servico, status, total in agendamentos:
+        dados = linha(inicio_semana(_como_data(dia)), servico)
+        dados['agendamentos'] += total
+        if status == 'finalizado':
+            dados['finalizados'] += total
+        elif status == 'faltou':
+            dados['faltas'] += total
+
+    receitas = db.session.query(
+        FatoReceita.dia, FatoReceita.servico, func.sum(FatoReceita.valor)
+    ).filter(
+        FatoReceita.dia >= primeira_semana,
+        FatoReceita.dia < ultima_semana + timedelta(days=7),
+        FatoReceita.servico.isnot(None)
+    ).group_by(FatoReceita.dia, FatoReceita.servico).all()
+
+    for dia, servico, total in receitas:
+        linha(inicio_semana(dia), servico)['receita'] += Decimal(total or 0)
+
+    return resumo
+
+
+def analise_servicos(data_inicio: date, data_fim: date, hoje: date = None) -> list:
+    """
+    Agendamentos, finalizados, faltas, ocupação da grade e receita por serviço
+    e por semana. Semanas encerradas são lidas de ResumoSemanalServico (e
+    gravadas lá na primeira vez em que são calculadas); a semana corrente é
+    sempre calculada na hora.
+    """
+    hoje = hoje or date.today()
+    primeira = inicio_semana(data_inicio)
+    ultima = inicio_semana(data_fim)
+    semana_atual = inicio_semana(hoje)
+
+    resumo = {}
+    for registro in ResumoSemanalServico.query.filter(
+        ResumoSemanalServico.semana >= primeira,
+        ResumoSemanalServico.semana <= ultima,
+        ResumoSemanalServico.semana < semana_atual
+    ).all():
+        resumo[(registro.semana, registro.servico)] = {
+            'agendamentos': registro.agendamentos,
+            'finalizados': registro.finalizados,
+            'faltas': registro.faltas,
+            'horarios_disponiveis': registro.horarios_disponiveis,
+            'receita': Decimal(registro.receita or 0)
+        }
+
+    semanas_em_cache = {semana for semana, _ in resumo}
+    semanas = []
+    semana = primeira
+    while semana <= ultima:
+        semanas.append(semana)
+        semana += timedelta(days=7)
+
+    pendentes = [s for s in semanas if s not in semanas_em_cache]
+    if pendentes:
+        calculado = _calcular_semanas_servicos(min(pendentes), max(pendentes))
+        novos = []
+        for (semana, servico), dados in calculado.items():
+            if semana not in pendentes:
+                continue
+            resumo[(semana, servico)] = dados
+            if semana < semana_atual:
+                novos.append(ResumoSemanalServico(semana=semana, servico=servico, **dados))
+
+        if novos:
+            try:
+                db.session.add_all(novos)
+                db.session.commit()
+            except IntegrityError:
+                # Outro processo gravou a mesma semana ao mesmo tempo
+                db.session.rollback()
+
+    resultado = []
+    for (semana, servico), dados in sorted(resumo.items()):
+        disponiveis = dados['horarios_disponiveis'] or 0
+        resultado.append({
+            'semana': semana.strftime('%Y-%m-%d'),
+            'servico': servico,
+            'agendamentos': dados['agendamentos'],
+            'finalizados': dados['finalizados'],
+            'faltas': dados['faltas'],
+            'horarios_disponiveis': disponiveis,
+            'ocupacao': round(dados['agendamentos'] / disponiveis * 100, 1) if disponiveis else 0,
+            'receita': float(dados['receita']),
+            'semana_encerrada': semana < semana_atual
+        })
+    return resultado
+
+
+def totalizar_por_servico(semanas: list) -> list:
+    """Soma o resultado de analise_servicos por serviço no período inteiro"""
+    totais = {}
+    for item in semanas:
+        total = totais.setdefault(item['servico'], {
+            'servico': item['servico'], 'agendamentos': 0, 'finalizados': 0,
+            'faltas': 0, 'receita': 0.0, 'horarios_disponiveis': 0
+        })
+        total['agendamentos'] += item['agendamentos']
+        total['finalizados'] += item['finalizados']
+        total['faltas'] += item['faltas']
+        total['receita'] += item['receita']
+        # Capacidade gravada em cada semana (a grade pode ter mudado desde então)
+        total['horarios_disponiveis'] += item['horarios_disponiveis']
+
+    for total in totais.values():
+        disponiveis = total.pop('horarios_disponiveis')
+        total['ocupacao'] = round(total['agendamentos'] / disponiveis * 100, 1) if disponiveis else 0
+
+    return sorted(totais.values(), key=lambda t: t['receita'], reverse=True)
+
+
+# ========== FALTAS E PONTUALIDADE ==========
+
+DIAS_SEMANA = ['Domingo', 'Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado']
+
+
+def segundos_entre(inicio, fim):
+    """Expressão SQL com a diferença em segundos entre dois DateTime"""
+    if db.engine.dialect.name == 'sqlite':
+        return (func.julianday(fim) - func.julianday(inicio)) * 86400
+    return func.extract('epoch', fim - inicio)
+
+
+def _taxas(grupos: dict) -> list:
+    resultado = []
+    for chave, (total, faltas) in sorted(grupos.items()):
+        resultado.append({
+            'chave': chave,
+            'agendamentos': total,
+            'faltas': faltas,
+            'taxa_falta': round(faltas / total * 100, 1) if total else 0
+        })
+    return resultado
+
+
+def analise_faltas(data_inicio: date, data_fim: date, agora: datetime = None) -> dict:
+    """
+    Taxa de faltas por dia da semana, por horário e por serviço, e espera média
+    entre o check-in e o início do atendimento. Usa duas consultas agrupadas:
+    uma sobre os agendamentos já passados e outra sobre as transições de status.
+    """
+    agora = agora or datetime.now()
+    inicio = datetime.combine(data_inicio, datetime.min.time())
+    fim = min(datetime.combine(data_fim + timedelta(days=1), datetime.min.time()), agora)
+
+    dia_semana = func.extract('dow', Agendamento.data_agendamento)
+    hora = func.extract('hour', Agendamento.data_agendamento)
+    faltas = func.sum(case((Agendamento.status == 'faltou', 1), else_=0))
+
+    linhas = db.session.query(
+        dia_semana, hora, Agendamento.servico, func.count(Agendamento.id), faltas
+    ).filter(
+        Agendamento.data_agendamento >= inicio,
+        Agendamento.data_agendamento < fim
+    ).group_by(dia_semana, hora, Agendamento.servico).all()
+
+    por_dia, por_hora, por_servico = {}, {}, {}
+    for dia, h, servico, total, total_faltas in linhas:
+        for grupos, chave in ((por_dia, int(dia)), (por_hora, int(h)), (por_servico, servico)):
+            acumulado = grupos.get(chave, (0, 0))
+            grupos[chave] = (acumulado[0] + total, acumulado[1] + (total_faltas or 0))
+
+    # Primeiro início de atendimento de cada agendamento com check-in
+    inicio_atendimento = db.session.query(
+        TransicaoStatusAgendamento.agendamento_id.label('agendamento_id'),
+        func.min(TransicaoStatusAgendamento.data_transicao).label('data_inicio')
+    ).filter(
+        TransicaoStatusAgendamento.status_novo == 'em_atendimento'
+    ).group_by(TransicaoStatusAgendamento.agendamento_id).subquery()
+
+    espera = segundos_entre(Agendamento.data_checkin, inicio_atendimento.c.data_inicio)
+    esperas = db.session.query(
+        Agendamento.servico, func.count(Agendamento.id), func.avg(espera)
+    ).join(
+        inicio_atendimento, inicio_atendimento.c.agendamento_id == Agendamento.id
+    ).filter(
+        Agendamento.data_checkin.isnot(None),
+        Agendamento.data_agendamento >= inicio,
+        Agendamento.data_agendamento < fim
+    ).group_by(Agendamento.servico).all()
+
+    total_geral = sum(t for t, _ in por_servico.values())
+    faltas_geral = sum(f for _, f in por_servico.values())
+    atendidos = sum(qtd for _, qtd, _ in esperas)
+    espera_total = sum(float(media or 0) * qtd for _, qtd, media in esperas)
+
+    dias = _taxas(por_dia)
+    for item in dias:
+        item['chave'] = DIAS_SEMANA[item['chave']]
+    horas = _taxas(por_hora)
+    for item in horas:
+        item['chave'] = f"{item['chave']:02d}:00"
+
+    return {
+        'agendamentos': total_geral,
+        'faltas': faltas_geral,
+        'taxa_falta': round(faltas_geral / total_geral * 100, 1) if total_geral else 0,
+        'espera_media_minutos': round(espera_total / atendidos / 60, 1) if atendidos else None,
+        'por_dia_semana': dias,
+        'por_horario': horas,
+        'por_servico': sorted(_taxas(por_servico), key=lambda i: i['taxa_falta'], reverse=True),
+        'espera_por_servico': [
+            {'servico': servico, 'atendimentos': qtd, 'espera_media_minutos': round(float(media or 0) / 60, 1)}
+            for servico, qtd, media in sorted(esperas, key=lambda e: e[2] or 0, reverse=True)
+        ]
+    }
+
+
+# ========== TEMPOS DE ATENDIMENTO ==========
+
+def _marcos_por_agendamento(inicio: datetime, fim: datetime):
+    """
+    Subconsulta com o primeiro check-in, início e fim de atendimento de cada
+    agendamento no período, lida pelo índice (status_novo, data_transicao)
+    """
+    t = TransicaoStatusAgendamento
+
+    def primeiro(status):
+        return func.min(case((t.status_novo == status, t.data_transicao)))
+
+    return db.session.query(
+        t.agendamento_id.label('agendamento_id'),
+        primeiro('em_espera').label('checkin'),
+        primeiro('em_atendimento').label('inicio'),
+        primeiro('finalizado').label('fim')
+    ).filter(
+        t.status_novo.in_(('em_espera', 'em_atendimento', 'finalizado')),
+        t.data_transicao >= inicio,
+        t.data_transicao < fim
+    ).group_by(t.agendamento_id).subquery()
+
+
+def _minutos(segundos):
+    return round(float(segundos) / 60, 1) if segundos is not None else None
+
+
+def _medianas_por_grupo(grupo, valor) -> dict:
+    """
+    Mediana de uma expressão por grupo sem percentile_cont: numera os valores
+    de cada grupo e tira a média da(s) posição(ões) central(is)
+    """
+    valores = db.session.query(grupo.label('grupo'), valor.label('valor')).filter(valor.isnot(None)).subquery()
+    ordenados = db.session.query(
+        valores.c.grupo, valores.c.valor,
+        func.row_number().over(partition_by=valores.c.grupo, order_by=valores.c.valor).label('posicao'),
+        func.count().over(partition_by=valores.c.grupo).label('total')
+    ).subquery()
+    return dict(db.session.query(ordenados.c.grupo, func.avg(ordenados.c.valor)).filter(
+        ordenados.c.posicao.between((ordenados.c.total + 1) // 2, (ordenados.c.total + 2) // 2)
+    ).group_by(ordenados.c.grupo).all())
+
+
+def tempos_atendimento(data_inicio: date, data_fim: date) -> list:
+    """
+    Por dia: atendimentos finalizados, mediana da espera (check-in até início
+    do atendimento) e mediana da duração da consulta, em minutos.
+    A mediana é calculada no banco: percentile_cont no PostgreSQL e, no
+    SQLite, pelas posições centrais de cada dia (funções de janela).
+    """
+    inicio = datetime.combine(data_inicio, datetime.min.time())
+    fim = datetime.combine(data_fim + timedelta(days=1), datetime.min.time())
+
+    marcos = _marcos_por_agendamento(inicio, fim)
+    dia = func.date(func.coalesce(marcos.c.fim, marcos.c.inicio, marcos.c.checkin))
+    espera = segundos_entre(marcos.c.checkin, marcos.c.inicio)
+    duracao = segundos_entre(marcos.c.inicio, marcos.c.fim)
+
+    if db.engine.dialect.name == 'postgresql':
+        linhas = db.session.query(
+            dia, func.count(marcos.c.fim),
+            func.percentile_cont(0.5).within_group(espera),
+            func.percentile_cont(0.5).within_group(duracao)
+        ).group_by(dia).order_by(dia).all()
+    else:
+        finalizados = db.session.query(dia, func.count(marcos.c.fim)).group_by(dia).all()
+        esperas = _medianas_por_grupo(dia, espera)
+        duracoes = _medianas_por_grupo(dia, duracao)
+        linhas = [(d, total, esperas.get(d), duracoes.get(d)) for d, total in sorted(finalizados)]
+
+    return [{
+        'dia': _como_data(d).strftime('%Y-%m-%d'),
+        'finalizados': finalizados,
+        'espera_mediana_minutos': _minutos(mediana_espera),
+        'consulta_mediana_minutos': _minutos(mediana_duracao)
+    } for d, finalizados, mediana_espera, mediana_duracao in linhas]